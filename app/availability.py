@@ -0,0 +1,193 @@
+"""
+Per-commerce appointment availability.
+
+Each (comercio, calendar day) keeps an int bitmap with one bit per slot
+of TURNO_SLOT_MINUTES, built once per commerce from the turnos of today
+and later. Conflict checks, reservations and "next free slot" suggestions
+are bit operations: O(1) per day regardless of how many turnos exist.
+
+Days are dates: the free-text fecha ("el lunes", "mañana", "12/03") is
+resolved by schedule.resolve_fecha() before it gets here. A fecha that
+can't be resolved (dia=None), or an hour that can't be parsed ("a la
+tarde"), has no slot and never conflicts.
+
+Defensive behavior:
+- At most AVAILABILITY_MAX_COMERCIOS commerces are cached (LRU)
+- When the day changes every cached bitmap is dropped, so past days
+  don't accumulate; they are rebuilt from today's turnos on next use
+"""
+
+import re
+import threading
+import unicodedata
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from app.cache import LRUCache
+from app.config import TURNO_SLOT_MINUTES, AVAILABILITY_MAX_COMERCIOS, BUSINESS_TIMEZONE
+from app.models import SessionLocal, Turno
+
+SLOTS_PER_DAY = (24 * 60) // TURNO_SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+# comercio_id -> {date: bitmap}, only days from _today on
+_days = LRUCache(max_entries=AVAILABILITY_MAX_COMERCIOS)
+_today = None
+_lock = threading.Lock()
+
+_HORA_RE = re.compile(r"^(\d{1,2})(?:\s*[:.h]\s*(\d{2}))?\s*(?:hs|h|hrs)?$")
+
+
+def business_today() -> date:
+    """Today in the businesses' timezone (what "hoy" and "mañana" refer to)."""
+    return datetime.now(ZoneInfo(BUSINESS_TIMEZONE)).date()
+
+
+def fecha_key(fecha: str) -> str:
+    """Normalize free text (days, horarios): lowercase, no accents, single spaces."""
+    nfkd = unicodedata.normalize('NFKD', fecha)
+    without_accents = ''.join(c for c in nfkd if not unicodedata.combining(c))
+    return ' '.join(without_accents.lower().split())
+
+
+def parse_hora(hora: str):
+    """
+    Parse a time of day into minutes since midnight.
+
+    Examples:
+        >>> parse_hora("15:00")
+        900
+        >>> parse_hora("9.30hs")
+        570
+        >>> parse_hora("a la tarde") is None
+        True
+    """
+    match = _HORA_RE.match(hora.strip().lower())
+    if not match:
+        return None
+    hours = int(match.group(1))
+    minutes = int(match.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_slot(slot: int) -> str:
+    minutes = slot * TURNO_SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _slot(hora: str):
+    minutes = parse_hora(hora)
+    return None if minutes is None else minutes // TURNO_SLOT_MINUTES
+
+
+def build_days(rows) -> dict:
+    """Bitmaps per date from (dia, hora) rows; rows without a dia are skipped."""
+    days = {}
+    for dia, hora in rows:
+        slot = _slot(hora or "")
+        if dia is not None and slot is not None:
+            days[dia] = days.get(dia, 0) | (1 << slot)
+    return days
+
+
+def load_turno_days(comercio_id: int, since: date) -> dict:
+    """Bitmaps of the turnos of a commerce on since or later (turnos without a dia are skipped)."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Turno.dia, Turno.hora)
+            .filter(Turno.comercio_id == comercio_id, Turno.dia >= since)
+            .all()
+        )
+    finally:
+        db.close()
+    return build_days(rows)
+
+
+def _comercio_days(comercio_id: int) -> dict:
+    """Bitmaps of a commerce, loaded from the turnos table on first use. Call with _lock held."""
+    global _today
+    today = business_today()
+    if today != _today:
+        # New day: drop past days of every commerce by rebuilding from the table
+        _days.clear()
+        _today = today
+
+    days = _days.get(comercio_id)
+    if days is None:
+        days = _days[comercio_id] = load_turno_days(comercio_id, today)
+    return days
+
+
+def is_taken(comercio_id: int, dia, hora: str) -> bool:
+    """True if the slot of hora on dia (a date) is already booked."""
+    slot = _slot(hora)
+    if dia is None or slot is None:
+        return False
+    with _lock:
+        return bool(_comercio_days(comercio_id).get(dia, 0) >> slot & 1)
+
+
+def reserve_slot(comercio_id: int, dia, hora: str) -> bool:
+    """
+    Atomically check and mark the slot of hora on dia (a date).
+
+    Returns:
+        False only if the slot was already taken (True without a check when
+        dia or hora couldn't be resolved)
+    """
+    slot = _slot(hora)
+    if dia is None or slot is None:
+        return True
+    with _lock:
+        days = _comercio_days(comercio_id)
+        bitmap = days.get(dia, 0)
+        if bitmap >> slot & 1:
+            return False
+        days[dia] = bitmap | (1 << slot)
+        return True
+
+
+def release_slot(comercio_id: int, dia, hora: str) -> None:
+    """Free a slot (e.g. when saving the turno failed after reserving it)."""
+    slot = _slot(hora)
+    if dia is None or slot is None:
+        return
+    with _lock:
+        days = _comercio_days(comercio_id)
+        days[dia] = days.get(dia, 0) & ~(1 << slot)
+
+
+def suggest_free_slots(comercio_id: int, dia, hora: str, limit: int = 3, allowed: int = FULL_DAY) -> list:
+    """
+    Next free slots on dia (a date) at or after hora, then the earliest ones before it.
+
+    Args:
+        allowed: Day bitmap of slots that may be offered (e.g. opening hours)
+
+    Returns:
+        Up to limit times formatted as "HH:MM"
+    """
+    slot = _slot(hora) or 0
+    taken = 0
+    if dia is not None:
+        with _lock:
+            taken = _comercio_days(comercio_id).get(dia, 0)
+    free = ~taken & allowed & FULL_DAY
+
+    suggestions = []
+    # Rotate so bit 0 is the requested slot: lowest set bits come first
+    rotated = ((free >> slot) | (free << (SLOTS_PER_DAY - slot))) & FULL_DAY
+    while rotated and len(suggestions) < limit:
+        lowest = rotated & -rotated
+        offset = lowest.bit_length() - 1
+        suggestions.append(format_slot((slot + offset) % SLOTS_PER_DAY))
+        rotated ^= lowest
+    return suggestions
+
+
+def clear() -> None:
+    """Drop every cached bitmap; they are rebuilt from the table on next use."""
+    with _lock:
+        _days.clear()
@@ -0,0 +1,128 @@
+"""
+Circuit breaker: stop calling a dependency that is known to be failing.
+
+States:
+- closed: calls go through
+- open: calls are refused without touching the dependency, for
+  reset_timeout seconds after the last failure
+- half-open: after that, one trial call at a time is let through (a real
+  call or a background probe); success closes the breaker, failure opens
+  it again
+
+Used around the WhatsApp token (graph_client.breaker): an expired or
+missing token opens it, probes close it once a valid token is loaded.
+
+Defensive behavior:
+- A trial that never reports back (timeout, crash) frees its slot after
+  reset_timeout, so half-open can't get stuck
+- on_close listeners run outside the lock; a failing listener is logged
+"""
+
+import threading
+import time
+from datetime import datetime
+from app.log import get_logger
+
+log = get_logger("breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Usage:
+        breaker = CircuitBreaker("whatsapp", reset_timeout=30)
+        if breaker.allow():
+            ...call...
+            breaker.record_success()      # or record_failure("reason")
+    """
+
+    def __init__(self, name: str, reset_timeout: float, clock=time.monotonic, open_reason: str = None):
+        """open_reason: start open (known broken at startup) instead of closed."""
+        self.name = name
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = OPEN if open_reason else CLOSED
+        self._opened_at = clock()
+        self._trial_at = None
+        self._listeners = []
+
+        self.reason = open_reason
+        # Wall-clock time the breaker last left closed (for the healthcheck)
+        self.open_since = datetime.now() if open_reason else None
+        self.trips = 0
+        self.refused = 0
+
+    def _current(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_at = None
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current(self._clock())
+
+    def allow(self) -> bool:
+        """True if a call may go out now (in half-open: only the trial call)."""
+        with self._lock:
+            now = self._clock()
+            state = self._current(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+                self._trial_at = now
+                return True
+            self.refused += 1
+            return False
+
+    def record_success(self) -> None:
+        """The dependency works: close (runs on_close listeners if it was not closed)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            self._state = CLOSED
+            self._trial_at = None
+            self.reason = None
+            self.open_since = None
+            listeners = list(self._listeners)
+        log.warning("%s: circuit closed", self.name)
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                log.exception("%s: on_close listener failed: %s", self.name, e)
+
+    def record_failure(self, reason: str) -> None:
+        """The dependency is failing: open (again) for reset_timeout."""
+        with self._lock:
+            was = self._state
+            self._state = OPEN
+            self._opened_at = self._clock()
+            self._trial_at = None
+            self.reason = reason
+            if was == CLOSED:
+                self.trips += 1
+                self.open_since = datetime.now()
+        if was == CLOSED:
+            log.critical("%s: circuit open: %s", self.name, reason)
+
+    def on_close(self, listener) -> None:
+        """Call listener() every time the breaker closes."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def stats(self) -> dict:
+        """State and counters for the healthcheck."""
+        state = self.state
+        return {
+            "state": state,
+            "reason": self.reason,
+            "open_since": self.open_since.strftime("%Y-%m-%d %H:%M:%S") if self.open_since else None,
+            "trips": self.trips,
+            "refused": self.refused,
+        }
@@ -0,0 +1,137 @@
+"""
+Bounded in-memory LRU cache with optional idle TTL.
+
+Used for hot conversations in app/state.py. Defensive programming:
+- Thread-safe (single lock, O(1) per operation)
+- Bounds are optional: 0 disables max_entries, max_bytes or ttl_seconds
+- Sizes are only measured when max_bytes is set
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value) -> int:
+    """Approximate size of a value as its serialized JSON length."""
+    return len(json.dumps(value, default=str, ensure_ascii=False))
+
+
+class LRUCache:
+    """
+    Dict-like LRU cache.
+
+    Entries are ordered by last access; the least recently used entry is
+    evicted first when max_entries or max_bytes is exceeded, and entries
+    idle for more than ttl_seconds are dropped on access.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (value, last_access, size)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - last_access > self.ttl_seconds
+
+    def _remove(self, key) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it as recently used."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, last_access, size = entry
+            if self._expired(last_access, now):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data[key] = (value, now, size)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value) -> None:
+        now = time.monotonic()
+        size = estimate_size(value) if self.max_bytes > 0 else 0
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, now, size)
+            self._bytes += size
+
+            # Drop idle entries from the LRU end, then enforce bounds
+            while self._data:
+                oldest_key, (_, last_access, _) = next(iter(self._data.items()))
+                if oldest_key == key:
+                    break
+                if self._expired(last_access, now):
+                    self._remove(oldest_key)
+                    self.expirations += 1
+                elif (
+                    (self.max_entries > 0 and len(self._data) > self.max_entries)
+                    or (self.max_bytes > 0 and self._bytes > self.max_bytes)
+                ):
+                    self._remove(oldest_key)
+                    self.evictions += 1
+                else:
+                    break
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[1], time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Counters for the healthcheck."""
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,233 @@
+"""
+Campaign runner: sends the pending MessageDrafts.
+
+The activation flow saves drafts to the send queue; a campaign
+streams the pending ones that have a customer_phone (asked for by the
+activation flow; older drafts without it are never sent) and sends them:
+
+- keyset pagination: pages of CAMPAIGN_BATCH_SIZE rows with id > last_id
+  (index on status, id), only id, phone and text are loaded, so memory is
+  flat whatever the number of drafts
+- CAMPAIGN_WORKERS threads send each page, paced to CAMPAIGN_RATE_PER_SECOND
+- the page's statuses (sent / failed) are written with one executemany,
+  in the same transaction that advances the checkpoint (last_id, counters)
+
+    python -m app.campaign run       # start or resume
+    python -m app.campaign pause     # the runner stops after its current page
+    python -m app.campaign status
+
+Pausing, Ctrl-C or a crash keeps the checkpoint: run resumes after the last
+written page. A crash mid-page sends that page again (at-least-once).
+
+Defensive behavior:
+- Transient errors are retried CAMPAIGN_MAX_ATTEMPTS times with the outbox
+  backoff; permanent ones mark the draft failed with the Graph error
+- The first CircuitOpen, or transient error that exhausted its retries,
+  stops the page: drafts not sent yet are skipped, the settled ones are
+  written, and the checkpoint only advances over the settled prefix, so
+  resuming retries the rest. The campaign pauses
+- Progress and throughput are logged after every page
+"""
+
+import argparse
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from app.config import (
+    CAMPAIGN_BATCH_SIZE,
+    CAMPAIGN_WORKERS,
+    CAMPAIGN_RATE_PER_SECOND,
+    CAMPAIGN_MAX_ATTEMPTS,
+)
+from app.graph_client import CircuitOpen, SendError
+from app.log import get_logger
+from app.models import init_db
+from app.outbox import backoff
+from app.persistence import (
+    load_pending_drafts,
+    count_pending_drafts,
+    get_campaign_checkpoint,
+    set_campaign_status,
+    save_campaign_batch,
+)
+from app.rate_limit import Pacer
+
+log = get_logger("campaign")
+
+DEFAULT_NAME = "drafts"
+
+# Set to stop the running campaign after its current page (SIGINT/SIGTERM)
+_stop = threading.Event()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _send_draft(send, pacer: Pacer, halt: threading.Event, draft: tuple) -> dict:
+    """
+    Send one draft with retries; its status row for the batch UPDATE.
+
+    The row's "settled" is False when the draft must stay pending: it was
+    skipped because the page was halted, or the token is unusable
+    (CircuitOpen) or transient errors exhausted the retries, which halts
+    the page.
+    """
+    draft_id, phone, text = draft
+    error = None
+    for attempt in range(1, CAMPAIGN_MAX_ATTEMPTS + 1):
+        if halt.is_set():
+            break
+        pacer.wait()
+        try:
+            send(phone, text)
+            return {"id": draft_id, "status": "sent", "sent_at": _now(), "last_error": None, "settled": True}
+        except CircuitOpen as e:
+            # Token unusable: retrying now can't work
+            error = e
+            break
+        except SendError as e:
+            error = e
+        except Exception as e:
+            log.exception("Send callback failed for draft #%s: %s", draft_id, e)
+            error = SendError(str(e), retryable=True)
+        if not error.retryable:
+            return {"id": draft_id, "status": "failed", "sent_at": None, "last_error": str(error), "settled": True}
+        if attempt < CAMPAIGN_MAX_ATTEMPTS:
+            time.sleep(backoff(attempt))
+    if error is not None:
+        halt.set()
+    return {"id": draft_id, "status": "pending", "sent_at": None, "last_error": error and str(error), "settled": False}
+
+
+def run(send, name: str = DEFAULT_NAME, batch_size: int = None, rate: float = None) -> dict:
+    """
+    Start or resume a campaign; returns when every pending draft was tried or it was paused.
+
+    Args:
+        send: send(to, text), raises SendError (app.main.deliver)
+        name: Checkpoint name
+        batch_size: Drafts per page (default CAMPAIGN_BATCH_SIZE)
+        rate: Sends per second (default CAMPAIGN_RATE_PER_SECOND, 0 = no cap)
+
+    Returns:
+        Summary: status (done/paused), sent and failed in this run, totals
+        from the checkpoint, elapsed seconds and sends/s
+    """
+    batch_size = batch_size or CAMPAIGN_BATCH_SIZE
+    pacer = Pacer(CAMPAIGN_RATE_PER_SECOND if rate is None else rate)
+    _stop.clear()
+
+    checkpoint = set_campaign_status(name, "running", _now())
+    if checkpoint is None:
+        raise RuntimeError(f"campaign {name}: checkpoint not writable")
+    last_id = checkpoint["last_id"]
+    total = count_pending_drafts(last_id)
+    log.info("Campaign %s: %d pending draft(s) after #%d", name, total, last_id)
+
+    started = time.monotonic()
+    sent = failed = 0
+    outcome = "done"
+    with ThreadPoolExecutor(max_workers=max(1, CAMPAIGN_WORKERS), thread_name_prefix=f"campaign-{name}") as pool:
+        while True:
+            current = get_campaign_checkpoint(name)
+            if _stop.is_set() or (current and current["status"] == "paused"):
+                outcome = "paused"
+                break
+
+            drafts = load_pending_drafts(last_id, batch_size)
+            if not drafts:
+                break
+
+            halt = threading.Event()
+            results = list(pool.map(lambda draft: _send_draft(send, pacer, halt, draft), drafts))
+            # Checkpoint up to the first unsettled draft; later ones already
+            # sent are written too (no longer pending, so not sent again)
+            prefix = next((i for i, r in enumerate(results) if not r["settled"]), len(results))
+            page_last_id = drafts[prefix - 1][0] if prefix else last_id
+            settled = [r for r in results if r.pop("settled")]
+
+            if settled and not save_campaign_batch(name, settled, page_last_id, _now()):
+                # Statuses not written: the page is sent again on resume
+                outcome = "paused"
+                break
+
+            last_id = page_last_id
+            page_sent = sum(1 for r in settled if r["status"] == "sent")
+            sent += page_sent
+            failed += len(settled) - page_sent
+            elapsed = time.monotonic() - started
+            log.info(
+                "Campaign %s: %d/%d drafts, %.1f msg/s", name, sent + failed, total, (sent + failed) / elapsed,
+                extra={"sent": sent, "failed": failed, "last_id": last_id},
+            )
+            if halt.is_set():
+                reason = next(r["last_error"] for r in results if r["status"] == "pending" and r["last_error"])
+                log.warning("Campaign %s: page halted (%s), pausing; resumes after #%d", name, reason, last_id)
+                outcome = "paused"
+                break
+
+    set_campaign_status(name, outcome, _now())
+    elapsed = time.monotonic() - started
+    checkpoint = get_campaign_checkpoint(name) or {}
+    summary = {
+        "name": name,
+        "status": outcome,
+        "sent": sent,
+        "failed": failed,
+        "pending": count_pending_drafts(),
+        "total_sent": checkpoint.get("sent", 0),
+        "total_failed": checkpoint.get("failed", 0),
+        "last_id": last_id,
+        "elapsed_seconds": round(elapsed, 3),
+        "per_second": round((sent + failed) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    log.info("Campaign %s %s", name, outcome, extra={k: v for k, v in summary.items() if k != "name"})
+    return summary
+
+
+def pause(name: str = DEFAULT_NAME) -> bool:
+    """Ask a running campaign (any process) to stop after its current page."""
+    return set_campaign_status(name, "paused", _now()) is not None
+
+
+def status(name: str = DEFAULT_NAME) -> dict:
+    """Checkpoint plus drafts still pending."""
+    checkpoint = get_campaign_checkpoint(name) or {"name": name, "status": "never run", "last_id": 0}
+    return {**checkpoint, "pending": count_pending_drafts()}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.campaign", description="Envío de los drafts pendientes")
+    parser.add_argument("command", choices=("run", "pause", "status"))
+    parser.add_argument("--name", default=DEFAULT_NAME, help="Nombre de la campaña (checkpoint)")
+    parser.add_argument("--rate", type=float, default=None, help="Mensajes por segundo")
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.command == "pause":
+        pause(args.name)
+        print(f"Campaña {args.name} pausada")
+    elif args.command == "status":
+        for key, value in status(args.name).items():
+            print(f"{key}: {value}")
+    else:
+        from app import delivery
+        from app.main import deliver, record_sent
+
+        def send(to, text):
+            record_sent(to, deliver(to, text))
+
+        # Ctrl-C / SIGTERM: finish the current page, keep the checkpoint
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: _stop.set())
+        summary = run(send, args.name, rate=args.rate)
+        delivery.flush()
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,116 @@
 import os
 from dotenv import load_dotenv
-import requests
-from datetime import datetime
 
 load_dotenv()
 
 DB_PATH = "data/nordia.db"
+# nordia.db runs in WAL mode. NORMAL: commits survive an app crash, but the
+# last ones can be lost on power loss / OS crash (the WAL is fsynced at
+# checkpoints). Applies to every table (state, turnos, drafts, outbox,
+# dedup); FULL fsyncs every commit
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
 APP_NAME = "Nordia WhatsApp IA"
 PORT = int(os.getenv("PORT", "8000"))
 
-# WhatsApp Cloud API
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "976165072250440")
-WHATSAPP_API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v22.0")
-
-# Token health status
-TOKEN_IS_VALID = False
-TOKEN_INVALID_SINCE = None  # Timestamp when token was detected as invalid
-
-def validate_whatsapp_token():
-    """
-    Healthcheck: Validates WhatsApp token by calling Graph API /me endpoint
-    Returns True if token is valid, False otherwise
-    """
-    global TOKEN_IS_VALID, TOKEN_INVALID_SINCE
+# Conversation state persistence
+# "json": snapshot + append-only log in data/, "sqlite": one row per phone in nordia.db
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").lower()
+# "per_write": persist on every mutation, "grouped": coalesce mutations and flush
+# once per STATE_FLUSH_INTERVAL_MS window or every STATE_FLUSH_MAX_PENDING phones
+STATE_DURABILITY = os.getenv("STATE_DURABILITY", "per_write").lower()
+STATE_FLUSH_INTERVAL_MS = int(os.getenv("STATE_FLUSH_INTERVAL_MS", "50"))
+STATE_FLUSH_MAX_PENDING = int(os.getenv("STATE_FLUSH_MAX_PENDING", "100"))
+# json backend: load only the snapshot index at startup and read
+# conversations on first access (bounded by the STATE_CACHE_* settings)
+STATE_LAZY_LOAD = os.getenv("STATE_LAZY_LOAD", "false").lower() == "true"
+# In-memory conversation cache (sqlite backend or lazy load); 0 disables a bound
+STATE_CACHE_MAX_ENTRIES = int(os.getenv("STATE_CACHE_MAX_ENTRIES", "10000"))
+STATE_CACHE_MAX_BYTES = int(os.getenv("STATE_CACHE_MAX_BYTES", "0"))
+STATE_CACHE_TTL_SECONDS = int(os.getenv("STATE_CACHE_TTL_SECONDS", "0"))
+# Serve unknown non-admin senders in "inicial" from a precomputed reply,
+# without touching conversation state
+STATELESS_INICIAL = os.getenv("STATELESS_INICIAL", "true").lower() == "true"
+# Timezone of the businesses, used for "¿están abiertos ahora?"
+BUSINESS_TIMEZONE = os.getenv("BUSINESS_TIMEZONE", "America/Argentina/Buenos_Aires")
+# Appointment slot length used for conflict detection and opening hours
+TURNO_SLOT_MINUTES = int(os.getenv("TURNO_SLOT_MINUTES", "30"))
+# Commerces whose slot bitmaps are kept in memory (least recently used evicted)
+AVAILABILITY_MAX_COMERCIOS = int(os.getenv("AVAILABILITY_MAX_COMERCIOS", "1000"))
+# Log records appended before the log is compacted into the snapshot
+STATE_COMPACT_THRESHOLD = int(os.getenv("STATE_COMPACT_THRESHOLD", "1000"))
 
-    if not WHATSAPP_TOKEN:
-        print("[CONFIG] ✗ WHATSAPP_TOKEN not set - Running in DEGRADED MODE (receive only)")
-        TOKEN_IS_VALID = False
-        TOKEN_INVALID_SINCE = datetime.now()
-        return False
+# Webhook processing
+# "queued": acknowledge right away and process in worker threads,
+# "inline": process and send before answering the webhook
+# Workers are shared by all senders; one sender's messages never run concurrently
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queued").lower()
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "10000"))
+# Seconds to wait for queued messages on shutdown
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", "10"))
+# Webhook bodies larger than this are refused with 413 before being decoded
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", "1048576"))
 
-    # Log token load (without exposing full token)
-    token_preview = f"{WHATSAPP_TOKEN[:10]}...{WHATSAPP_TOKEN[-10:]}" if len(WHATSAPP_TOKEN) > 20 else "***"
-    print(f"[CONFIG] ✓ WHATSAPP_TOKEN loaded: {token_preview} (length: {len(WHATSAPP_TOKEN)})")
+# Rate limiting in front of the engine (token buckets; a rate of 0 disables)
+# Per sender: burst messages at once, then per_second sustained
+RATE_LIMIT_SENDER_PER_SECOND = float(os.getenv("RATE_LIMIT_SENDER_PER_SECOND", "1"))
+RATE_LIMIT_SENDER_BURST = int(os.getenv("RATE_LIMIT_SENDER_BURST", "20"))
+# Whole app: while exhausted, CUSTOMER plane messages are shed, ADMIN still served
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "200"))
+RATE_LIMIT_GLOBAL_BURST = int(os.getenv("RATE_LIMIT_GLOBAL_BURST", "1000"))
+# Sender buckets kept in memory (idle ones expire once refilled)
+RATE_LIMIT_MAX_SENDERS = int(os.getenv("RATE_LIMIT_MAX_SENDERS", "100000"))
 
-    # Validate token against Graph API using /me endpoint (more stable than /{PHONE_ID})
-    try:
-        url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/me"
-        headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
+# Webhook deduplication by message id: in-memory window and write-behind interval
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_FLUSH_INTERVAL_MS = int(os.getenv("DEDUP_FLUSH_INTERVAL_MS", "200"))
+# Delivery status pipeline: batch writes and in-memory tracking of sent messages
+DELIVERY_FLUSH_INTERVAL_MS = int(os.getenv("DELIVERY_FLUSH_INTERVAL_MS", "500"))
+DELIVERY_FLUSH_MAX_PENDING = int(os.getenv("DELIVERY_FLUSH_MAX_PENDING", "500"))
+DELIVERY_TRACK_MAX_ENTRIES = int(os.getenv("DELIVERY_TRACK_MAX_ENTRIES", "100000"))
 
-        print(f"[CONFIG] Validating token with Graph API /me endpoint...")
-        response = requests.get(url, headers=headers, timeout=5)
+# Logging: level, json or text lines, per-category sampling of DEBUG/INFO
+# ("engine=0.1,webhook=0.01"), and the in-memory queue drained by the writer
+# thread (LOG_ASYNC=false writes from the calling thread)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
-        if response.status_code == 200:
-            print(f"[CONFIG] ✓ Token validated successfully")
-            TOKEN_IS_VALID = True
-            TOKEN_INVALID_SINCE = None  # Clear timestamp on successful validation
-            return True
-        elif response.status_code == 401:
-            error_data = response.json()
-            error_msg = error_data.get("error", {})
-            TOKEN_IS_VALID = False
-            TOKEN_INVALID_SINCE = datetime.now()
-            print(f"[CONFIG] ✗ TOKEN INVALID - Code: {error_msg.get('code')}, Subcode: {error_msg.get('error_subcode')}")
-            print(f"[CONFIG] ✗ Message: {error_msg.get('message')}")
-            print(f"[CONFIG] ✗ Invalid since: {TOKEN_INVALID_SINCE.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"[CONFIG] ⚠️  Running in DEGRADED MODE (receive only)")
-            print(f"[CONFIG] ⚠️  ACTION REQUIRED: Generate new token and update WHATSAPP_TOKEN")
-            return False
-        else:
-            TOKEN_IS_VALID = False
-            TOKEN_INVALID_SINCE = datetime.now()
-            print(f"[CONFIG] ⚠️  Token validation returned {response.status_code}: {response.text}")
-            print(f"[CONFIG] ⚠️  Running in DEGRADED MODE (receive only)")
-            return False
-
-    except requests.exceptions.Timeout:
-        print(f"[CONFIG] ⚠️  Token validation timeout - assuming valid but check connectivity")
-        TOKEN_IS_VALID = True  # Assume valid on timeout to avoid false positives
-        TOKEN_INVALID_SINCE = None
-        return True
-    except Exception as e:
-        TOKEN_IS_VALID = False
-        TOKEN_INVALID_SINCE = datetime.now()
-        print(f"[CONFIG] ⚠️  Token validation error: {e}")
-        print(f"[CONFIG] ⚠️  Running in DEGRADED MODE (receive only)")
-        return False
-
-# Run healthcheck at startup
-validate_whatsapp_token()
+# WhatsApp Cloud API
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+# Where the running app re-reads a replaced token (default: WHATSAPP_TOKEN in
+# .env) and how often it probes Graph while the token is missing or invalid
+WHATSAPP_TOKEN_FILE = os.getenv("WHATSAPP_TOKEN_FILE", "")
+WHATSAPP_TOKEN_PROBE_INTERVAL_SECONDS = float(os.getenv("WHATSAPP_TOKEN_PROBE_INTERVAL_SECONDS", "30"))
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "976165072250440")
+WHATSAPP_API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v22.0")
+# Overridable so load tests can point at a local fake Graph API
+WHATSAPP_API_BASE_URL = os.getenv("WHATSAPP_API_BASE_URL", "https://graph.facebook.com").rstrip("/")
+# Outbound sends: (connect, read) timeouts and size of the thread pool that
+# runs them off the event loop
+WHATSAPP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT_SECONDS", "3.05"))
+WHATSAPP_READ_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_READ_TIMEOUT_SECONDS", "10"))
+WHATSAPP_SEND_WORKERS = int(os.getenv("WHATSAPP_SEND_WORKERS", "8"))
+# Keep-alive connections to Graph kept open by the shared outbound client
+WHATSAPP_POOL_SIZE = int(os.getenv("WHATSAPP_POOL_SIZE", "16"))
+# Replies go through the durable outbox (outbox) or straight to Graph (direct).
+# The outbox is drained by OUTBOX_WORKERS threads at most OUTBOX_RATE_PER_SECOND
+# sends/s (the phone number's throughput tier; Cloud API default is 80) and
+# retries transient errors with jittered exponential backoff
+OUTBOUND_MODE = os.getenv("OUTBOUND_MODE", "outbox").lower()
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+OUTBOX_RATE_PER_SECOND = float(os.getenv("OUTBOX_RATE_PER_SECOND", "80"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "1"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+OUTBOX_POLL_INTERVAL_MS = int(os.getenv("OUTBOX_POLL_INTERVAL_MS", "1000"))
+# Draft campaigns (python -m app.campaign): keyset pages of CAMPAIGN_BATCH_SIZE
+# drafts sent by CAMPAIGN_WORKERS threads at most CAMPAIGN_RATE_PER_SECOND
+# sends/s; keep it below the throughput tier so replies still get through
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "500"))
+CAMPAIGN_WORKERS = int(os.getenv("CAMPAIGN_WORKERS", "8"))
+CAMPAIGN_RATE_PER_SECOND = float(os.getenv("CAMPAIGN_RATE_PER_SECOND", "20"))
+CAMPAIGN_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
@@ -0,0 +1,151 @@
+"""
+Webhook deduplication by WhatsApp message id.
+
+Meta redelivers a message when the webhook is slow to answer; without this
+layer the state machine would advance twice and the customer get two
+replies. claim() answers "first time we see this id?" from a bounded
+in-memory LRU+TTL set (O(1), no I/O on the hot path). New ids are written
+to the processed_messages table in batches, and the set is warmed from the
+table at startup (load(), from the lifespan), so dedup also survives restarts.
+
+Defensive behavior:
+- Messages without id are never treated as duplicates
+- Ids claimed but not processed (queue full) are released so the
+  redelivery is accepted
+- A crash can lose the last unwritten batch (at most DEDUP_FLUSH_INTERVAL_MS
+  of ids): those messages could be processed again after a restart
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from app.cache import LRUCache
+from app.log import get_logger
+from app.config import DEDUP_MAX_ENTRIES, DEDUP_TTL_SECONDS, DEDUP_FLUSH_INTERVAL_MS
+from app.persistence import save_processed_message_ids, load_processed_message_ids
+
+log = get_logger("dedup")
+
+_seen = LRUCache(max_entries=DEDUP_MAX_ENTRIES, ttl_seconds=DEDUP_TTL_SECONDS)
+_lock = threading.Lock()
+_loaded = False
+
+# message_id -> received_at, not yet written
+_unwritten = {}
+_flush_timer = None
+
+checks = 0
+duplicates = 0
+
+
+def _ensure_loaded() -> None:
+    """Warm the set with ids received within the TTL (once). Call with _lock held."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    since = datetime.now(timezone.utc) - timedelta(seconds=DEDUP_TTL_SECONDS or 86400)
+    ids = load_processed_message_ids(since)
+    for message_id in ids:
+        _seen[message_id] = True
+    log.info("Loaded %d processed message id(s)", len(ids))
+
+
+def load() -> None:
+    """
+    Warm the set from the table. Called by the lifespan so the first
+    webhook doesn't run the query on the event loop; claim() still loads
+    lazily when nothing called this (CLIs, tests).
+    """
+    with _lock:
+        _ensure_loaded()
+
+
+def claim(message_id) -> bool:
+    """
+    Mark message_id as processed.
+
+    Returns:
+        True the first time an id is seen (process it), False for a duplicate
+    """
+    global checks, duplicates
+
+    if not message_id:
+        return True
+
+    with _lock:
+        _ensure_loaded()
+        checks += 1
+        if _seen.get(message_id) is not None:
+            duplicates += 1
+            return False
+
+        _seen[message_id] = True
+        _unwritten[message_id] = datetime.now(timezone.utc)
+        _schedule_flush()
+    return True
+
+
+def _schedule_flush() -> None:
+    """Start the flush timer if it isn't running. Call with _lock held."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(DEDUP_FLUSH_INTERVAL_MS / 1000, flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def release(message_id) -> None:
+    """Forget a claimed id whose message was not processed (e.g. queue full)."""
+    if not message_id:
+        return
+    with _lock:
+        _seen.pop(message_id)
+        _unwritten.pop(message_id, None)
+
+
+def flush() -> int:
+    """
+    Write claimed ids not yet persisted in one batch.
+
+    Returns:
+        Number of ids written
+    """
+    global _flush_timer
+
+    with _lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        batch = dict(_unwritten)
+        _unwritten.clear()
+
+    written = save_processed_message_ids(batch)
+    if written == -1:
+        # Keep them and retry after the next window, even if no claim() arrives
+        with _lock:
+            for message_id, received_at in batch.items():
+                _unwritten.setdefault(message_id, received_at)
+            _schedule_flush()
+        return 0
+    return written
+
+
+def stats() -> dict:
+    """Counters for the healthcheck."""
+    return {
+        "checks": checks,
+        "duplicates": duplicates,
+        "tracked": len(_seen),
+        "unwritten": len(_unwritten),
+        "max_entries": DEDUP_MAX_ENTRIES,
+        "ttl_seconds": DEDUP_TTL_SECONDS,
+    }
+
+
+def clear() -> None:
+    """Forget every id in memory (the table is kept); reloads on next claim."""
+    global _loaded
+    with _lock:
+        _seen.clear()
+        _unwritten.clear()
+        _loaded = False
@@ -0,0 +1,277 @@
+"""
+Delivery/read status pipeline for outbound WhatsApp messages.
+
+Every successful send is recorded by its wamid (the id Graph returns).
+Status callbacks (value.statuses) are only appended to a pending batch on
+the webhook path; flush() correlates them to sent messages, writes the new
+states with one executemany, and updates per-commerce counters in memory:
+
+    sent / delivered / read / failed, plus summed delivery and read latency
+
+so delivery rates and latencies are read without scanning tables. Counters
+are seeded once from the table (GROUP BY) at startup (load(), from the
+lifespan; lazily on first use otherwise) and then only move incrementally.
+Reaching DELIVERY_FLUSH_MAX_PENDING wakes the flush timer immediately; the
+webhook never writes inline.
+
+Defensive behavior:
+- Statuses are idempotent: a repeated or late "delivered" never counts twice,
+  and "read" implies "delivered" (WhatsApp may skip the latter)
+- Statuses for unknown wamids are counted as unmatched and dropped
+- Failed writes are logged; counters already reflect the batch
+"""
+
+import threading
+from datetime import datetime, timezone
+from app.cache import LRUCache
+from app.config import DELIVERY_FLUSH_INTERVAL_MS, DELIVERY_FLUSH_MAX_PENDING, DELIVERY_TRACK_MAX_ENTRIES
+from app.persistence import (
+    save_outbound_messages,
+    get_outbound_messages,
+    update_delivery_states,
+    load_delivery_counters,
+)
+
+STATUSES = ("sent", "delivered", "read", "failed")
+
+# wamid -> {comercio_id, sent_at, delivered_at, read_at, failed_at, error_code}
+# Recently sent messages; misses are read back from the table
+_tracked = LRUCache(max_entries=DELIVERY_TRACK_MAX_ENTRIES)
+
+# comercio_id -> counters (None if unknown), seeded on first use
+_counters = None
+
+_pending_sent = []
+_pending_statuses = []
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_timer = None
+_flush_soon = False
+
+unmatched = 0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _parse_timestamp(value) -> datetime:
+    """Status timestamps are unix seconds as strings; naive UTC like the table."""
+    try:
+        return datetime.fromtimestamp(int(value), timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return _now()
+
+
+def _ensure_counters() -> dict:
+    """Seed counters from the table once. Call with _lock held."""
+    global _counters
+    if _counters is None:
+        _counters = load_delivery_counters()
+    return _counters
+
+
+def load() -> None:
+    """Seed the counters; called by the lifespan so no webhook runs the GROUP BY."""
+    with _lock:
+        _ensure_counters()
+
+
+def _counter(comercio_id) -> dict:
+    return _ensure_counters().setdefault(comercio_id, {
+        "sent": 0, "delivered": 0, "read": 0, "failed": 0,
+        "delivery_seconds": 0.0, "read_seconds": 0.0,
+    })
+
+
+def _schedule_flush(pending: int) -> None:
+    """
+    Start the flush timer. A batch big enough to flush now gets an immediate
+    timer instead: the caller (the webhook, on the event loop) never writes.
+    Call with _lock held.
+    """
+    global _flush_timer, _flush_soon
+    if pending >= DELIVERY_FLUSH_MAX_PENDING:
+        if _flush_soon:
+            return
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+        _flush_timer = threading.Timer(0, flush)
+        _flush_soon = True
+    elif _flush_timer is None:
+        _flush_timer = threading.Timer(DELIVERY_FLUSH_INTERVAL_MS / 1000, flush)
+    else:
+        return
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+def record_sent(wamid: str, to_phone: str, comercio_id: int = None) -> None:
+    """Track an outbound message Graph accepted (wamid from the send response)."""
+    if not wamid:
+        return
+
+    sent_at = _now()
+    with _lock:
+        _tracked[wamid] = {
+            "comercio_id": comercio_id,
+            "sent_at": sent_at,
+            "delivered_at": None,
+            "read_at": None,
+            "failed_at": None,
+            "error_code": None,
+        }
+        _counter(comercio_id)["sent"] += 1
+        _pending_sent.append({"wamid": wamid, "comercio_id": comercio_id, "to_phone": to_phone, "sent_at": sent_at})
+        _schedule_flush(len(_pending_sent) + len(_pending_statuses))
+
+
+def ingest(statuses: list) -> int:
+    """
+    Queue status callbacks from a webhook (value.statuses) for the next flush.
+
+    Returns:
+        Number of statuses accepted
+    """
+    accepted = 0
+    with _lock:
+        for status in statuses:
+            if status.get("id") and status.get("status") in STATUSES:
+                errors = status.get("errors") or [{}]
+                _pending_statuses.append((
+                    status["id"],
+                    status["status"],
+                    _parse_timestamp(status.get("timestamp")),
+                    errors[0].get("code"),
+                ))
+                accepted += 1
+        if accepted:
+            _schedule_flush(len(_pending_sent) + len(_pending_statuses))
+    return accepted
+
+
+def _apply(record: dict, status: str, at: datetime, error_code) -> bool:
+    """Advance one message's state and its commerce counters. Returns True if anything changed."""
+    counter = _counter(record["comercio_id"])
+    changed = False
+
+    if status in ("delivered", "read") and record["delivered_at"] is None:
+        record["delivered_at"] = at
+        counter["delivered"] += 1
+        counter["delivery_seconds"] += max(0.0, (at - record["sent_at"]).total_seconds())
+        changed = True
+    if status == "read" and record["read_at"] is None:
+        record["read_at"] = at
+        counter["read"] += 1
+        counter["read_seconds"] += max(0.0, (at - record["sent_at"]).total_seconds())
+        changed = True
+    if status == "failed" and record["failed_at"] is None:
+        record["failed_at"] = at
+        record["error_code"] = error_code
+        counter["failed"] += 1
+        changed = True
+
+    return changed
+
+
+def _status_of(record: dict) -> str:
+    if record["failed_at"]:
+        return "failed"
+    if record["read_at"]:
+        return "read"
+    if record["delivered_at"]:
+        return "delivered"
+    return "sent"
+
+
+def flush() -> int:
+    """
+    Write pending sends and statuses in batches.
+
+    Returns:
+        Number of messages whose delivery state changed
+    """
+    global _flush_timer, _flush_soon, unmatched
+
+    with _flush_lock:
+        with _lock:
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+            _flush_soon = False
+            sent, statuses = list(_pending_sent), list(_pending_statuses)
+            _pending_sent.clear()
+            _pending_statuses.clear()
+            _ensure_counters()
+
+        # Sends first: statuses of this batch may refer to them
+        save_outbound_messages(sent)
+        if not statuses:
+            return 0
+
+        misses = {wamid for wamid, _, _, _ in statuses if wamid not in _tracked}
+        loaded = get_outbound_messages(misses)
+
+        changed = {}
+        with _lock:
+            for wamid, record in loaded.items():
+                _tracked[wamid] = record
+            for wamid, status, at, error_code in statuses:
+                record = _tracked.get(wamid)
+                if record is None:
+                    unmatched += 1
+                    continue
+                if _apply(record, status, at, error_code):
+                    changed[wamid] = record
+
+            updates = [
+                {
+                    "wamid": wamid,
+                    "status": _status_of(record),
+                    "delivered_at": record["delivered_at"],
+                    "read_at": record["read_at"],
+                    "failed_at": record["failed_at"],
+                    "error_code": record["error_code"],
+                }
+                for wamid, record in changed.items()
+            ]
+
+        update_delivery_states(updates)
+        return len(updates)
+
+
+def counters(comercio_id) -> dict:
+    """Delivery counters of one commerce, with average latencies in seconds."""
+    with _lock:
+        counter = dict(_counter(comercio_id))
+    delivery_seconds = counter.pop("delivery_seconds")
+    read_seconds = counter.pop("read_seconds")
+    counter["avg_delivery_seconds"] = round(delivery_seconds / counter["delivered"], 2) if counter["delivered"] else None
+    counter["avg_read_seconds"] = round(read_seconds / counter["read"], 2) if counter["read"] else None
+    return counter
+
+
+def stats() -> dict:
+    """Pipeline counters and per-commerce delivery counters for the healthcheck."""
+    with _lock:
+        comercio_ids = list(_ensure_counters())
+        pipeline = {
+            "tracked": len(_tracked),
+            "pending_sent": len(_pending_sent),
+            "pending_statuses": len(_pending_statuses),
+            "unmatched": unmatched,
+        }
+    return {
+        **pipeline,
+        "comercios": {str(comercio_id if comercio_id is not None else "none"): counters(comercio_id) for comercio_id in comercio_ids},
+    }
+
+
+def clear() -> None:
+    """Drop memory state (the table is kept); counters are re-seeded on next use."""
+    global _counters
+    with _lock:
+        _tracked.clear()
+        _pending_sent.clear()
+        _pending_statuses.clear()
+        _counters = None
@@ -5,6 +5,9 @@ Separates ADMIN plane from CUSTOMER plane before state machine logic.
 Pure function with no side effects, no LLM, no persistence.
 """
 
+from app.keywords import KeywordMatcher
+from app.message_context import as_context
+
 # Configuration
 ADMIN_WHITELIST = [
     "5493794281273"
@@ -24,6 +27,7 @@ ADMIN_STATES = {
     "esperando_horarios",
     "esperando_servicios",
     "activation_awaiting_name",
+    "activation_awaiting_phone",
     "activation_awaiting_intent",
     "activation_showing_draft"
 }
@@ -38,8 +42,24 @@ ADMIN_COMMANDS = {
     "cancelar", "/cancelar"
 }
 
+# Every command compiled once: one pass finds any command inside the text
+ADMIN_COMMAND_MATCHER = KeywordMatcher({"admin": ADMIN_COMMANDS})
+
+
+def is_admin_sender(sender: str) -> bool:
+    """
+    Identity check: whitelisted admin or test number.
+
+    Args:
+        sender: Phone number of sender
+
+    Returns:
+        True if the sender may reach the ADMIN plane through commands
+    """
+    return sender in ADMIN_WHITELIST or sender in TEST_PHONE_PATTERNS
+
 
-def dispatch_signal(sender: str, text: str, current_state: str) -> str:
+def dispatch_signal(sender: str, text, current_state: str) -> str:
     """
     Classify message plane: ADMIN or CUSTOMER.
 
@@ -51,7 +71,7 @@ def dispatch_signal(sender: str, text: str, current_state: str) -> str:
 
     Args:
         sender: Phone number of sender
-        text: Message text
+        text: Message text (str or MessageContext)
         current_state: Current conversation state
 
     Returns:
@@ -64,21 +84,20 @@ def dispatch_signal(sender: str, text: str, current_state: str) -> str:
 
     # CHECK 1: Identity
     # If sender is not whitelisted (or test number), always customer plane
-    if sender not in ADMIN_WHITELIST and sender not in TEST_PHONE_PATTERNS:
+    if not is_admin_sender(sender):
         return "CUSTOMER"
 
     # CHECK 2: Command detection
-    # Normalize text for matching
-    normalized = text.strip().lower()
+    # Normalize text for matching (shared with the engine via the context)
+    normalized = as_context(text).lowered
 
     # Check if message is an admin command
     if normalized in ADMIN_COMMANDS:
         return "ADMIN"
 
     # Check multi-word admin triggers
-    for command in ADMIN_COMMANDS:
-        if command in normalized:
-            return "ADMIN"
+    if ADMIN_COMMAND_MATCHER.match(normalized):
+        return "ADMIN"
 
     # Default: Customer plane
     return "CUSTOMER"
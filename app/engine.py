@@ -8,19 +8,28 @@ States:
 - esperando_servicios: Waiting for services list
 - completado: Setup completed
 - activation_awaiting_name: Waiting for customer name (activation flow)
+- activation_awaiting_phone: Waiting for customer WhatsApp number (activation flow)
 - activation_awaiting_intent: Waiting for commercial intent (activation flow)
 - activation_showing_draft: Showing message draft for confirmation (activation flow)
 """
 
-import unicodedata
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from app.config import STATELESS_INICIAL, BUSINESS_TIMEZONE
 from app.state import get_conversation, update_conversation
-from app.validators import validate_nombre, validate_horarios, validate_servicios
+from app.validators import validate_nombre, validate_horarios, validate_servicios, validate_telefono, normalize_telefono
 from app.message_generator import generate_commercial_message
-from app.persistence import save_message_draft
-from app.dispatcher import dispatch_signal
-from app.customer_handlers import handle_customer_message
+from app.persistence import save_message_draft, save_comercio, save_turno
+from app.dispatcher import dispatch_signal, is_admin_sender
+from app.availability import reserve_slot, release_slot, suggest_free_slots, parse_hora
+from app.schedule import set_schedule, get_schedule, is_open, is_open_now, day_mask, resolve_fecha
+from app.message_context import as_context
+from app.keywords import matcher_for
+from app import rate_limit
 from app.handler_result import HandlerResult
+from app.log import get_logger
 
+log = get_logger("engine")
 
 ESTADOS = {
     "inicial": "Usuario nuevo o sin setup",
@@ -31,34 +40,19 @@ ESTADOS = {
     "esperando_fecha_turno": "Esperando día para turno",
     "esperando_hora_turno": "Esperando hora para turno",
     "activation_awaiting_name": "Esperando nombre del cliente (activación)",
+    "activation_awaiting_phone": "Esperando teléfono del cliente (activación)",
     "activation_awaiting_intent": "Esperando intención comercial (activación)",
     "activation_showing_draft": "Mostrando borrador de mensaje (activación)"
 }
 
+# Reply for anyone in "inicial" who cannot start a flow (customer plane)
+INICIAL_REPLY = "Hola 👋 Soy Nordia. Escribí 'setup' para comenzar."
 
-def normalize_text(text: str) -> str:
-    """
-    Normalize text for keyword matching: lowercase + remove accents.
-
-    Args:
-        text: Input text to normalize
-
-    Returns:
-        Normalized text (lowercase, no accents)
-
-    Examples:
-        >>> normalize_text("CUÁNTO")
-        'cuanto'
-        >>> normalize_text("Precio")
-        'precio'
-    """
-    # Remove accents using Unicode normalization
-    nfkd = unicodedata.normalize('NFKD', text)
-    without_accents = ''.join([c for c in nfkd if not unicodedata.combining(c)])
-    return without_accents.lower()
+# Messages answered without reading or creating conversation state
+stateless_hits = 0
 
 
-def contains_service_query_keyword(text: str) -> bool:
+def contains_service_query_keyword(text) -> bool:
     """
     Check if text contains keywords for service/price query.
 
@@ -66,7 +60,7 @@ def contains_service_query_keyword(text: str) -> bool:
     Case-insensitive and accent-insensitive.
 
     Args:
-        text: User message to check
+        text: User message to check (str or MessageContext)
 
     Returns:
         True if contains any service query keyword
@@ -77,19 +71,10 @@ def contains_service_query_keyword(text: str) -> bool:
         >>> contains_service_query_keyword("hola")
         False
     """
-    normalized = normalize_text(text)
-    keywords = [
-        'precio', 'precios',
-        'servicio', 'servicios',
-        'cuanto',
-        'cuesta', 'cuestan',
-        'sale', 'salen'
-    ]
+    return as_context(text).asks_services
 
-    return any(keyword in normalized for keyword in keywords)
 
-
-def contains_appointment_keyword(text: str) -> bool:
+def contains_appointment_keyword(text) -> bool:
     """
     Check if text contains keywords for appointment request.
 
@@ -97,7 +82,7 @@ def contains_appointment_keyword(text: str) -> bool:
     Case-insensitive and accent-insensitive.
 
     Args:
-        text: User message to check
+        text: User message to check (str or MessageContext)
 
     Returns:
         True if contains any appointment keyword
@@ -108,12 +93,32 @@ def contains_appointment_keyword(text: str) -> bool:
         >>> contains_appointment_keyword("hola")
         False
     """
-    normalized = normalize_text(text)
-    keywords = ['turno', 'turnos', 'reserva', 'reservar', 'cita']
-    return any(keyword in normalized for keyword in keywords)
+    return as_context(text).asks_appointment
+
+
+def contains_hours_query_keyword(text) -> bool:
+    """
+    Check if text asks about opening hours.
+
+    Keywords: abierto, abren, cierran, horario, atienden
+    Case-insensitive and accent-insensitive.
+
+    Args:
+        text: User message to check (str or MessageContext)
+
+    Returns:
+        True if contains any opening hours keyword
+
+    Examples:
+        >>> contains_hours_query_keyword("¿Están abiertos ahora?")
+        True
+        >>> contains_hours_query_keyword("hola")
+        False
+    """
+    return as_context(text).asks_hours
 
 
-def contains_activation_keyword(text: str) -> bool:
+def contains_activation_keyword(text) -> bool:
     """
     Check if text contains keywords for customer activation flow.
 
@@ -121,7 +126,7 @@ def contains_activation_keyword(text: str) -> bool:
     Case-insensitive and accent-insensitive.
 
     Args:
-        text: User message to check
+        text: User message to check (str or MessageContext)
 
     Returns:
         True if contains any activation keyword
@@ -134,37 +139,39 @@ def contains_activation_keyword(text: str) -> bool:
         >>> contains_activation_keyword("hola")
         False
     """
-    normalized = normalize_text(text)
-
-    # Multi-word triggers
-    multi_word_triggers = [
-        'activar cliente',
-        'activar contacto',
-        'contactar cliente',
-        'enviar mensaje a cliente',
-        'mensaje a cliente',
-        'escribirle a'
-    ]
+    return as_context(text).asks_activation
 
-    return any(trigger in normalized for trigger in multi_word_triggers)
 
-
-def handle_message(sender: str, text: str) -> str:
+def handle_message(sender: str, text) -> str:
     """
     Process incoming WhatsApp message with state machine.
 
     Args:
         sender: Phone number of sender
-        text: Message text from user
+        text: Message text from user (str or a MessageContext built by the webhook)
 
     Returns:
-        Reply message to send back
+        Reply message to send back, or None if the rate limiter dropped the
+        message (no reply, no state change)
     """
+    global stateless_hits
+
+    ctx = as_context(text)
+    text = ctx.raw
+
     # Get current conversation state
     conv = get_conversation(sender)
     estado_actual = conv.get("estado", "inicial")
 
-    print(f"[ENGINE] {sender} | Estado: {estado_actual} | Mensaje: {text[:50]}")
+    # Customer in "inicial" (usually an unknown sender): the reply can't depend
+    # on the text and nothing transitions, so skip the state machine entirely
+    if STATELESS_INICIAL and estado_actual == "inicial" and not is_admin_sender(sender):
+        if not rate_limit.admit(sender, "CUSTOMER"):
+            return None
+        stateless_hits += 1
+        return INICIAL_REPLY
+
+    log.debug("message", extra={"sender": sender, "state": estado_actual, "text": text[:50]})
 
     def apply_handler_result(result):
         if isinstance(result, HandlerResult):
@@ -175,20 +182,24 @@ def handle_message(sender: str, text: str) -> str:
         return result
 
     # Dispatch signal: classify plane (ADMIN or CUSTOMER)
-    plane = dispatch_signal(sender, text, estado_actual)
-    print(f"[DISPATCHER] sender={sender} state={estado_actual} plane={plane}")
+    plane = dispatch_signal(sender, ctx, estado_actual)
+    log.debug("dispatched", extra={"sender": sender, "state": estado_actual, "plane": plane})
+
+    # Flooding sender, or overloaded and this is CUSTOMER work: drop it here,
+    # before any state save or outbound call
+    if not rate_limit.admit(sender, plane):
+        return None
 
     if plane == "CUSTOMER":
         pass
 
     # State machine transitions
-    print(f"[ENGINE] state={estado_actual}")
     if estado_actual == "inicial":
         # Check for activation keyword first (before setup)
-        if plane == "ADMIN" and contains_activation_keyword(text):
-            print("[INTENT] activation")
+        if plane == "ADMIN" and contains_activation_keyword(ctx):
+            log.info("intent: activation", extra={"sender": sender})
             # Initialize activation context
-            print(f"[STATE] {estado_actual} -> activation_awaiting_name")
+            log.info("%s -> activation_awaiting_name", estado_actual, extra={"sender": sender})
             update_conversation(sender, {
                 "estado": "activation_awaiting_name",
                 "activation_context": {
@@ -205,12 +216,12 @@ def handle_message(sender: str, text: str) -> str:
             )
 
         # Waiting for setup keyword
-        if plane == "ADMIN" and text.strip().lower() in ["setup", "/setup"]:
-            print("[INTENT] setup")
-            print(f"[STATE] {estado_actual} -> esperando_nombre")
+        if plane == "ADMIN" and ctx.lowered in ["setup", "/setup"]:
+            log.info("intent: setup", extra={"sender": sender})
+            log.info("%s -> esperando_nombre", estado_actual, extra={"sender": sender})
             update_conversation(sender, {"estado": "esperando_nombre"})
             return "Perfecto 👍 ¿Cómo se llama tu negocio?"
-        return "Hola 👋 Soy Nordia. Escribí 'setup' para comenzar."
+        return INICIAL_REPLY
 
     elif estado_actual == "esperando_nombre":
         # Validate business name before saving
@@ -220,7 +231,7 @@ def handle_message(sender: str, text: str) -> str:
             return f"❌ {error_msg}\n\n¿Cómo se llama tu negocio?"
 
         # Valid - save and advance to next state
-        print(f"[STATE] {estado_actual} -> esperando_horarios")
+        log.info("%s -> esperando_horarios", estado_actual, extra={"sender": sender})
         update_conversation(sender, {
             "estado": "esperando_horarios",
             "nombre": text
@@ -235,7 +246,7 @@ def handle_message(sender: str, text: str) -> str:
             return f"❌ {error_msg}\n\n¿Cuáles son tus horarios?"
 
         # Valid - save and advance to next state
-        print(f"[STATE] {estado_actual} -> esperando_servicios")
+        log.info("%s -> esperando_servicios", estado_actual, extra={"sender": sender})
         conv["estado"] = "esperando_servicios"
         conv["horarios"] = text
         update_conversation(sender, conv)
@@ -249,9 +260,14 @@ def handle_message(sender: str, text: str) -> str:
             return f"❌ {error_msg}\n\n¿Qué servicios ofreces?"
 
         # Valid - save and complete setup
-        print(f"[STATE] {estado_actual} -> completado")
+        log.info("%s -> completado", estado_actual, extra={"sender": sender})
         conv["estado"] = "completado"
         conv["servicios"] = text
+        comercio_id = save_comercio(sender, conv["nombre"], conv["horarios"], text)
+        if comercio_id != -1:
+            conv["comercio_id"] = comercio_id
+            # Compile horarios once; customer questions read the bitmap
+            set_schedule(comercio_id, conv["horarios"])
         update_conversation(sender, conv)
         return (
             f"✅ Listo! Guardé:\n"
@@ -261,17 +277,35 @@ def handle_message(sender: str, text: str) -> str:
         )
 
     elif estado_actual == "completado":
+        # Intents of this commerce's vocabulary (default keywords + custom ones)
+        intents = ctx.intents_for(matcher_for(conv.get("comercio_id")))
+
         # Check for appointment request (priority over services)
-        if contains_appointment_keyword(text):
-            print(f"[STATE] {estado_actual} -> esperando_fecha_turno")
+        if "appointment" in intents:
+            log.info("%s -> esperando_fecha_turno", estado_actual, extra={"sender": sender})
             update_conversation(sender, {
                 **conv,  # Preserve existing data
                 "estado": "esperando_fecha_turno"
             })
             return "Perfecto 👍 ¿Para qué día?"
 
+        # Check if user is asking whether the business is open
+        if "hours" in intents:
+            horarios = conv.get("horarios", "")
+            if not horarios:
+                return "Todavía no tenemos horarios configurados."
+
+            comercio_id = conv.get("comercio_id")
+            abierto = None
+            if comercio_id is not None:
+                abierto = is_open_now(comercio_id, datetime.now(ZoneInfo(BUSINESS_TIMEZONE)))
+            if abierto is None:
+                return f"Nuestros horarios:\n{horarios}"
+            estado_local = "Sí, ahora estamos abiertos 👍" if abierto else "Ahora estamos cerrados."
+            return f"{estado_local}\nNuestros horarios:\n{horarios}"
+
         # Check if user is querying for services/prices
-        if contains_service_query_keyword(text):
+        if "services" in intents:
             servicios = conv.get("servicios", "")
 
             if servicios:
@@ -285,39 +319,82 @@ def handle_message(sender: str, text: str) -> str:
 
     elif estado_actual == "esperando_fecha_turno":
         # Save appointment date temporarily
-        print(f"[STATE] {estado_actual} -> esperando_hora_turno")
+        log.info("%s -> esperando_hora_turno", estado_actual, extra={"sender": sender})
         conv["turno_temp"] = {"fecha": text}
         conv["estado"] = "esperando_hora_turno"
         update_conversation(sender, conv)
         return "¿A qué hora?"
 
     elif estado_actual == "esperando_hora_turno":
-        # Save complete appointment to list
         fecha = conv.get("turno_temp", {}).get("fecha", "")
-        turno = {"fecha": fecha, "hora": text}
 
-        # Add to appointments list
-        if "turnos" not in conv:
-            conv["turnos"] = []
-        conv["turnos"].append(turno)
+        # Bookings live in the turnos table; the conversation keeps a pointer
+        comercio_id = conv.get("comercio_id")
+        if comercio_id is None:
+            comercio_id = save_comercio(sender, conv.get("nombre") or sender, conv.get("horarios"), conv.get("servicios"))
+        if comercio_id == -1:
+            return "❌ No pude guardar el turno. ¿A qué hora?"
+
+        # Calendar day of the free-text fecha; if it can't be resolved the
+        # turno is recorded without conflict or opening-hours checks
+        dia = resolve_fecha(fecha)
+
+        # Outside opening hours (only when both day and hour are understood)
+        week = get_schedule(comercio_id)
+        weekday = dia.weekday() if dia is not None else None
+        minutes = parse_hora(text)
+        abiertos = day_mask(week, weekday) if weekday is not None else day_mask(None, 0)
+        cerrado = (
+            week is not None and weekday is not None and minutes is not None
+            and not is_open(week, weekday, minutes)
+        )
+
+        # Closed hour or taken slot: stay in same state and offer alternatives
+        if cerrado or not reserve_slot(comercio_id, dia, text):
+            alternativas = suggest_free_slots(comercio_id, dia, text, allowed=abiertos)
+            if not alternativas:
+                # Nothing left that day: ask for another day
+                log.info("%s -> esperando_fecha_turno", estado_actual, extra={"sender": sender})
+                conv.pop("turno_temp", None)
+                conv["estado"] = "esperando_fecha_turno"
+                update_conversation(sender, conv)
+                return f"⏰ No quedan horarios libres para {fecha}. ¿Para qué otro día?"
+
+            motivo = "A esa hora estamos cerrados" if cerrado else f"Ese horario ya está ocupado para {fecha}"
+            return (
+                f"⏰ {motivo}.\n"
+                f"Horarios libres: {', '.join(alternativas)}. ¿A qué hora?"
+            )
+
+        turno_id = save_turno(comercio_id, sender, fecha, text, dia=dia)
+        if turno_id == -1:
+            # Stay in same state so the user can retry
+            release_slot(comercio_id, dia, text)
+            return "❌ No pude guardar el turno. ¿A qué hora?"
+
+        # Legacy conversations stored bookings inline; move them to the table.
+        # Their fecha was relative to an unknown booking day: no dia
+        for legacy in conv.pop("turnos", []):
+            save_turno(comercio_id, sender, legacy.get("fecha", ""), legacy.get("hora", ""))
 
         # Clean temporary data and return to completado
         if "turno_temp" in conv:
             del conv["turno_temp"]
-        print(f"[STATE] {estado_actual} -> completado")
+        log.info("%s -> completado", estado_actual, extra={"sender": sender})
         conv["estado"] = "completado"
+        conv["comercio_id"] = comercio_id
+        conv["ultimo_turno_id"] = turno_id
         update_conversation(sender, conv)
 
         return f"✅ Turno reservado para {fecha} a las {text}"
 
     elif estado_actual == "activation_awaiting_name":
-        # Normalize input
-        normalized_input = text.strip().lower()
+        normalized_input = ctx.lowered
 
         # Check for cancellation
         if normalized_input in ["cancelar", "salir", "no"]:
             # Clear activation context and return to inicial
-            print(f"[STATE] {estado_actual} -> inicial")
+            log.info("%s -> inicial", estado_actual, extra={"sender": sender})
             conv = {}
             result = HandlerResult(
                 reply="Activación cancelada.",
@@ -326,7 +403,7 @@ def handle_message(sender: str, text: str) -> str:
             return apply_handler_result(result)
 
         # Validate customer name
-        if not text.strip():
+        if not ctx.stripped:
             # Empty input - stay in same state
             result = HandlerResult(
                 reply="Necesito el nombre del cliente. Escribilo en una sola palabra o frase.",
@@ -335,11 +412,46 @@ def handle_message(sender: str, text: str) -> str:
             return apply_handler_result(result)
 
         # Valid name - save and advance
-        customer_name = text.strip()
+        customer_name = ctx.stripped
         activation_ctx = conv.get("activation_context", {})
         activation_ctx["customer_name"] = customer_name
 
-        print(f"[STATE] {estado_actual} -> activation_awaiting_intent")
+        log.info("%s -> activation_awaiting_phone", estado_actual, extra={"sender": sender})
+        conv["activation_context"] = activation_ctx
+        result = HandlerResult(
+            reply=(
+                f"¿Cual es el WhatsApp de {customer_name}?\n"
+                "Escribilo con codigo de pais y de area. Ej: 5493794123456"
+            ),
+            next_state="activation_awaiting_phone"
+        )
+        return apply_handler_result(result)
+
+    elif estado_actual == "activation_awaiting_phone":
+        normalized_input = ctx.lowered
+
+        # Check for cancellation
+        if normalized_input in ["cancelar", "salir", "no"]:
+            # Clear activation context and return to inicial
+            log.info("%s -> inicial", estado_actual, extra={"sender": sender})
+            result = HandlerResult(
+                reply="Activación cancelada.",
+                next_state="inicial"
+            )
+            return apply_handler_result(result)
+
+        activation_ctx = conv.get("activation_context", {})
+        customer_name = activation_ctx.get("customer_name", "Cliente")
+
+        # Validate phone; the campaign sends to this number
+        is_valid, error_msg = validate_telefono(ctx.stripped)
+        if not is_valid:
+            # Validation failed - stay in same state and return error
+            return f"❌ {error_msg}\n\n¿Cual es el WhatsApp de {customer_name}?"
+
+        activation_ctx["customer_phone"] = normalize_telefono(ctx.stripped)
+
+        log.info("%s -> activation_awaiting_intent", estado_actual, extra={"sender": sender})
         conv["activation_context"] = activation_ctx
         result = HandlerResult(
             reply=(
@@ -352,13 +464,12 @@ def handle_message(sender: str, text: str) -> str:
         return apply_handler_result(result)
 
     elif estado_actual == "activation_awaiting_intent":
-        # Normalize input
-        normalized_input = text.strip().lower()
+        normalized_input = ctx.lowered
 
         # Check for cancellation
         if normalized_input in ["cancelar", "salir"]:
             # Clear activation context and return to inicial
-            print(f"[STATE] {estado_actual} -> inicial")
+            log.info("%s -> inicial", estado_actual, extra={"sender": sender})
             result = HandlerResult(
                 reply="Activación cancelada.",
                 next_state="inicial"
@@ -366,12 +477,12 @@ def handle_message(sender: str, text: str) -> str:
             return apply_handler_result(result)
 
         # Validate intent
-        if not text.strip():
+        if not ctx.stripped:
             # Empty input
             return "Escribi una frase corta con el motivo. Ej: recordar turno o ofrecer lentes nuevos."
 
         # Check word count (need at least 3 words)
-        word_count = len(text.strip().split())
+        word_count = len(ctx.words)
         if word_count < 3:
             result = HandlerResult(
                 reply="Escribi una frase corta con el motivo. Ej: recordar turno o ofrecer lentes nuevos.",
@@ -380,7 +491,7 @@ def handle_message(sender: str, text: str) -> str:
             return apply_handler_result(result)
 
         # Valid intent - generate message and show draft
-        commercial_intent = text.strip()
+        commercial_intent = ctx.stripped
         activation_ctx = conv.get("activation_context", {})
         customer_name = activation_ctx.get("customer_name", "Cliente")
 
@@ -391,7 +502,7 @@ def handle_message(sender: str, text: str) -> str:
         activation_ctx["commercial_intent"] = commercial_intent
         activation_ctx["generated_message"] = generated_message
 
-        print(f"[STATE] {estado_actual} -> activation_showing_draft")
+        log.info("%s -> activation_showing_draft", estado_actual, extra={"sender": sender})
         conv["activation_context"] = activation_ctx
         result = HandlerResult(
             reply=(
@@ -405,8 +516,7 @@ def handle_message(sender: str, text: str) -> str:
         return apply_handler_result(result)
 
     elif estado_actual == "activation_showing_draft":
-        # Normalize input
-        normalized_input = text.strip().lower()
+        normalized_input = ctx.lowered
 
         # Check for confirmation
         if normalized_input in ["enviar", "si", "sí", "ok", "dale", "confirmar"]:
@@ -416,16 +526,20 @@ def handle_message(sender: str, text: str) -> str:
             commercial_intent = activation_ctx.get("commercial_intent", "")
             generated_message = activation_ctx.get("generated_message", "")
 
-            # Save message draft to DB
-            draft_id = save_message_draft(customer_name, commercial_intent, generated_message)
+            customer_phone = activation_ctx.get("customer_phone")
+
+            # Save message draft to DB: pending drafts with phone are sent by the campaign
+            draft_id = save_message_draft(
+                customer_name, commercial_intent, generated_message, customer_phone=customer_phone
+            )
 
             # Clear activation context and return to inicial
-            print(f"[STATE] {estado_actual} -> inicial")
+            log.info("%s -> inicial", estado_actual, extra={"sender": sender})
             result = HandlerResult(
                 reply=(
                     f"✅ Listo. Mensaje preparado para {customer_name}.\n\n"
-                    f"El mensaje quedó guardado. Cuando conectemos WhatsApp, "
-                    f"se enviará automáticamente."
+                    f"El mensaje quedó guardado en la cola de envío: "
+                    f"sale con la próxima campaña."
                 ),
                 next_state="inicial"
             )
@@ -434,7 +548,7 @@ def handle_message(sender: str, text: str) -> str:
         # Check for cancellation
         if normalized_input in ["cancelar", "no", "salir"]:
             # Clear activation context and return to inicial
-            print(f"[STATE] {estado_actual} -> inicial")
+            log.info("%s -> inicial", estado_actual, extra={"sender": sender})
             result = HandlerResult(
                 reply="Activación cancelada.",
                 next_state="inicial"
@@ -452,4 +566,4 @@ def handle_message(sender: str, text: str) -> str:
         return apply_handler_result(result)
 
     # Fallback (should never reach here)
-    return "Hola 👋 Soy Nordia. Escribí 'setup' para comenzar."
+    return INICIAL_REPLY
@@ -0,0 +1,311 @@
+"""
+Outbound client for the WhatsApp Cloud (Graph) API.
+
+One requests.Session shared by every sender thread (queue workers, the send
+pool, app.whatsapp): its connection pool keeps up to WHATSAPP_POOL_SIZE
+keep-alive connections to Graph open, so a send reuses an established
+TCP+TLS connection instead of opening a new one per message. The messages
+URL, auth headers and timeouts are built once.
+
+Every send goes through one CircuitBreaker (breaker): a missing or expired
+token (401, code 190) opens it and sends are refused with CircuitOpen
+instead of hitting Graph. While it is not closed, a background probe
+re-reads the token (WHATSAPP_TOKEN_FILE, else WHATSAPP_TOKEN from .env) and
+validates it against /me; a valid token is swapped into the live session
+and closes the breaker, no restart needed. The startup validation also runs
+on that thread, so the app starts serving without waiting on Graph.
+
+Defensive behavior:
+- The session is created lazily on first send and rebuilt after close()
+- Sends past the pool size open a temporary connection instead of waiting
+- Errors are raised to the caller, which decides how to log and degrade;
+  error_for() tells transient Graph errors (worth retrying) from permanent ones
+"""
+
+import json
+import threading
+from pathlib import Path
+import requests
+from dotenv import dotenv_values, find_dotenv
+from requests.adapters import HTTPAdapter
+from app.breaker import CircuitBreaker, CLOSED
+from app.config import (
+    WHATSAPP_TOKEN,
+    WHATSAPP_TOKEN_FILE,
+    WHATSAPP_TOKEN_PROBE_INTERVAL_SECONDS,
+    WHATSAPP_PHONE_NUMBER_ID,
+    WHATSAPP_API_VERSION,
+    WHATSAPP_API_BASE_URL,
+    WHATSAPP_CONNECT_TIMEOUT_SECONDS,
+    WHATSAPP_READ_TIMEOUT_SECONDS,
+    WHATSAPP_POOL_SIZE,
+)
+from app.log import get_logger
+
+log = get_logger("whatsapp")
+
+MESSAGES_URL = f"{WHATSAPP_API_BASE_URL}/{WHATSAPP_API_VERSION}/{WHATSAPP_PHONE_NUMBER_ID}/messages"
+ME_URL = f"{WHATSAPP_API_BASE_URL}/{WHATSAPP_API_VERSION}/me"
+TIMEOUT = (WHATSAPP_CONNECT_TIMEOUT_SECONDS, WHATSAPP_READ_TIMEOUT_SECONDS)
+
+# Graph error codes that clear up on their own: throttling (4, 80007,
+# 130429, 131056) and temporary service errors (1, 2, 131000, 131016)
+RETRYABLE_CODES = frozenset({1, 2, 4, 80007, 130429, 131000, 131016, 131056})
+
+_session = None
+_lock = threading.Lock()
+_token = WHATSAPP_TOKEN
+_probe_thread = None
+_probe_stop = threading.Event()
+
+# Shared by every outbound path; half-open (next probe) after one interval
+breaker = CircuitBreaker(
+    "whatsapp",
+    reset_timeout=WHATSAPP_TOKEN_PROBE_INTERVAL_SECONDS,
+    open_reason=None if _token else "no token configured",
+)
+
+probes = {"runs": 0, "token_reloads": 0}
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WHATSAPP_POOL_SIZE, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {_token}",
+        "Content-Type": "application/json",
+    })
+    return session
+
+
+def get_session() -> requests.Session:
+    """The shared session (created on first use)."""
+    global _session
+    session = _session
+    if session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+            session = _session
+    return session
+
+
+def text_payload(to: str, text: str) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": text},
+    }
+
+
+def is_token_error(response: requests.Response) -> bool:
+    """401 with Graph code 190: the access token is invalid or expired."""
+    if response.status_code != 401:
+        return False
+    try:
+        return (response.json().get("error") or {}).get("code") == 190
+    except ValueError:
+        return False
+
+
+def send_text(to: str, text: str) -> requests.Response:
+    """
+    POST a text message over a pooled connection, through the breaker.
+
+    Returns:
+        The Graph response (status not checked; a token error opens the breaker)
+
+    Raises:
+        CircuitOpen: Refused without calling Graph (token missing or invalid)
+        requests.exceptions.RequestException: Connection error or timeout
+    """
+    if not _token or not breaker.allow():
+        raise CircuitOpen(f"token unusable ({breaker.reason})", retryable=True)
+    body = json.dumps(text_payload(to, text), ensure_ascii=False).encode()
+    response = get_session().post(MESSAGES_URL, data=body, timeout=TIMEOUT)
+    if response.ok:
+        breaker.record_success()
+    elif is_token_error(response):
+        breaker.record_failure("token invalid or expired (Graph code 190)")
+    return response
+
+
+class SendError(Exception):
+    """A send Graph did not accept; retryable if sending it again later may work."""
+
+    def __init__(self, message: str, retryable: bool = False, status: int = None, code: int = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+        self.code = code
+
+
+class CircuitOpen(SendError):
+    """The token is missing or invalid: nothing was sent, send again once the breaker closes."""
+
+
+def error_for(response: requests.Response) -> SendError:
+    """
+    SendError for a non-2xx Graph response.
+
+    Retryable: 429, 5xx and the RETRYABLE_CODES; anything else (bad number,
+    template or payload) fails the same way every time.
+    """
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        error = {}
+    code = error.get("code")
+    retryable = response.status_code == 429 or response.status_code >= 500 or code in RETRYABLE_CODES
+    message = f"HTTP {response.status_code}"
+    if code is not None:
+        message += f" code {code}: {error.get('message', '')}".rstrip(": ")
+    return SendError(message, retryable=retryable, status=response.status_code, code=code)
+
+
+def token() -> str:
+    """Token in use (None if not configured)."""
+    return _token
+
+
+def read_token() -> str:
+    """
+    Current token from its source: WHATSAPP_TOKEN_FILE if set, else
+    WHATSAPP_TOKEN in .env, else the token loaded at startup.
+    """
+    if WHATSAPP_TOKEN_FILE:
+        try:
+            return Path(WHATSAPP_TOKEN_FILE).read_text(encoding="utf-8").strip() or None
+        except OSError as e:
+            log.error("Cannot read WHATSAPP_TOKEN_FILE: %s", e)
+            return _token
+    env_file = find_dotenv(usecwd=True)
+    value = dotenv_values(env_file).get("WHATSAPP_TOKEN") if env_file else None
+    return value or _token
+
+
+def set_token(new_token: str) -> None:
+    """Use new_token from the next send on (the live session is updated in place)."""
+    global _token
+    with _lock:
+        _token = new_token
+        if _session is not None:
+            _session.headers["Authorization"] = f"Bearer {new_token}"
+
+
+def validate_token():
+    """
+    Check the token against Graph /me.
+
+    Returns:
+        True if valid, False if missing or refused, None if Graph could
+        not be reached (unknown)
+    """
+    if not _token:
+        return False
+    try:
+        response = get_session().get(ME_URL, timeout=TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        log.warning("Token validation failed to reach Graph: %s", e)
+        return None
+    if response.status_code == 200:
+        return True
+    log.error("Token validation returned %s", response.status_code, extra={"body": response.text})
+    return False
+
+
+def check_token() -> bool:
+    """
+    Validate the token and move the breaker accordingly (startup and probes).
+
+    An unreachable Graph leaves the breaker as it is.
+
+    Returns:
+        True if the breaker is closed afterwards
+    """
+    valid = validate_token()
+    if valid:
+        log.info("Token validated successfully")
+        breaker.record_success()
+    elif valid is False:
+        breaker.record_failure("no token configured" if not _token else "token invalid or expired")
+    return breaker.state == CLOSED
+
+
+def probe() -> bool:
+    """
+    One probe tick: reload the token if its source changed, then, while the
+    breaker is not closed, validate it (takes the half-open trial slot).
+
+    The reload comes first so a renewed token is in place before the trial
+    slot is taken, and a token rotated while closed is used right away.
+
+    Returns:
+        True if the breaker is closed afterwards
+    """
+    new_token = read_token()
+    if new_token and new_token != _token:
+        probes["token_reloads"] += 1
+        log.warning("WHATSAPP_TOKEN reloaded")
+        set_token(new_token)
+    if breaker.state == CLOSED:
+        return True
+    if not breaker.allow():
+        return False
+    probes["runs"] += 1
+    return check_token()
+
+
+def _probe_loop(validate: bool) -> None:
+    if validate and _token:
+        # Startup validation; the breaker stays closed until it answers
+        try:
+            check_token()
+        except Exception as e:
+            log.exception("Token validation failed: %s", e)
+    while not _probe_stop.wait(WHATSAPP_TOKEN_PROBE_INTERVAL_SECONDS):
+        try:
+            probe()
+        except Exception as e:
+            log.exception("Token probe failed: %s", e)
+
+
+def start_probes(validate: bool = False) -> None:
+    """
+    Start the background probe thread (no-op if running).
+
+    validate: check the configured token first, from the thread (startup)
+    """
+    global _probe_thread
+    with _lock:
+        if _probe_thread is not None:
+            return
+        _probe_stop.clear()
+        _probe_thread = threading.Thread(target=_probe_loop, args=(validate,), name="whatsapp-token-probe", daemon=True)
+        _probe_thread.start()
+
+
+def stop_probes() -> None:
+    global _probe_thread
+    with _lock:
+        thread, _probe_thread = _probe_thread, None
+    if thread is not None:
+        _probe_stop.set()
+        thread.join()
+
+
+def stats() -> dict:
+    """Breaker state and probe counters for the healthcheck."""
+    return {**breaker.stats(), **probes}
+
+
+def close() -> None:
+    """Close pooled connections; the next send opens a new session."""
+    global _session
+    with _lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
@@ -0,0 +1,240 @@
+"""
+Compiled multi-pattern keyword matching for intents and commands.
+
+A vocabulary maps intent names to keyword lists. KeywordMatcher compiles
+every keyword into a single regex built from a prefix trie, so one pass
+over the text finds all matched intents no matter how many keywords there
+are (a keyword costs nothing until the text reaches its first letters).
+Matching keeps the historical semantics: a keyword matches anywhere in the
+text as a substring.
+
+Matchers are immutable and built once: DEFAULT_MATCHER at import, custom
+per-commerce matchers when their vocabulary is configured. A commerce's
+vocabulary is stored in comercios.keywords (set it with
+`python -m app.keywords set`) and compiled on its first message; the
+running app picks up later changes on restart.
+"""
+
+import argparse
+import json
+import re
+import threading
+from app.log import get_logger
+from app.models import SessionLocal, Comercio
+
+SERVICE_QUERY_KEYWORDS = (
+    'precio', 'precios',
+    'servicio', 'servicios',
+    'cuanto',
+    'cuesta', 'cuestan',
+    'sale', 'salen'
+)
+
+APPOINTMENT_KEYWORDS = ('turno', 'turnos', 'reserva', 'reservar', 'cita')
+
+HOURS_QUERY_KEYWORDS = (
+    'abierto', 'abiertos', 'abierta',
+    'abren', 'cierran', 'cerrado',
+    'horario', 'horarios',
+    'atienden'
+)
+
+ACTIVATION_TRIGGERS = (
+    'activar cliente',
+    'activar contacto',
+    'contactar cliente',
+    'enviar mensaje a cliente',
+    'mensaje a cliente',
+    'escribirle a'
+)
+
+# Intent name -> keywords (already lowercase and without accents)
+DEFAULT_VOCABULARY = {
+    "services": SERVICE_QUERY_KEYWORDS,
+    "appointment": APPOINTMENT_KEYWORDS,
+    "hours": HOURS_QUERY_KEYWORDS,
+    "activation": ACTIVATION_TRIGGERS,
+}
+
+
+def _trie_pattern(words) -> str:
+    """
+    Regex matching any of words, factored by common prefixes.
+
+    Optional tails are greedy, so the longest keyword starting at a
+    position wins: "servicio(?:s)?" matches "servicios" before "servicio".
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    All intents of a vocabulary found in one pass over a text.
+
+    Usage:
+        matcher = KeywordMatcher({"services": ["precio"], "appointment": ["turno"]})
+        matcher.match("precio del turno")  # frozenset({"services", "appointment"})
+    """
+
+    def __init__(self, vocabulary: dict):
+        by_keyword = {}
+        for intent, keywords in vocabulary.items():
+            for keyword in keywords:
+                if keyword:
+                    by_keyword.setdefault(keyword, set()).add(intent)
+
+        # The regex reports the longest keyword at each position; every other
+        # keyword starting there is one of its prefixes, so precompute the
+        # intents of all keyword prefixes of each keyword
+        self._intents = {}
+        for keyword in by_keyword:
+            intents = set()
+            for end in range(1, len(keyword) + 1):
+                intents |= by_keyword.get(keyword[:end], set())
+            self._intents[keyword] = frozenset(intents)
+
+        self.intents = frozenset(intent for intents in by_keyword.values() for intent in intents)
+        self.size = len(by_keyword)
+        # Zero-width lookahead: overlapping matches are all reported
+        self._pattern = re.compile(f"(?=({_trie_pattern(by_keyword)}))") if by_keyword else None
+
+    def match(self, text: str) -> frozenset:
+        """Intents with at least one keyword contained in text."""
+        if self._pattern is None:
+            return frozenset()
+
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._intents[match.group(1)]
+            if len(found) == len(self.intents):
+                break
+        return frozenset(found)
+
+
+DEFAULT_MATCHER = KeywordMatcher(DEFAULT_VOCABULARY)
+
+# comercio_id -> matcher with that commerce's custom keywords added
+_matchers = {}
+_lock = threading.Lock()
+
+log = get_logger("keywords")
+
+
+def set_custom_vocabulary(comercio_id: int, vocabulary: dict) -> KeywordMatcher:
+    """
+    Compile the default vocabulary plus custom keywords of a commerce.
+
+    Call when the commerce's vocabulary is configured or changes; messages
+    only look the compiled matcher up.
+
+    Args:
+        comercio_id: Commerce id
+        vocabulary: Intent name -> extra keywords (any case, accents allowed)
+
+    Returns:
+        The compiled matcher
+    """
+    from app.message_context import normalize_text
+
+    merged = {intent: list(keywords) for intent, keywords in DEFAULT_VOCABULARY.items()}
+    for intent, keywords in vocabulary.items():
+        merged.setdefault(intent, []).extend(normalize_text(k).strip() for k in keywords)
+
+    matcher = KeywordMatcher(merged)
+    with _lock:
+        _matchers[comercio_id] = matcher
+    log.info("Compiled %d keyword(s) for comercio %s", matcher.size, comercio_id)
+    return matcher
+
+
+def _load_vocabulary(comercio_id: int) -> dict:
+    """
+    Stored custom vocabulary of a commerce ({} if none).
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns {} (default vocabulary) on error or malformed JSON
+    """
+    try:
+        db = SessionLocal()
+        try:
+            stored = db.query(Comercio.keywords).filter(Comercio.id == comercio_id).scalar()
+        finally:
+            db.close()
+        vocabulary = json.loads(stored) if stored else {}
+        if not isinstance(vocabulary, dict):
+            raise ValueError(f"expected an object, got {type(vocabulary).__name__}")
+        return vocabulary
+    except Exception as e:
+        log.error("Failed to load keywords for comercio %s: %s", comercio_id, e)
+        return {}
+
+
+def matcher_for(comercio_id) -> KeywordMatcher:
+    """
+    Matcher of a commerce: compiled from its stored vocabulary on first use,
+    DEFAULT_MATCHER if it has none.
+    """
+    if comercio_id is None:
+        return DEFAULT_MATCHER
+    matcher = _matchers.get(comercio_id)
+    if matcher is not None:
+        return matcher
+
+    vocabulary = _load_vocabulary(comercio_id)
+    if vocabulary:
+        return set_custom_vocabulary(comercio_id, vocabulary)
+    with _lock:
+        return _matchers.setdefault(comercio_id, DEFAULT_MATCHER)
+
+
+def clear() -> None:
+    """Drop every custom matcher."""
+    with _lock:
+        _matchers.clear()
+
+
+def main(argv=None) -> None:
+    from app.models import init_db
+    from app.persistence import save_comercio_keywords
+
+    parser = argparse.ArgumentParser(prog="python -m app.keywords", description="Vocabulario propio de un comercio")
+    commands = parser.add_subparsers(dest="command", required=True)
+    set_command = commands.add_parser("set", help="Reemplazar las keywords extra de una intención")
+    set_command.add_argument("comercio_id", type=int)
+    set_command.add_argument("intent", help=f"Intención ({', '.join(sorted(DEFAULT_VOCABULARY))})")
+    set_command.add_argument("keywords", nargs="*", help="Keywords extra (ninguna: borra la intención)")
+    show = commands.add_parser("show", help="Mostrar el vocabulario propio")
+    show.add_argument("comercio_id", type=int)
+    args = parser.parse_args(argv)
+    init_db()
+
+    vocabulary = _load_vocabulary(args.comercio_id)
+    if args.command == "set":
+        if args.keywords:
+            vocabulary[args.intent] = args.keywords
+        else:
+            vocabulary.pop(args.intent, None)
+        if not save_comercio_keywords(args.comercio_id, vocabulary):
+            parser.error(f"no existe el comercio {args.comercio_id}")
+        print(f"Comercio {args.comercio_id}: guardado (se aplica al reiniciar la app)")
+    for intent, keywords in sorted(vocabulary.items()):
+        print(f"{intent}: {', '.join(keywords)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Structured, sampled, asynchronous logging.
+
+Modules log through get_logger(category) ("webhook", "engine",
+"persistence", ...), a stdlib logger named "nordia.<category>". Records:
+- are filtered by level (LOG_LEVEL) and, below WARNING, sampled per
+  category (LOG_SAMPLING="engine=0.1,webhook=0.01"); warnings and errors
+  are always kept
+- are put on a bounded in-memory queue by the calling thread, which never
+  blocks: when the queue is full the record is dropped and counted
+- are formatted and written by a background thread, as JSON lines
+  (LOG_FORMAT=json) or plain text
+
+Structured fields go in extra=, message arguments are merged lazily:
+
+    log.info("message sent to %s", to, extra={"status": 200})
+
+LOG_ASYNC=false writes from the calling thread instead (debugging).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came from extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_lock = threading.Lock()
+_configured = False
+_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, category, msg, extra fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": record.name.removeprefix("nordia."),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """[LEVEL category] message key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        line = f"[{record.levelname} {record.name.removeprefix('nordia.')}] {record.getMessage()}"
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG/INFO records per category; WARNING and above always pass."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name.removeprefix("nordia."), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the writer thread."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout (follows redirection and test capture)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def parse_sampling(spec: str) -> dict:
+    """
+    Parse "category=rate,..." into a dict; invalid entries are ignored.
+
+    Examples:
+        >>> parse_sampling("engine=0.1, webhook=0.01")
+        {'engine': 0.1, 'webhook': 0.01}
+    """
+    rates = {}
+    for item in spec.split(","):
+        category, _, rate = item.partition("=")
+        try:
+            rates[category.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def _configure(config) -> None:
+    global _configured, _handler, _listener
+
+    writer = StdoutHandler()
+    writer.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    if config.LOG_ASYNC:
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_handler.queue, writer)
+        _listener.start()
+        atexit.register(shutdown)
+    else:
+        _handler = writer
+    _handler.addFilter(SamplingFilter(parse_sampling(config.LOG_SAMPLING)))
+
+    base = logging.getLogger("nordia")
+    base.setLevel(getattr(logging, config.LOG_LEVEL, logging.INFO))
+    base.addHandler(_handler)
+    _configured = True
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger for one category; configures the "nordia" logger on first use."""
+    if not _configured:
+        # Importing the settings may itself configure logging (config logs too)
+        from app import config
+        with _lock:
+            if not _configured:
+                _configure(config)
+    return logging.getLogger(f"nordia.{category}")
+
+
+def flush() -> None:
+    """Block until queued records are written (tests, shutdown)."""
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def shutdown() -> None:
+    """Write what is queued and stop the writer thread."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        # Later records are written from the calling thread
+        writer = listener.handlers[0]
+        for sampler in _handler.filters:
+            writer.addFilter(sampler)
+        base = logging.getLogger("nordia")
+        base.removeHandler(_handler)
+        base.addHandler(writer)
+
+
+def stats() -> dict:
+    """Counters for the healthcheck."""
+    queued = isinstance(_handler, DroppingQueueHandler)
+    return {
+        "async": queued and _listener is not None,
+        "queued": _handler.queue.qsize() if queued else 0,
+        "dropped": getattr(_handler, "dropped", 0),
+    }
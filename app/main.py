@@ -1,90 +1,176 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import requests
-from datetime import datetime
-from app.config import APP_NAME, WHATSAPP_TOKEN, WHATSAPP_PHONE_NUMBER_ID, WHATSAPP_API_VERSION, TOKEN_IS_VALID, TOKEN_INVALID_SINCE
+from app.config import APP_NAME
+from app.config import (
+    WHATSAPP_SEND_WORKERS,
+    WEBHOOK_MODE,
+    WEBHOOK_WORKERS,
+    WEBHOOK_QUEUE_MAX,
+    WEBHOOK_DRAIN_TIMEOUT_SECONDS,
+    WEBHOOK_MAX_BODY_BYTES,
+    OUTBOUND_MODE,
+)
 from app.engine import handle_message
-from app.state import conversaciones  # Load persisted state
-import app.config as config
-
-app = FastAPI(title=APP_NAME)
+from app.message_context import MessageContext
+from app.payload import InboundMessage, PayloadError, PayloadTooLarge, decode, extract
+import app.engine as engine
+from app.state import conversaciones, STATE_BACKEND, cache_stats, get_conversation, flush as flush_state, load as load_state
+from app.work_queue import WorkQueue
+from app import dedup, delivery, graph_client, outbox, rate_limit
+from app.graph_client import CircuitOpen, SendError
+from app.models import init_db
+from app import log as logs
+from app.log import get_logger
+
+log = get_logger("webhook")
+send_log = get_logger("whatsapp")
+
+if WEBHOOK_MODE not in ("queued", "inline"):
+    log.warning("Unknown WEBHOOK_MODE=%r, using queued", WEBHOOK_MODE)
+    WEBHOOK_MODE = "queued"
+
+if OUTBOUND_MODE not in ("outbox", "direct"):
+    log.warning("Unknown OUTBOUND_MODE=%r, using outbox", OUTBOUND_MODE)
+    OUTBOUND_MODE = "outbox"
+
+# Outbound sends run here so a slow Graph API never blocks the event loop
+_send_pool = None
+_send_pool_lock = threading.Lock()
+
+
+def _get_send_pool() -> ThreadPoolExecutor:
+    global _send_pool
+    with _send_pool_lock:
+        if _send_pool is None:
+            _send_pool = ThreadPoolExecutor(max_workers=WHATSAPP_SEND_WORKERS, thread_name_prefix="whatsapp-send")
+        return _send_pool
+
+
+def _shutdown_send_pool() -> None:
+    """Wait for in-flight sends; a new pool is created on next use."""
+    global _send_pool
+    with _send_pool_lock:
+        pool, _send_pool = _send_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    load_state()
+    dedup.load()
+    delivery.load()
+    # Token validated in the background: startup doesn't wait on Graph.
+    # Probes then close the breaker once a valid token is loaded
+    graph_client.start_probes(validate=True)
+    if WEBHOOK_MODE == "queued":
+        inbox.start()
+    if OUTBOUND_MODE == "outbox":
+        outbox.start()
+    yield
+    # Answer what was already acknowledged before exiting
+    inbox.stop(timeout=WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+    # Unsent replies stay in the table for the next start
+    outbox.stop(timeout=WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+    _shutdown_send_pool()
+    graph_client.stop_probes()
+    graph_client.close()
+    dedup.flush()
+    delivery.flush()
+    # Grouped durability: write mutations still waiting for the flusher
+    written = flush_state()
+    log.info("Shutdown: flushed %d pending conversation(s)", written)
+
+
+app = FastAPI(title=APP_NAME, lifespan=lifespan)
 
 VERIFY_TOKEN = "nordia_verify_token"
 
-def send_whatsapp_message(to: str, text: str):
+NON_TEXT_REPLY = "Por ahora solo puedo procesar mensajes de texto 📝. Por favor escribí tu respuesta."
+
+def deliver(to: str, text: str) -> dict:
     """
     Send WhatsApp message via Cloud API
-    DEGRADED MODE: Blocks sending if token is invalid
-    """
-    if not WHATSAPP_TOKEN:
-        print(f"[WhatsApp DEGRADED] No token configured, skipping message to {to}")
-        print(f"[WhatsApp DEGRADED] Would have sent: {text}")
-        return None
+    DEGRADED MODE: refused while the token breaker is open
 
-    if not TOKEN_IS_VALID:
-        print(f"[WhatsApp DEGRADED] Token invalid/expired - BLOCKING send to {to}")
-        print(f"[WhatsApp DEGRADED] Would have sent: {text}")
-        print(f"[WhatsApp DEGRADED] ACTION REQUIRED: Update WHATSAPP_TOKEN and restart")
-        return None
+    Returns:
+        Graph response body (contains the wamid)
 
-    url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{WHATSAPP_PHONE_NUMBER_ID}/messages"
+    Raises:
+        SendError: Not sent; retryable tells the outbox whether to try again
+            (CircuitOpen: token missing or invalid, nothing reached Graph)
+    """
+    try:
+        # Pooled keep-alive connection, prebuilt URL and headers, token breaker
+        response = graph_client.send_text(to, text)
+    except CircuitOpen as e:
+        send_log.warning("DEGRADED: %s - BLOCKING send to %s", e, to, extra={"text": text})
+        raise
+    except requests.exceptions.Timeout as e:
+        send_log.error("Timeout sending to %s: %s", to, e)
+        raise SendError(f"timeout: {e}", retryable=True)
+    except requests.exceptions.RequestException as e:
+        send_log.error("Failed to send to %s: %s", to, e)
+        raise SendError(str(e), retryable=True)
+
+    send_log.debug("Graph response %s", response.status_code, extra={"body": response.text})
+    if response.ok:
+        send_log.info("Message sent to %s", to)
+        return response.json()
 
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
+    send_log.error("HTTP %s sending to %s", response.status_code, to, extra={"body": response.text})
+    if graph_client.is_token_error(response):
+        # The breaker opened: not the message's fault, send it again once it closes
+        raise CircuitOpen("token invalid or expired (Graph code 190)", retryable=True, status=401, code=190)
+
+    error = graph_client.error_for(response)
+    send_log.error("Failed to send to %s: %s", to, error)
+    raise error
 
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to,
-        "type": "text",
-        "text": {
-            "body": text
-        }
-    }
 
+def send_whatsapp_message(to: str, text: str):
+    """Send once, without retries: the Graph response, or None if it was not accepted."""
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        print(f"[DEBUG] Response status: {response.status_code}")
-        print(f"[DEBUG] Response body: {response.text}")
-        response.raise_for_status()
-        print(f"[WhatsApp] ✓ Message sent to {to}: {text}")
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        error_data = response.json() if response.text else {}
-        error_code = error_data.get("error", {}).get("code")
-        error_subcode = error_data.get("error", {}).get("error_subcode")
-
-        print(f"[WhatsApp ERROR] HTTP {response.status_code}: {response.text}")
-
-        # Token expiration detection - freeze system immediately
-        if response.status_code == 401 and error_code in (190,):
-            config.TOKEN_IS_VALID = False
-            config.TOKEN_INVALID_SINCE = datetime.now()
-            print(f"[WhatsApp CRITICAL] TOKEN EXPIRED - Code: {error_code}, Subcode: {error_subcode}")
-            print(f"[WhatsApp CRITICAL] Invalid since: {config.TOKEN_INVALID_SINCE.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"[WhatsApp CRITICAL] System entering DEGRADED MODE - blocking all sends")
-            print(f"[WhatsApp CRITICAL] Update WHATSAPP_TOKEN immediately to avoid WABA suspension")
-
-        print(f"[WhatsApp ERROR] Failed to send to {to}: {e}")
+        return deliver(to, text)
+    except SendError:
         return None
     except Exception as e:
-        print(f"[WhatsApp ERROR] Failed to send to {to}: {e}")
+        send_log.error("Failed to send to %s: %s", to, e)
         return None
 
+
+async def send_whatsapp_message_async(to: str, text: str):
+    """
+    Run send_whatsapp_message in the bounded send pool.
+
+    The blocking HTTP call happens in a worker thread; the event loop keeps
+    serving other webhooks while it waits on the Graph API.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_send_pool(), send_whatsapp_message, to, text)
+
 @app.get("/")
 def healthcheck():
-    mode = "operational" if TOKEN_IS_VALID else "degraded"
+    breaker = graph_client.stats()
+    can_send = breaker["state"] == "closed"
+    mode = "operational" if can_send else "degraded"
 
     whatsapp_status = {
-        "token_valid": TOKEN_IS_VALID,
-        "can_send": TOKEN_IS_VALID,
-        "can_receive": True
+        "token_valid": can_send,
+        "can_send": can_send,
+        "can_receive": True,
+        "breaker": breaker
     }
 
     # Include timestamp if token is invalid
-    if TOKEN_INVALID_SINCE:
-        whatsapp_status["invalid_since"] = TOKEN_INVALID_SINCE.strftime('%Y-%m-%d %H:%M:%S')
+    if breaker["open_since"]:
+        whatsapp_status["invalid_since"] = breaker["open_since"]
 
     return {
         "status": "ok",
@@ -93,8 +179,21 @@ def healthcheck():
         "whatsapp": whatsapp_status,
         "conversations": {
             "active": len(conversaciones),
-            "persisted": True
-        }
+            "persisted": True,
+            "backend": STATE_BACKEND,
+            "cache": cache_stats(),
+            "stateless_hits": engine.stateless_hits
+        },
+        "webhook": {
+            "mode": WEBHOOK_MODE,
+            **webhook_counters,
+            "queue": inbox.stats(),
+            "dedup": dedup.stats(),
+            "rate_limit": rate_limit.stats()
+        },
+        "outbox": outbox.stats(),
+        "delivery": delivery.stats(),
+        "logging": logs.stats()
     }
 
 @app.get("/webhook")
@@ -105,66 +204,154 @@ async def verify_webhook(request: Request):
     token = params.get("hub.verify_token")
 
     if mode == "subscribe" and token == "nordia_verify_token":
-        print("[Webhook] Verified successfully")
+        log.info("Verified successfully")
         return PlainTextResponse(challenge, status_code=200)
 
     return PlainTextResponse("Forbidden", status_code=403)
 
-@app.post("/webhook")
-async def receive_webhook(payload: dict):
-    print("=== WEBHOOK HIT ===")
-    print("INCOMING WEBHOOK:", payload)
+def reply_for(message: InboundMessage):
+    """
+    Engine reply for one WhatsApp message, None if it was rate limited.
 
-    try:
-        # Extract message data from WhatsApp payload
-        entry = payload.get("entry", [])
-        if not entry:
-            print("[DEBUG] No entry in payload")
-            return {"status": "ok"}
+    Blocking (reads and writes conversation state): runs in a queue
+    worker, or inside the request in inline mode.
+    """
+    sender = message.sender
 
-        changes = entry[0].get("changes", [])
-        if not changes:
-            print("[DEBUG] No changes in entry")
-            return {"status": "ok"}
+    # Handle non-text messages (image, audio, video, sticker, etc.)
+    if message.type != "text":
+        log.info("Non-text message", extra={"type": message.type, "sender": sender})
+        # Never reaches the engine, so take its token here
+        return NON_TEXT_REPLY if rate_limit.admit(sender, "CUSTOMER") else None
 
-        value = changes[0].get("value", {})
-        messages = value.get("messages", [])
+    log.debug("Text received", extra={"sender": sender, "text": message.text})
 
-        if not messages:
-            print("[DEBUG] No messages in value")
-            return {"status": "ok"}
+    # Process message through engine (text analyzed once for every layer)
+    reply = handle_message(sender, MessageContext(message.text))
+    log.debug("Reply", extra={"sender": sender, "reply": reply})
+    return reply
 
-        message = messages[0]
-        sender = message.get("from")
-        message_type = message.get("type")
 
-        print(f"[Webhook] Message from: {sender}, type: {message_type}")
+def record_sent(to: str, result) -> None:
+    """Track the wamid of an accepted send so its status callbacks can be correlated."""
+    if not isinstance(result, dict):
+        return
+    for sent in result.get("messages") or []:
+        delivery.record_sent(sent.get("id"), to, get_conversation(to).get("comercio_id"))
 
-        # Handle non-text messages (image, audio, video, sticker, etc.)
-        if message_type != "text":
-            print(f"[WEBHOOK] Non-text message: type={message_type} from={sender}")
-            reply = "Por ahora solo puedo procesar mensajes de texto 📝. Por favor escribí tu respuesta."
-            send_whatsapp_message(sender, reply)
-            return {"status": "ok"}
 
-        # Process text messages
-        if message_type == "text":
-            text_body = message.get("text", {}).get("body", "")
-            print(f"[Webhook] Text received: {text_body}")
+def send_reply(to: str, text: str) -> None:
+    """Blocking: enqueue the reply in the outbox, or send it right away in direct mode."""
+    if OUTBOUND_MODE == "outbox":
+        outbox.enqueue(to, text, get_conversation(to).get("comercio_id"))
+    else:
+        record_sent(to, send_whatsapp_message(to, text))
+
+
+async def send_reply_async(to: str, text: str) -> None:
+    """send_reply in the bounded send pool (the insert or send blocks)."""
+    if OUTBOUND_MODE == "outbox":
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_get_send_pool(), send_reply, to, text)
+    else:
+        record_sent(to, await send_whatsapp_message_async(to, text))
+
+
+def process_batch(messages: list) -> None:
+    """Queue worker: run the engine and send a reply for each message of one sender, in order."""
+    for message in messages:
+        reply = reply_for(message)
+        if reply is not None:
+            send_reply(message.sender, reply)
+
+
+def group_by_sender(messages) -> dict:
+    """sender -> its messages, senders and messages in arrival order."""
+    groups = {}
+    for message in messages:
+        groups.setdefault(message.sender, []).append(message)
+    return groups
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Raw request body, refused as soon as it passes max_bytes (0 = no limit).
+
+    A declared Content-Length over the limit is refused without reading;
+    chunked bodies are counted while they stream in.
+    """
+    declared = request.headers.get("content-length", "")
+    if max_bytes and declared.isdigit() and int(declared) > max_bytes:
+        raise PayloadTooLarge(f"Content-Length {declared} exceeds {max_bytes}")
+
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise PayloadTooLarge(f"body exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+outbox.configure(deliver, on_sent=record_sent)
+inbox = WorkQueue(process_batch, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_MAX, name="webhook")
+
+# Webhook requests received and messages extracted from them
+webhook_counters = {"requests": 0, "messages": 0}
+
 
-            print("=== TRYING TO SEND MESSAGE ===")
-            print(f"[DEBUG] Token loaded: {WHATSAPP_TOKEN is not None}")
-            print(f"[DEBUG] Token length: {len(WHATSAPP_TOKEN) if WHATSAPP_TOKEN else 0}")
-            print(f"[DEBUG] Phone Number ID: {WHATSAPP_PHONE_NUMBER_ID}")
+@app.post("/webhook")
+async def receive_webhook(request: Request):
+    # Raw body and a handful of fields: no model parsing of the whole payload
+    try:
+        payload = decode(await read_body(request, WEBHOOK_MAX_BODY_BYTES))
+    except PayloadTooLarge as e:
+        log.warning("Refused webhook: %s", e)
+        return JSONResponse({"status": "too_large"}, status_code=413)
+    except PayloadError as e:
+        log.warning("Refused webhook: %s", e)
+        return JSONResponse({"status": "invalid"}, status_code=400)
+
+    log.debug("Webhook hit", extra={"payload": payload})
 
-            # Process message through engine
-            reply = handle_message(sender, text_body)
-            print(f"[ENGINE] Reply => {reply}")
+    try:
+        batch = extract(payload)
+
+        # Status callbacks only join the next batched write
+        if batch.statuses:
+            delivery.ingest(batch.statuses)
+
+        # Meta batches several entries/changes/messages under load, and
+        # redelivers messages whose webhook was slow: skip ids already seen
+        groups = group_by_sender(m for m in batch.messages if dedup.claim(m.id))
+        webhook_counters["requests"] += 1
+        if not groups:
+            log.debug("No new messages in payload")
+            return {"status": "ok"}
 
-            send_whatsapp_message(sender, reply)
+        for sender, messages in groups.items():
+            webhook_counters["messages"] += len(messages)
+            log.info("%d message(s) from %s", len(messages), sender)
+
+        # Acknowledge first: Meta retries webhooks that don't get a fast 200
+        if WEBHOOK_MODE == "queued":
+            rejected = [messages for sender, messages in groups.items() if not inbox.submit(sender, messages)]
+            if rejected:
+                # Not processed: accept their redelivery
+                for messages in rejected:
+                    for message in messages:
+                        dedup.release(message.id)
+                # Full queue: a non-200 makes Meta redeliver the payload later
+                return JSONResponse({"status": "busy"}, status_code=503)
+            return {"status": "ok"}
 
+        for sender, messages in groups.items():
+            for message in messages:
+                reply = reply_for(message)
+                if reply is not None:
+                    await send_reply_async(sender, reply)
         return {"status": "ok"}
 
     except Exception as e:
-        print(f"[Webhook ERROR] {e}")
+        log.exception("Failed to process webhook: %s", e)
         return {"status": "ok"}
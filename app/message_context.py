@@ -0,0 +1,114 @@
+"""
+Per-message analysis context.
+
+One inbound text is looked at by several layers (dispatcher, engine,
+customer handlers), each needing the same derived forms: stripped,
+lowercase, accent-free, split into words, matched against keywords.
+MessageContext wraps the text once per webhook message and computes each
+form lazily on first use, so no layer repeats the work of another.
+
+MessageContext is a str subclass equal to the raw text, so code that only
+needs the text (validators, logging, mocks in tests) takes it unchanged.
+"""
+
+import unicodedata
+from functools import cached_property
+from app.keywords import DEFAULT_MATCHER
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for keyword matching: lowercase + remove accents.
+
+    Args:
+        text: Input text to normalize
+
+    Returns:
+        Normalized text (lowercase, no accents)
+
+    Examples:
+        >>> normalize_text("CUÁNTO")
+        'cuanto'
+        >>> normalize_text("Precio")
+        'precio'
+    """
+    # Remove accents using Unicode normalization
+    nfkd = unicodedata.normalize('NFKD', text)
+    without_accents = ''.join([c for c in nfkd if not unicodedata.combining(c)])
+    return without_accents.lower()
+
+
+class MessageContext(str):
+    """
+    Text of one message plus its derived forms, each computed at most once.
+
+    Attributes:
+        raw: Text as received
+        stripped: Without surrounding whitespace
+        lowered: Stripped and lowercase (command matching)
+        normalized: Lowercase without accents (keyword matching)
+        words: Stripped text split on whitespace
+        intents: Intents of DEFAULT_MATCHER found in normalized
+        asks_services / asks_appointment / asks_hours / asks_activation:
+            Keyword flags derived from intents
+    """
+
+    def __new__(cls, text: str):
+        return super().__new__(cls, text or "")
+
+    def __repr__(self) -> str:
+        return f"MessageContext({self.raw!r})"
+
+    @cached_property
+    def raw(self) -> str:
+        return str(self)
+
+    @cached_property
+    def stripped(self) -> str:
+        return self.raw.strip()
+
+    @cached_property
+    def lowered(self) -> str:
+        return self.stripped.lower()
+
+    @cached_property
+    def normalized(self) -> str:
+        return normalize_text(self.raw)
+
+    @cached_property
+    def words(self) -> list:
+        return self.stripped.split()
+
+    @cached_property
+    def intents(self) -> frozenset:
+        return DEFAULT_MATCHER.match(self.normalized)
+
+    def intents_for(self, matcher) -> frozenset:
+        """Intents of another matcher (e.g. a commerce vocabulary), memoized per matcher."""
+        if matcher is DEFAULT_MATCHER:
+            return self.intents
+        cache = self.__dict__.setdefault("_matched", {})
+        if matcher not in cache:
+            cache[matcher] = matcher.match(self.normalized)
+        return cache[matcher]
+
+    @property
+    def asks_services(self) -> bool:
+        return "services" in self.intents
+
+    @property
+    def asks_appointment(self) -> bool:
+        return "appointment" in self.intents
+
+    @property
+    def asks_hours(self) -> bool:
+        return "hours" in self.intents
+
+    @property
+    def asks_activation(self) -> bool:
+        return "activation" in self.intents
+
+
+def as_context(text) -> MessageContext:
+    """Reuse a MessageContext, or wrap a plain string in a new one."""
+    return text if isinstance(text, MessageContext) else MessageContext(text)
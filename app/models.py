@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime
+import threading
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, ForeignKey, Date, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
-from app.config import DB_PATH
+from app.config import DB_PATH, SQLITE_SYNCHRONOUS
 
 Base = declarative_base()
 
@@ -14,15 +15,23 @@ class Comercio(Base):
     nombre = Column(String, nullable=False)
     horarios = Column(Text)
     servicios = Column(Text)
+    # Vocabulario propio: JSON intención -> keywords extra (ver app.keywords)
+    keywords = Column(Text)
 
 class Turno(Base):
     __tablename__ = "turnos"
+    __table_args__ = (
+        Index("ix_turnos_comercio_fecha_hora", "comercio_id", "fecha", "hora"),
+        Index("ix_turnos_comercio_dia", "comercio_id", "dia"),
+    )
 
     id = Column(Integer, primary_key=True)
     comercio_id = Column(Integer, ForeignKey("comercios.id"))
     cliente_nombre = Column(String)
-    cliente_telefono = Column(String)
+    cliente_telefono = Column(String, index=True)
     fecha = Column(String)
+    # fecha resuelta a un día calendario al reservar (None si no se pudo)
+    dia = Column(Date)
     hora = Column(String)
     servicio = Column(String)
 
@@ -38,17 +47,180 @@ class MessageDraft(Base):
     """
     Message drafts para activación manual de clientes.
 
-    Almacena los mensajes preparados antes de enviar a WhatsApp.
+    Almacena los mensajes preparados antes de enviar a WhatsApp. La campaña
+    (app.campaign) envía los pendientes con teléfono: status pasa de
+    pending a sent o failed.
     """
     __tablename__ = "message_drafts"
+    __table_args__ = (
+        Index("ix_message_drafts_status_id", "status", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     customer_name = Column(String, nullable=False)
     commercial_intent = Column(Text, nullable=False)
     generated_message = Column(Text, nullable=False)
+    customer_phone = Column(String)
+    status = Column(String, nullable=False, server_default="pending")
+    sent_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+class ConversationState(Base):
+    """
+    Estado conversacional por teléfono (backend sqlite).
+
+    Una fila por teléfono; data guarda el dict de la conversación en JSON.
+    """
+    __tablename__ = "conversation_state"
+
+    phone = Column(String, primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+class ProcessedMessage(Base):
+    """
+    Ids de mensajes entrantes ya procesados (deduplicación de webhooks).
+
+    Meta reenvía el mismo mensaje si el webhook tarda; la tabla permite
+    reconocer reenvíos también después de un reinicio.
+    """
+    __tablename__ = "processed_messages"
+
+    message_id = Column(String, primary_key=True)
+    received_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class OutboundMessage(Base):
+    """
+    Mensajes enviados por la Cloud API y su estado de entrega.
+
+    wamid es el id que devuelve Graph al enviar; los callbacks de estado
+    (value.statuses) lo referencian. El estado avanza sent → delivered → read
+    (o failed) y cada paso guarda su timestamp.
+    """
+    __tablename__ = "outbound_messages"
+
+    wamid = Column(String, primary_key=True)
+    comercio_id = Column(Integer, ForeignKey("comercios.id"), index=True)
+    to_phone = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="sent")
+    sent_at = Column(DateTime(timezone=True), nullable=False)
+    delivered_at = Column(DateTime(timezone=True))
+    read_at = Column(DateTime(timezone=True))
+    failed_at = Column(DateTime(timezone=True))
+    error_code = Column(Integer)
+
+class CampaignCheckpoint(Base):
+    """
+    Progreso de una campaña de drafts: último id procesado y contadores.
+
+    Se escribe en la misma transacción que los estados de cada lote, así
+    una campaña pausada o interrumpida retoma exactamente donde quedó.
+    """
+    __tablename__ = "campaign_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="running")
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+class OutboxMessage(Base):
+    """
+    Cola durable de mensajes salientes (respuestas todavía no enviadas).
+
+    Una fila por mensaje hasta que Graph lo acepta. Los errores transitorios
+    reprograman next_attempt_at con backoff; los permanentes mueven la fila
+    a dead_letters.
+    """
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_to_phone_id", "to_phone", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    to_phone = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    comercio_id = Column(Integer, ForeignKey("comercios.id"))
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_error = Column(Text)
+
+class DeadLetter(Base):
+    """
+    Mensajes salientes que fallaron de forma permanente o agotaron los reintentos.
+
+    Quedan para revisión; `python -m app.outbox replay` los vuelve a encolar.
+    """
+    __tablename__ = "dead_letters"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    to_phone = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    comercio_id = Column(Integer, ForeignKey("comercios.id"))
+    attempts = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    failed_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(Text)
 
 engine = create_engine(f"sqlite:///{DB_PATH}")
-Base.metadata.create_all(engine)
+
+# Durability of every table in nordia.db (see config.SQLITE_SYNCHRONOUS);
+# an unknown value falls back to FULL, the safe one
+_SYNCHRONOUS = SQLITE_SYNCHRONOUS if SQLITE_SYNCHRONOUS in ("NORMAL", "FULL", "EXTRA") else "FULL"
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: readers don't block the writer, commits append instead of rewriting pages
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={_SYNCHRONOUS}")
+    cursor.close()
+
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _add_missing_columns(table) -> None:
+    """ALTER TABLE ADD COLUMN for columns added to the model after the table was created."""
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+            # SQLite only accepts NOT NULL on an added column with a default
+            if column.server_default is not None:
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+            connection.execute(text(ddl))
+
+
+def init_db() -> None:
+    """
+    Crea el schema una vez por proceso: tablas faltantes, y después las
+    columnas e índices agregados más tarde (create_all no toca tablas que ya
+    existen).
+
+    No corre al importar: la app lo llama desde el lifespan y los CLIs desde main().
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        Base.metadata.create_all(engine)
+        _add_missing_columns(Comercio.__table__)
+        _add_missing_columns(Turno.__table__)
+        _add_missing_columns(MessageDraft.__table__)
+        for index in (*Turno.__table__.indexes, *MessageDraft.__table__.indexes):
+            index.create(engine, checkfirst=True)
+        _initialized = True
+
 
 SessionLocal = sessionmaker(bind=engine)
@@ -0,0 +1,317 @@
+"""
+Durable outbound queue (outbox) for WhatsApp replies.
+
+Replies are inserted into outbox_messages and sent by a dispatcher thread
+plus OUTBOX_WORKERS send threads, so a slow or throttling Graph API never
+holds a webhook worker and an accepted reply survives a restart:
+
+- pacing: sends are spaced 1/OUTBOX_RATE_PER_SECOND apart across all
+  workers, the throughput tier of the business phone number
+- ordering: only the oldest pending message of each phone is sent; the next
+  one waits until it is accepted or dead-lettered (retries included)
+- retries: transient errors (timeouts, connection errors, 429, 5xx,
+  throttling codes) are rescheduled with jittered exponential backoff;
+  permanent errors, or OUTBOX_MAX_ATTEMPTS failures, move the message to
+  dead_letters
+- token breaker: while graph_client.breaker is not closed nothing is
+  dispatched and refused sends don't count as attempts; the queue is
+  flushed as soon as the breaker closes
+
+Dead letters are re-enqueued with:
+
+    python -m app.outbox replay [ids...] | --all
+    python -m app.outbox stats
+
+Delivery is at-least-once: a crash between Graph accepting a message and
+its row being deleted sends it again on restart. A single process drains
+the table (in-flight rows are tracked in memory).
+
+Defensive behavior:
+- enqueue() only inserts and wakes the dispatcher; it never calls Graph
+- A failing send callback or on_sent hook is logged, the worker keeps running
+- Throughput (sends/s over the last minute) and lag (age of the oldest
+  pending message) for the healthcheck
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from app.config import (
+    OUTBOX_WORKERS,
+    OUTBOX_RATE_PER_SECOND,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_BACKOFF_BASE_SECONDS,
+    OUTBOX_BACKOFF_MAX_SECONDS,
+    OUTBOX_POLL_INTERVAL_MS,
+)
+from app import graph_client
+from app.graph_client import CircuitOpen, SendError
+from app.log import get_logger
+from app.models import init_db
+from app.rate_limit import Pacer
+from app.persistence import (
+    enqueue_outbox_message,
+    load_due_outbox_messages,
+    delete_outbox_message,
+    reschedule_outbox_message,
+    dead_letter_outbox_message,
+    replay_dead_letters,
+    get_dead_letters,
+    outbox_summary,
+)
+
+log = get_logger("outbox")
+
+# Set by configure(): send(to, text) -> Graph response body, raises SendError
+_send = None
+_on_sent = None
+
+_lock = threading.Lock()
+_claim_lock = threading.Lock()
+_wake = threading.Event()
+_stopping = threading.Event()
+_dispatcher = None
+_pool = None
+# Rows handed to a worker and not finished yet
+_in_flight = set()
+_pacer = Pacer(OUTBOX_RATE_PER_SECOND)
+# Monotonic times of recent accepted sends (throughput)
+_sent_at = deque(maxlen=10000)
+
+counters = {"enqueued": 0, "sent": 0, "retried": 0, "dead": 0, "deferred": 0}
+
+
+# Flush what piled up while the token was unusable
+graph_client.breaker.on_close(_wake.set)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def configure(send, on_sent=None) -> None:
+    """
+    Set the send function and the hook called with (to, response) after each accepted send.
+    """
+    global _send, _on_sent
+    _send = send
+    _on_sent = on_sent
+
+
+def backoff(attempts: int) -> float:
+    """Seconds before retry number attempts (1-based): exponential, capped, equal jitter."""
+    ceiling = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def enqueue(to: str, text: str, comercio_id: int = None) -> bool:
+    """
+    Store a reply for sending.
+
+    Returns:
+        False if it could not be stored (logged)
+    """
+    message_id = enqueue_outbox_message(to, text, comercio_id, _now())
+    if message_id == -1:
+        return False
+    with _lock:
+        counters["enqueued"] += 1
+    _wake.set()
+    return True
+
+
+def _attempt(row: dict) -> bool:
+    """
+    Send one outbox row and settle it: delete, reschedule or dead-letter.
+
+    Returns:
+        True if Graph accepted it
+    """
+    try:
+        _pacer.wait()
+        try:
+            result = _send(row["to_phone"], row["text"])
+        except CircuitOpen:
+            # Token unusable: the row stays due, sent when the breaker closes
+            with _lock:
+                counters["deferred"] += 1
+            return False
+        except SendError as e:
+            error = e
+        except Exception as e:
+            log.exception("Send callback failed for outbox #%s: %s", row["id"], e)
+            error = SendError(str(e), retryable=True)
+        else:
+            delete_outbox_message(row["id"])
+            with _lock:
+                counters["sent"] += 1
+                _sent_at.append(time.monotonic())
+            if _on_sent is not None:
+                try:
+                    _on_sent(row["to_phone"], result)
+                except Exception as e:
+                    log.exception("on_sent hook failed for outbox #%s: %s", row["id"], e)
+            return True
+
+        attempts = row["attempts"] + 1
+        if error.retryable and attempts < OUTBOX_MAX_ATTEMPTS:
+            delay = backoff(attempts)
+            reschedule_outbox_message(row["id"], attempts, _now() + timedelta(seconds=delay), str(error))
+            with _lock:
+                counters["retried"] += 1
+            log.info(
+                "Send to %s failed, retry %d in %.1fs", row["to_phone"], attempts, delay,
+                extra={"outbox_id": row["id"], "error": str(error)},
+            )
+        else:
+            dead_letter_outbox_message(row["id"], attempts, str(error), _now())
+            with _lock:
+                counters["dead"] += 1
+            log.warning(
+                "Send to %s failed after %d attempt(s), moved to dead letters", row["to_phone"], attempts,
+                extra={"outbox_id": row["id"], "error": str(error)},
+            )
+        return False
+    finally:
+        with _lock:
+            _in_flight.discard(row["id"])
+        _wake.set()
+
+
+def _claim_due(limit: int) -> list:
+    """Due head-of-line rows not already being sent, marked in flight."""
+    with _claim_lock:
+        with _lock:
+            exclude = set(_in_flight)
+        rows = load_due_outbox_messages(_now(), limit, exclude)
+        with _lock:
+            _in_flight.update(row["id"] for row in rows)
+    return rows
+
+
+def process_due(limit: int = 100) -> int:
+    """
+    Send the due messages from the calling thread (no dispatcher needed).
+
+    Returns:
+        Number of messages attempted
+    """
+    rows = _claim_due(limit)
+    for row in rows:
+        _attempt(row)
+    return len(rows)
+
+
+def _run(pool: ThreadPoolExecutor) -> None:
+    # Enough rows in hand to keep every worker busy while the next batch loads
+    capacity = OUTBOX_WORKERS * 2
+    while not _stopping.is_set():
+        _wake.clear()
+        with _lock:
+            free = capacity - len(_in_flight)
+        rows = []
+        if free > 0 and graph_client.breaker.state == "closed":
+            try:
+                rows = _claim_due(free)
+            except Exception as e:
+                log.exception("Outbox dispatcher: %s", e)
+            for row in rows:
+                pool.submit(_attempt, row)
+        if not rows:
+            # Woken by enqueue(), a finished send or the breaker closing;
+            # polls for retries coming due
+            _wake.wait(OUTBOX_POLL_INTERVAL_MS / 1000)
+
+
+def start() -> None:
+    """Start the dispatcher and send workers (no-op if running); pending rows from a previous run are sent."""
+    global _dispatcher, _pool
+    if _send is None:
+        raise RuntimeError("outbox.configure() must be called before start()")
+    with _lock:
+        if _dispatcher is not None:
+            return
+        _stopping.clear()
+        _pool = ThreadPoolExecutor(max_workers=max(1, OUTBOX_WORKERS), thread_name_prefix="outbox")
+        _dispatcher = threading.Thread(target=_run, args=(_pool,), name="outbox-dispatcher", daemon=True)
+        _dispatcher.start()
+    log.info("Outbox: started %d worker(s), %s msg/s", OUTBOX_WORKERS, _pacer.rate or "no cap")
+
+
+def stop(timeout: float = None) -> None:
+    """Stop dispatching and wait for in-flight sends; pending rows stay for the next start."""
+    global _dispatcher, _pool
+    with _lock:
+        dispatcher, pool = _dispatcher, _pool
+        _dispatcher = _pool = None
+    if dispatcher is None:
+        return
+    _stopping.set()
+    _wake.set()
+    dispatcher.join(timeout)
+    pool.shutdown(wait=True, cancel_futures=True)
+    with _lock:
+        # Cancelled before they started: sent again on the next start
+        _in_flight.clear()
+
+
+def stats() -> dict:
+    """Counters, throughput and lag for the healthcheck."""
+    summary = outbox_summary()
+    oldest = summary["oldest_created_at"]
+    cutoff = time.monotonic() - 60
+    with _lock:
+        recent = sum(1 for at in _sent_at if at >= cutoff)
+        in_flight = len(_in_flight)
+        totals = dict(counters)
+    return {
+        **totals,
+        "running": _dispatcher is not None,
+        "pending": summary["pending"],
+        "in_flight": in_flight,
+        "dead_letters": summary["dead_letters"],
+        "lag_seconds": round((_now() - oldest).total_seconds(), 3) if oldest else 0.0,
+        "sends_per_second": round(recent / 60, 2),
+        "rate_limit_per_second": _pacer.rate,
+    }
+
+
+def clear() -> None:
+    """Reset counters and the pacer (the tables are kept)."""
+    with _lock:
+        for key in counters:
+            counters[key] = 0
+        _sent_at.clear()
+    _pacer.reset()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.outbox", description="Cola de mensajes salientes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay = commands.add_parser("replay", help="Volver a encolar dead letters")
+    replay.add_argument("ids", nargs="*", type=int, help="IDs de dead_letters")
+    replay.add_argument("--all", action="store_true", help="Todas las dead letters")
+    commands.add_parser("stats", help="Pendientes, lag y dead letters")
+    commands.add_parser("dead", help="Listar las últimas dead letters")
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.command == "replay":
+        if not args.ids and not args.all:
+            parser.error("replay: indicá IDs o --all")
+        count = replay_dead_letters(None if args.all else args.ids, _now())
+        print(f"{max(count, 0)} mensaje(s) reencolado(s)")
+    elif args.command == "stats":
+        for key, value in stats().items():
+            print(f"{key}: {value}")
+    else:
+        for row in get_dead_letters():
+            print(f"#{row['id']} {row['to_phone']} intentos={row['attempts']} {row['failed_at']:%Y-%m-%d %H:%M:%S} {row['last_error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Lean extraction of WhatsApp webhook payloads.
+
+The webhook body is read as raw bytes and decoded with json.loads, then
+only the fields the app uses are copied into slotted records:
+
+    entry[].changes[].value.metadata.phone_number_id
+    entry[].changes[].value.messages[]: id, from, type, timestamp, text.body
+    entry[].changes[].value.statuses[]: passed through for app.delivery
+
+No model validation runs over the rest of the payload (contacts, media
+objects, referral data...): it is never looked at.
+
+Defensive behavior:
+- Bodies over WEBHOOK_MAX_BODY_BYTES are refused before they are decoded
+- Invalid JSON or a non-object body raises PayloadError
+- Items of the wrong type at any level are skipped, not fatal
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+class PayloadError(ValueError):
+    """Body can't be used: not JSON, or not a JSON object."""
+
+
+class PayloadTooLarge(PayloadError):
+    """Body over the size limit."""
+
+
+@dataclass(slots=True)
+class InboundMessage:
+    """The fields of one inbound message the app uses."""
+    id: Optional[str]
+    sender: Optional[str]
+    type: Optional[str]
+    text: str = ""
+    timestamp: Optional[str] = None
+    phone_number_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class WebhookBatch:
+    """Messages and status callbacks of one webhook, in payload order."""
+    messages: List[InboundMessage] = field(default_factory=list)
+    statuses: List[dict] = field(default_factory=list)
+
+
+def _list(value) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def decode(body: bytes, max_bytes: int = 0) -> dict:
+    """
+    Decode a raw webhook body.
+
+    Args:
+        body: Request body
+        max_bytes: Size limit (0 = no limit)
+
+    Raises:
+        PayloadTooLarge: Body over max_bytes
+        PayloadError: Invalid JSON, or not an object
+    """
+    if max_bytes and len(body) > max_bytes:
+        raise PayloadTooLarge(f"body of {len(body)} bytes exceeds {max_bytes}")
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise PayloadError(f"invalid JSON: {e}") from e
+    if not isinstance(payload, dict):
+        raise PayloadError("body is not a JSON object")
+    return payload
+
+
+def extract(payload: dict) -> WebhookBatch:
+    """
+    Messages and statuses of every change of every entry.
+
+    Examples:
+        >>> batch = extract({"entry": [{"changes": [{"value": {"messages": [
+        ...     {"id": "wamid.1", "from": "549111", "type": "text", "text": {"body": "hola"}}
+        ... ]}}]}]})
+        >>> batch.messages[0].sender, batch.messages[0].text
+        ('549111', 'hola')
+    """
+    batch = WebhookBatch()
+    for entry in _list(payload.get("entry")):
+        for change in _list(_dict(entry).get("changes")):
+            value = _dict(_dict(change).get("value"))
+            phone_number_id = _dict(value.get("metadata")).get("phone_number_id")
+
+            append = batch.messages.append
+            for message in _list(value.get("messages")):
+                if not isinstance(message, dict):
+                    continue
+                text = message.get("text")
+                text = text.get("body") if isinstance(text, dict) else None
+                append(InboundMessage(
+                    message.get("id"),
+                    message.get("from"),
+                    message.get("type"),
+                    text if isinstance(text, str) else "",
+                    message.get("timestamp"),
+                    phone_number_id,
+                ))
+
+            batch.statuses.extend(s for s in _list(value.get("statuses")) if isinstance(s, dict))
+    return batch
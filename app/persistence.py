@@ -7,54 +7,437 @@ Implements defensive programming:
 - Creates directories automatically
 - Never crashes on I/O errors
 
-Also includes SQLite persistence for message drafts.
+Conversation state is stored as a snapshot plus an append-only log:
+- STATE_FILE: JSON snapshot, one conversation per line
+- STATE_FILE.log: one JSON record per mutated phone since the snapshot
+- STATE_FILE.idx: byte offset of every conversation in the snapshot
+- Compaction folds the log into a new snapshot in a background thread
+
+Lazy startup (load_state_index) only loads the offsets; conversations are
+read one line at a time with read_indexed_conversation().
+
+Also includes SQLite persistence for message drafts (and their campaign
+checkpoints), comercios, turnos, the outbound queue and the sqlite
+conversation store (one row per phone in nordia.db).
 """
 
+from array import array
+from bisect import bisect_left
 from pathlib import Path
 import json
-from app.models import SessionLocal, MessageDraft
+import os
+import threading
+from sqlalchemy import bindparam, delete, exists, func, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.config import STATE_COMPACT_THRESHOLD
+from app.log import get_logger
+from app.models import (
+    SessionLocal,
+    MessageDraft,
+    ConversationState,
+    Comercio,
+    Turno,
+    ProcessedMessage,
+    OutboundMessage,
+    CampaignCheckpoint,
+    OutboxMessage,
+    DeadLetter,
+)
+
+log = get_logger("persistence")
 
 # Path to state file
 STATE_FILE = Path("data/conversations_state.json")
 
+# Guards log appends, log rotation and the in-memory index
+_log_lock = threading.Lock()
+# Guards snapshot writers (save_state and compaction)
+_snapshot_lock = threading.Lock()
+
+# Records appended to the log since the last compaction
+_log_records = 0
+_compaction_running = False
+
+
+
+class SnapshotIndex:
+    """
+    Byte offset of every conversation line in the snapshot.
+
+    Phones are kept sorted next to an int64 offset array and looked up with
+    bisect, so loading 1M entries doesn't build 1M dict entries.
+    """
+
+    def __init__(self, keys=None, offsets=None):
+        self.keys = keys if keys is not None else []
+        self.offsets = offsets if offsets is not None else array('q')
+
+    @classmethod
+    def from_offsets(cls, offsets: dict) -> "SnapshotIndex":
+        keys = sorted(offsets)
+        return cls(keys, array('q', (offsets[phone] for phone in keys)))
+
+    def get(self, phone: str):
+        i = bisect_left(self.keys, phone)
+        if i < len(self.keys) and self.keys[i] == phone:
+            return self.offsets[i]
+        return None
+
+    def __contains__(self, phone: str) -> bool:
+        return self.get(phone) is not None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def write(self, path: Path, snapshot_size: int, snapshot_mtime_ns: int) -> None:
+        """
+        Binary layout: JSON header line, newline-separated phones, offsets.
+
+        Size and mtime of the snapshot let readers detect a stale index.
+        """
+        keys_blob = "\n".join(self.keys).encode('utf-8')
+        header = {
+            "snapshot_size": snapshot_size,
+            "snapshot_mtime_ns": snapshot_mtime_ns,
+            "count": len(self.keys),
+            "keys_bytes": len(keys_blob)
+        }
+        with open(path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            f.write(keys_blob)
+            f.write(self.offsets.tobytes())
+
+    @classmethod
+    def read(cls, path: Path, snapshot_size: int, snapshot_mtime_ns: int):
+        """Load an index file, or None if it describes another snapshot."""
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            if (header["snapshot_size"], header["snapshot_mtime_ns"]) != (snapshot_size, snapshot_mtime_ns):
+                return None
+            keys_blob = f.read(header["keys_bytes"])
+            offsets = array('q')
+            offsets.frombytes(f.read())
+
+        keys = keys_blob.decode('utf-8').split("\n") if header["count"] else []
+        if len(keys) != header["count"] or len(offsets) != header["count"]:
+            return None
+        return cls(keys, offsets)
+
+
+# Lazy startup index, maintained only after load_state_index()
+_index_enabled = False
+_snapshot_index = SnapshotIndex()
+# phone -> (segment, byte offset) of its latest log record, None if deleted.
+# Segment is "log" or "rotated" (log being folded by a compaction).
+_log_index = {}
+
+_decoder = json.JSONDecoder()
+
+
+def state_log_path() -> Path:
+    """Append-only mutation log that belongs to the current STATE_FILE."""
+    return STATE_FILE.with_suffix(".log")
+
+
+def _rotated_log_path() -> Path:
+    """Log being folded into the snapshot by an in-progress compaction."""
+    return STATE_FILE.with_suffix(".log.1")
+
+
+def state_index_path() -> Path:
+    """Offsets of the conversations in the current STATE_FILE."""
+    return STATE_FILE.with_suffix(".idx")
+
+
+def _segment_path(segment: str) -> Path:
+    return state_log_path() if segment == "log" else _rotated_log_path()
+
+
+def _write_snapshot(data: dict) -> tuple:
+    """
+    Write a snapshot (one conversation per line) and its index to temp files.
+
+    The snapshot is still a plain JSON object, so it stays readable with
+    json.load. Callers publish both files with _publish_snapshot().
+
+    Returns:
+        (SnapshotIndex, snapshot_tmp, index_tmp)
+    """
+    offsets = {}
+    snapshot_tmp = STATE_FILE.with_suffix(".tmp")
+    with open(snapshot_tmp, 'wb') as f:
+        f.write(b"{\n")
+        offset = 2
+        last = len(data) - 1
+        for i, (phone, conv) in enumerate(data.items()):
+            phone = str(phone)
+            line = (
+                json.dumps(phone, ensure_ascii=False)
+                + ": "
+                + json.dumps(conv, default=str, ensure_ascii=False)
+                + (",\n" if i < last else "\n")
+            ).encode('utf-8')
+            f.write(line)
+            offsets[phone] = offset
+            offset += len(line)
+        f.write(b"}\n")
+
+    # Size and mtime survive os.replace, so the index can tell whether it
+    # still describes the published snapshot
+    stat = os.stat(snapshot_tmp)
+    index = SnapshotIndex.from_offsets(offsets)
+    index_tmp = state_index_path().with_suffix(".idx.tmp")
+    index.write(index_tmp, stat.st_size, stat.st_mtime_ns)
+
+    return index, snapshot_tmp, index_tmp
+
+
+def _publish_snapshot(snapshot_tmp: Path, index_tmp: Path) -> None:
+    """Atomically replace the snapshot, then its index."""
+    os.replace(snapshot_tmp, STATE_FILE)
+    os.replace(index_tmp, state_index_path())
+
+
+def _read_snapshot() -> dict:
+    """Read the snapshot file. Raises on missing or corrupted file."""
+    with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_index_file():
+    """
+    Read the snapshot offsets, or None if missing, corrupted or stale.
+    """
+    try:
+        stat = os.stat(STATE_FILE)
+        return SnapshotIndex.read(state_index_path(), stat.st_size, stat.st_mtime_ns)
+    except Exception:
+        return None
+
+
+def _replay_log(path: Path, data: dict) -> int:
+    """
+    Apply log records from path onto data (last write wins).
+
+    Returns:
+        Number of records applied
+
+    Defensive behavior:
+    - Missing log is treated as empty
+    - Torn or corrupted lines (crash mid-write) are skipped
+    """
+    if not path.exists():
+        return 0
+
+    applied = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                phone = record["phone"]
+                conv = record["data"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                log.warning("Skipping corrupted log record in %s", path.name)
+                continue
+
+            if conv is None:
+                data.pop(phone, None)
+            else:
+                data[phone] = conv
+            applied += 1
+    return applied
+
+
+def _index_log(segment: str) -> int:
+    """
+    Index the records of a log segment (offsets only, values discarded).
+
+    Returns:
+        Number of records indexed
+    """
+    path = _segment_path(segment)
+    if not path.exists():
+        return 0
+
+    indexed = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                phone = record["phone"]
+                _log_index[phone] = (segment, offset) if record["data"] is not None else None
+                indexed += 1
+            except (json.JSONDecodeError, KeyError, TypeError):
+                log.warning("Skipping corrupted log record in %s", path.name)
+            offset += len(line)
+    return indexed
+
 
 def save_state(data: dict) -> None:
     """
-    Save conversation state to disk.
+    Save full conversation state to disk as a new snapshot.
 
     Args:
         data: Dictionary containing conversation state
 
+    The mutation log is discarded afterwards, since the snapshot already
+    contains every conversation.
+
     Defensive behavior:
     - Creates data/ directory if doesn't exist
     - Logs errors but doesn't crash
     - Uses default=str to handle datetime objects
     - Ensures UTF-8 encoding for unicode/emojis
     """
+    global _log_records, _snapshot_index
+
     # Create directory if doesn't exist
     STATE_FILE.parent.mkdir(exist_ok=True)
 
     try:
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(
-                data,
-                f,
-                indent=2,
-                default=str,  # Convert non-serializable objects (datetime) to string
-                ensure_ascii=False  # Preserve unicode/emojis
-            )
-        print(f"[PERSISTENCE] ✓ Saved {len(data)} conversation(s)")
+        with _snapshot_lock, _log_lock:
+            index, snapshot_tmp, index_tmp = _write_snapshot(data)
+            _publish_snapshot(snapshot_tmp, index_tmp)
+            for path in (state_log_path(), _rotated_log_path()):
+                if path.exists():
+                    path.unlink()
+            _log_records = 0
+            if _index_enabled:
+                _snapshot_index = index
+                _log_index.clear()
+        log.debug("Saved %s conversation(s)", len(data))
     except Exception as e:
-        print(f"[PERSISTENCE ERROR] Failed to save state: {e}")
+        log.error("Failed to save state: %s", e)
+
+
+def append_state(changes: dict) -> bool:
+    """
+    Append mutated conversations to the log. Cost is O(changed conversations).
+
+    Args:
+        changes: Mapping phone -> conversation dict, or None for a deletion
+
+    Triggers a background compaction once the log holds
+    STATE_COMPACT_THRESHOLD records.
+
+    Returns:
+        False if the records were not written (the caller keeps them)
+
+    Defensive behavior:
+    - Creates data/ directory if doesn't exist
+    - Logs errors but doesn't crash
+    """
+    global _log_records
+
+    if not changes:
+        return True
+
+    records = [
+        (phone, conv, (json.dumps({"phone": phone, "data": conv}, default=str, ensure_ascii=False) + "\n").encode('utf-8'))
+        for phone, conv in changes.items()
+    ]
+
+    try:
+        STATE_FILE.parent.mkdir(exist_ok=True)
+        with _log_lock:
+            with open(state_log_path(), 'ab') as f:
+                offset = f.tell()
+                f.write(b"".join(line for _, _, line in records))
+            if _index_enabled:
+                for phone, conv, line in records:
+                    _log_index[phone] = ("log", offset) if conv is not None else None
+                    offset += len(line)
+            _log_records += len(records)
+            should_compact = _log_records >= STATE_COMPACT_THRESHOLD
+    except Exception as e:
+        log.error("Failed to append state: %s", e)
+        return False
+
+    if should_compact:
+        start_compaction()
+    return True
+
+
+def start_compaction() -> None:
+    """Run compact_state in a background thread unless one is already running."""
+    global _compaction_running
+
+    with _log_lock:
+        if _compaction_running:
+            return
+        _compaction_running = True
+
+    threading.Thread(target=compact_state, name="state-compaction", daemon=True).start()
+
+
+def compact_state() -> None:
+    """
+    Fold the mutation log into a new snapshot.
+
+    The log is rotated under the lock, so appends keep flowing into a fresh
+    log while the snapshot is rebuilt from disk. Crash safety:
+    - Before the snapshot is replaced: old snapshot + rotated log + log
+    - After: replaying the rotated log again is idempotent
+
+    Defensive behavior:
+    - Logs errors but doesn't crash; the rotated log is kept for next time
+    """
+    global _log_records, _compaction_running, _snapshot_index
+
+    try:
+        with _snapshot_lock:
+            log_file = state_log_path()
+            rotated_file = _rotated_log_path()
+
+            with _log_lock:
+                # A leftover rotated log means a previous compaction failed;
+                # finish that one first and leave the current log alone.
+                if log_file.exists() and not rotated_file.exists():
+                    os.replace(log_file, rotated_file)
+                    _log_records = 0
+                    for phone, entry in _log_index.items():
+                        if entry is not None and entry[0] == "log":
+                            _log_index[phone] = ("rotated", entry[1])
+
+            if not rotated_file.exists():
+                return
+
+            data = _read_snapshot() if STATE_FILE.exists() else {}
+            applied = _replay_log(rotated_file, data)
+            index, snapshot_tmp, index_tmp = _write_snapshot(data)
+
+            with _log_lock:
+                _publish_snapshot(snapshot_tmp, index_tmp)
+                rotated_file.unlink()
+                if _index_enabled:
+                    _snapshot_index = index
+                    for phone in list(_log_index):
+                        entry = _log_index[phone]
+                        # Folded records now live in the snapshot; a deletion
+                        # is only still needed if the snapshot has the phone
+                        if entry is None:
+                            if phone not in index:
+                                del _log_index[phone]
+                        elif entry[0] == "rotated":
+                            del _log_index[phone]
+
+        log.info("Compacted %s log record(s) into %s conversation(s)", applied, len(data))
+    except Exception as e:
+        log.error("Failed to compact state: %s", e)
+    finally:
+        with _log_lock:
+            _compaction_running = False
 
 
 def load_state() -> dict:
     """
-    Load conversation state from disk.
+    Load conversation state from disk: snapshot + log tail.
 
     Returns:
         Dictionary containing conversation state, or empty dict if:
-        - File doesn't exist (first run)
+        - Files don't exist (first run)
         - JSON is corrupted
         - Any I/O error occurs
 
@@ -62,27 +445,250 @@ def load_state() -> dict:
     - Returns empty dict instead of crashing
     - Logs warnings for debugging
     - Handles missing file gracefully
+    - Skips torn log records
     """
-    # File doesn't exist (first run)
-    if not STATE_FILE.exists():
-        print("[PERSISTENCE] No state file found, starting fresh")
-        return {}
+    global _log_records
+
+    data = {}
+
+    if STATE_FILE.exists():
+        try:
+            data = _read_snapshot()
+        except json.JSONDecodeError as e:
+            log.warning("Corrupted state file, starting with fresh state: %s", e)
+            data = {}
+        except Exception as e:
+            log.error("Failed to load state: %s", e)
+            return {}
 
     try:
-        with open(STATE_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"[PERSISTENCE] ✓ Loaded {len(data)} conversation(s)")
+        applied = _replay_log(_rotated_log_path(), data)
+        applied += _replay_log(state_log_path(), data)
+    except Exception as e:
+        log.error("Failed to replay state log: %s", e)
         return data
-    except json.JSONDecodeError as e:
-        print(f"[PERSISTENCE WARNING] Corrupted state file: {e}")
-        print("[PERSISTENCE WARNING] Starting with fresh state")
+
+    if not STATE_FILE.exists() and applied == 0:
+        # File doesn't exist (first run)
+        log.info("No state file found, starting fresh")
         return {}
+
+    with _log_lock:
+        _log_records = applied
+
+    log.info("Loaded %s conversation(s) (%s log record(s) replayed)", len(data), applied)
+    return data
+
+
+def load_state_index() -> int:
+    """
+    Lazy startup: load only the offsets of every conversation.
+
+    Reads STATE_FILE.idx and indexes the log tail. If the index is missing
+    or stale (e.g. a snapshot written by an older version), the state is
+    loaded once and rewritten to produce it.
+
+    Returns:
+        Number of indexed conversations
+
+    Defensive behavior:
+    - Falls back to a full load + rewrite instead of crashing
+    - Skips torn log records
+    """
+    global _index_enabled, _snapshot_index, _log_records
+
+    index = SnapshotIndex()
+    if STATE_FILE.exists():
+        index = _read_index_file()
+        if index is None:
+            log.info("State index missing or stale, rebuilding")
+            save_state(load_state())
+            index = _read_index_file() or SnapshotIndex()
+
+    with _log_lock:
+        _snapshot_index = index
+        _log_index.clear()
+        records = _index_log("rotated") + _index_log("log")
+        _log_records = records
+        _index_enabled = True
+
+    indexed = len(index)
+    for phone, entry in _log_index.items():
+        if entry is None and phone in index:
+            indexed -= 1
+        elif entry is not None and phone not in index:
+            indexed += 1
+    log.info("Indexed %s conversation(s) (%s log record(s))", indexed, records)
+    return indexed
+
+
+def read_indexed_conversation(phone: str):
+    """
+    Read the latest version of one conversation through the index.
+
+    Args:
+        phone: Phone number (sender)
+
+    Returns:
+        Conversation dict, or None if not found or deleted
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns None on error or corrupted record
+    """
+    try:
+        with _log_lock:
+            entry = _log_index.get(phone, False)
+            if entry is None:
+                return None
+
+            if entry is False:
+                offset = _snapshot_index.get(phone)
+                if offset is None:
+                    return None
+                path = STATE_FILE
+            else:
+                segment, offset = entry
+                path = _segment_path(segment)
+
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                line = f.readline().decode('utf-8')
+
+        if entry is not False:
+            return json.loads(line)["data"]
+
+        # Snapshot line: "phone": {...},
+        _, key_end = json.decoder.scanstring(line, 1)
+        conv, _ = _decoder.raw_decode(line, key_end + 2)
+        return conv
     except Exception as e:
-        print(f"[PERSISTENCE ERROR] Failed to load state: {e}")
-        return {}
+        log.error("Failed to read conversation %s: %s", phone, e)
+        return None
 
 
-def save_message_draft(customer_name: str, intent: str, message: str) -> int:
+def load_conversation(phone: str):
+    """
+    Read a single conversation row from the sqlite store.
+
+    Args:
+        phone: Phone number (sender)
+
+    Returns:
+        Conversation dict, or None if the phone has no row
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns None on error or corrupted row
+    """
+    try:
+        db = SessionLocal()
+        try:
+            row = db.get(ConversationState, phone)
+            return json.loads(row.data) if row is not None else None
+        finally:
+            db.close()
+    except Exception as e:
+        log.error("Failed to load conversation %s: %s", phone, e)
+        return None
+
+
+def import_json_state() -> int:
+    """
+    One-time migration json -> sqlite: copy the conversations in STATE_FILE
+    (snapshot + log) into conversation_state, then rename the json files to
+    *.migrated so the next start doesn't import them again.
+
+    Returns:
+        Number of conversations imported (0 if there was nothing to import)
+
+    Defensive behavior:
+    - Rows already in conversation_state win over the json copy
+    - On error nothing is renamed, so the next start retries
+    """
+    files = [
+        path for path in (STATE_FILE, state_log_path(), _rotated_log_path(), state_index_path())
+        if path.exists()
+    ]
+    if not files:
+        return 0
+
+    data = load_state()
+    rows = [
+        {"phone": phone, "data": json.dumps(conv, default=str, ensure_ascii=False)}
+        for phone, conv in data.items()
+    ]
+    try:
+        db = SessionLocal()
+        try:
+            if rows:
+                stmt = sqlite_insert(ConversationState).on_conflict_do_nothing(index_elements=[ConversationState.phone])
+                db.execute(stmt, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for path in files:
+            path.rename(path.with_name(path.name + ".migrated"))
+    except Exception as e:
+        log.error("Failed to import json state into sqlite: %s", e)
+        return 0
+
+    log.warning("Imported %d conversation(s) from %s into sqlite", len(rows), STATE_FILE)
+    return len(rows)
+
+
+def upsert_conversations(changes: dict) -> bool:
+    """
+    Upsert mutated conversations into the sqlite store in one transaction.
+
+    Args:
+        changes: Mapping phone -> conversation dict, or None for a deletion
+
+    Returns:
+        False if the batch was not written (the caller keeps it)
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Rolls back the whole batch on error
+    """
+    if not changes:
+        return True
+
+    rows = [
+        {"phone": phone, "data": json.dumps(conv, default=str, ensure_ascii=False)}
+        for phone, conv in changes.items()
+        if conv is not None
+    ]
+    deleted = [phone for phone, conv in changes.items() if conv is None]
+
+    try:
+        db = SessionLocal()
+        try:
+            if rows:
+                stmt = sqlite_insert(ConversationState)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ConversationState.phone],
+                    set_={"data": stmt.excluded.data, "updated_at": func.now()}
+                )
+                db.execute(stmt, rows)
+            if deleted:
+                db.execute(delete(ConversationState).where(ConversationState.phone.in_(deleted)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    except Exception as e:
+        log.error("Failed to upsert conversations: %s", e)
+        return False
+    return True
+
+
+def save_message_draft(customer_name: str, intent: str, message: str, customer_phone: str = None) -> int:
     """
     Guarda draft de mensaje en base de datos SQLite.
 
@@ -90,6 +696,7 @@ def save_message_draft(customer_name: str, intent: str, message: str) -> int:
         customer_name: Nombre del cliente
         intent: Intención comercial del usuario
         message: Mensaje generado
+        customer_phone: Teléfono del cliente (sin teléfono la campaña no lo envía)
 
     Returns:
         ID del draft creado
@@ -104,7 +711,8 @@ def save_message_draft(customer_name: str, intent: str, message: str) -> int:
         draft = MessageDraft(
             customer_name=customer_name,
             commercial_intent=intent,
-            generated_message=message
+            generated_message=message,
+            customer_phone=customer_phone
         )
         db.add(draft)
         db.commit()
@@ -112,11 +720,741 @@ def save_message_draft(customer_name: str, intent: str, message: str) -> int:
         draft_id = draft.id
         db.close()
 
-        print(f"[PERSISTENCE] ✓ Saved message draft #{draft_id} for {customer_name}")
+        log.info("Saved message draft #%s for %s", draft_id, customer_name)
         return draft_id
 
     except Exception as e:
-        print(f"[PERSISTENCE ERROR] Failed to save message draft: {e}")
+        log.error("Failed to save message draft: %s", e)
         if 'db' in locals():
             db.close()
         return -1
+
+
+def save_comercio(telefono_dueno: str, nombre: str, horarios: str = None, servicios: str = None) -> int:
+    """
+    Crea o actualiza el comercio de un dueño (único por teléfono).
+
+    Args:
+        telefono_dueno: Teléfono del dueño (sender del setup)
+        nombre: Nombre del negocio
+        horarios: Horarios de atención (texto libre)
+        servicios: Servicios ofrecidos (texto libre)
+
+    Returns:
+        ID del comercio
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns -1 on error
+    """
+    try:
+        db = SessionLocal()
+        try:
+            stmt = sqlite_insert(Comercio).values(
+                telefono_dueno=telefono_dueno,
+                nombre=nombre,
+                horarios=horarios,
+                servicios=servicios
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Comercio.telefono_dueno],
+                set_={
+                    "nombre": stmt.excluded.nombre,
+                    "horarios": stmt.excluded.horarios,
+                    "servicios": stmt.excluded.servicios
+                }
+            )
+            db.execute(stmt)
+            db.commit()
+            comercio_id = db.query(Comercio.id).filter(Comercio.telefono_dueno == telefono_dueno).scalar()
+        finally:
+            db.close()
+
+        log.info("Saved comercio #%s for %s", comercio_id, telefono_dueno)
+        return comercio_id
+
+    except Exception as e:
+        log.error("Failed to save comercio: %s", e)
+        return -1
+
+
+def save_comercio_keywords(comercio_id: int, vocabulary: dict) -> bool:
+    """
+    Guarda el vocabulario propio de un comercio (intención -> keywords extra).
+
+    Returns:
+        True si el comercio existe y se guardó
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns False on error
+    """
+    try:
+        db = SessionLocal()
+        try:
+            updated = db.execute(
+                update(Comercio)
+                .where(Comercio.id == comercio_id)
+                .values(keywords=json.dumps(vocabulary, ensure_ascii=False))
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        log.error("Failed to save keywords for comercio %s: %s", comercio_id, e)
+        return False
+    return updated == 1
+
+
+def save_turno(comercio_id: int, cliente_telefono: str, fecha: str, hora: str,
+               cliente_nombre: str = None, servicio: str = None, dia=None) -> int:
+    """
+    Guarda un turno como fila de la tabla turnos.
+
+    Args:
+        comercio_id: ID del comercio
+        cliente_telefono: Teléfono del cliente que reserva
+        fecha: Día del turno
+        hora: Hora del turno
+        cliente_nombre: Nombre del cliente (opcional)
+        servicio: Servicio reservado (opcional)
+        dia: fecha resuelta a un date (opcional; sin él no cuenta para conflictos)
+
+    Returns:
+        ID del turno creado
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns -1 on error
+    """
+    try:
+        db = SessionLocal()
+        try:
+            turno = Turno(
+                comercio_id=comercio_id,
+                cliente_telefono=cliente_telefono,
+                cliente_nombre=cliente_nombre,
+                fecha=fecha,
+                dia=dia,
+                hora=hora,
+                servicio=servicio
+            )
+            db.add(turno)
+            db.commit()
+            turno_id = turno.id
+        finally:
+            db.close()
+
+        log.info("Saved turno #%s for %s: %s %s", turno_id, cliente_telefono, fecha, hora)
+        return turno_id
+
+    except Exception as e:
+        log.error("Failed to save turno: %s", e)
+        return -1
+
+
+def get_turnos_by_cliente(cliente_telefono: str) -> list:
+    """
+    Lista los turnos de un cliente en orden de creación.
+
+    Args:
+        cliente_telefono: Teléfono del cliente
+
+    Returns:
+        Lista de dicts {id, comercio_id, fecha, hora, servicio}, vacía si hay error
+    """
+    try:
+        db = SessionLocal()
+        try:
+            turnos = (
+                db.query(Turno)
+                .filter(Turno.cliente_telefono == cliente_telefono)
+                .order_by(Turno.id)
+                .all()
+            )
+            return [
+                {
+                    "id": t.id,
+                    "comercio_id": t.comercio_id,
+                    "fecha": t.fecha,
+                    "dia": t.dia,
+                    "hora": t.hora,
+                    "servicio": t.servicio
+                }
+                for t in turnos
+            ]
+        finally:
+            db.close()
+    except Exception as e:
+        log.error("Failed to load turnos for %s: %s", cliente_telefono, e)
+        return []
+
+
+def save_processed_message_ids(ids: dict) -> int:
+    """
+    Registra ids de mensajes procesados en un solo INSERT (ignora repetidos).
+
+    Args:
+        ids: message_id -> datetime de recepción
+
+    Returns:
+        Cantidad de ids enviados a la tabla
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns -1 on error
+    """
+    if not ids:
+        return 0
+
+    try:
+        db = SessionLocal()
+        try:
+            rows = [{"message_id": message_id, "received_at": received_at} for message_id, received_at in ids.items()]
+            # 2 params per row: 499-row chunks stay under SQLite's 999 bound-parameter limit
+            for start in range(0, len(rows), 499):
+                db.execute(sqlite_insert(ProcessedMessage).values(rows[start:start + 499]).on_conflict_do_nothing())
+            db.commit()
+        finally:
+            db.close()
+        return len(rows)
+
+    except Exception as e:
+        log.error("Failed to save processed message ids: %s", e)
+        return -1
+
+
+def load_processed_message_ids(since) -> list:
+    """
+    Ids de mensajes recibidos desde since (datetime), del más viejo al más nuevo.
+
+    Also deletes older rows, which dedup no longer needs.
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns [] on error
+    """
+    try:
+        db = SessionLocal()
+        try:
+            db.execute(delete(ProcessedMessage).where(ProcessedMessage.received_at < since))
+            db.commit()
+            rows = (
+                db.query(ProcessedMessage.message_id)
+                .filter(ProcessedMessage.received_at >= since)
+                .order_by(ProcessedMessage.received_at)
+                .all()
+            )
+        finally:
+            db.close()
+        return [row.message_id for row in rows]
+
+    except Exception as e:
+        log.error("Failed to load processed message ids: %s", e)
+        return []
+
+
+def save_outbound_messages(rows: list) -> int:
+    """
+    Registra mensajes enviados en un solo INSERT (ignora wamids repetidos).
+
+    Args:
+        rows: dicts con wamid, comercio_id, to_phone, sent_at
+
+    Returns:
+        Cantidad de filas enviadas a la tabla
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns -1 on error
+    """
+    if not rows:
+        return 0
+
+    try:
+        db = SessionLocal()
+        try:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(rows), 200):
+                db.execute(sqlite_insert(OutboundMessage).values(rows[start:start + 200]).on_conflict_do_nothing())
+            db.commit()
+        finally:
+            db.close()
+        return len(rows)
+
+    except Exception as e:
+        log.error("Failed to save outbound messages: %s", e)
+        return -1
+
+
+def get_outbound_messages(wamids) -> dict:
+    """
+    Estado de entrega de varios mensajes enviados.
+
+    Returns:
+        wamid -> dict con comercio_id, sent_at, delivered_at, read_at, failed_at, error_code
+        (los wamids desconocidos no aparecen; {} on error)
+    """
+    wamids = list(wamids)
+    if not wamids:
+        return {}
+
+    try:
+        db = SessionLocal()
+        try:
+            found = {}
+            for start in range(0, len(wamids), 500):
+                for row in db.query(OutboundMessage).filter(OutboundMessage.wamid.in_(wamids[start:start + 500])):
+                    found[row.wamid] = {
+                        "comercio_id": row.comercio_id,
+                        "sent_at": row.sent_at,
+                        "delivered_at": row.delivered_at,
+                        "read_at": row.read_at,
+                        "failed_at": row.failed_at,
+                        "error_code": row.error_code,
+                    }
+        finally:
+            db.close()
+        return found
+
+    except Exception as e:
+        log.error("Failed to load outbound messages: %s", e)
+        return {}
+
+
+def update_delivery_states(updates: list) -> int:
+    """
+    Escribe el estado de entrega de varios mensajes en un solo executemany.
+
+    Args:
+        updates: dicts con wamid, status, delivered_at, read_at, failed_at, error_code
+
+    Returns:
+        Cantidad de mensajes actualizados (-1 on error)
+    """
+    if not updates:
+        return 0
+
+    try:
+        db = SessionLocal()
+        try:
+            statement = (
+                update(OutboundMessage)
+                .where(OutboundMessage.wamid == bindparam("b_wamid"))
+                .values(
+                    status=bindparam("b_status"),
+                    delivered_at=bindparam("b_delivered_at"),
+                    read_at=bindparam("b_read_at"),
+                    failed_at=bindparam("b_failed_at"),
+                    error_code=bindparam("b_error_code"),
+                )
+            )
+            db.connection().execute(statement, [{f"b_{k}": v for k, v in u.items()} for u in updates])
+            db.commit()
+        finally:
+            db.close()
+        return len(updates)
+
+    except Exception as e:
+        log.error("Failed to update delivery states: %s", e)
+        return -1
+
+
+def load_delivery_counters() -> dict:
+    """
+    Contadores de entrega por comercio, calculados una vez desde la tabla.
+
+    Returns:
+        comercio_id -> dict con sent, delivered, read, failed,
+        delivery_seconds y read_seconds (sumas, para promedios)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            seconds = lambda column: func.sum((func.julianday(column) - func.julianday(OutboundMessage.sent_at)) * 86400)
+            rows = db.query(
+                OutboundMessage.comercio_id,
+                func.count(),
+                func.count(OutboundMessage.delivered_at),
+                func.count(OutboundMessage.read_at),
+                func.count(OutboundMessage.failed_at),
+                seconds(OutboundMessage.delivered_at),
+                seconds(OutboundMessage.read_at),
+            ).group_by(OutboundMessage.comercio_id).all()
+        finally:
+            db.close()
+
+        return {
+            comercio_id: {
+                "sent": sent,
+                "delivered": delivered,
+                "read": read,
+                "failed": failed,
+                "delivery_seconds": delivery_seconds or 0.0,
+                "read_seconds": read_seconds or 0.0,
+            }
+            for comercio_id, sent, delivered, read, failed, delivery_seconds, read_seconds in rows
+        }
+
+    except Exception as e:
+        log.error("Failed to load delivery counters: %s", e)
+        return {}
+
+
+def _outbox_row(row) -> dict:
+    return {
+        "id": row.id,
+        "to_phone": row.to_phone,
+        "text": row.text,
+        "comercio_id": row.comercio_id,
+        "attempts": row.attempts,
+        "created_at": row.created_at,
+        "next_attempt_at": row.next_attempt_at,
+        "last_error": row.last_error,
+    }
+
+
+def enqueue_outbox_message(to_phone: str, text: str, comercio_id: int = None, now=None) -> int:
+    """
+    Encola un mensaje saliente, listo para enviar.
+
+    Returns:
+        ID de la fila (-1 on error)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            row = OutboxMessage(
+                to_phone=to_phone,
+                text=text,
+                comercio_id=comercio_id,
+                attempts=0,
+                created_at=now,
+                next_attempt_at=now,
+            )
+            db.add(row)
+            db.commit()
+            return row.id
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to enqueue outbound message to %s: %s", to_phone, e)
+        return -1
+
+
+def load_due_outbox_messages(now, limit: int, exclude_ids=()) -> list:
+    """
+    Mensajes listos para enviar: el más viejo pendiente de cada teléfono, si ya venció.
+
+    Only the head of each phone's queue is returned, so a message waiting
+    for a retry holds back the later ones to the same phone (order kept).
+
+    Returns:
+        dicts ordered by id ([] on error)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            older = aliased(OutboxMessage)
+            query = (
+                db.query(OutboxMessage)
+                .filter(OutboxMessage.next_attempt_at <= now)
+                .filter(~exists().where(older.to_phone == OutboxMessage.to_phone, older.id < OutboxMessage.id))
+            )
+            if exclude_ids:
+                query = query.filter(OutboxMessage.id.notin_(list(exclude_ids)))
+            rows = query.order_by(OutboxMessage.id).limit(limit).all()
+        finally:
+            db.close()
+        return [_outbox_row(row) for row in rows]
+
+    except Exception as e:
+        log.error("Failed to load due outbound messages: %s", e)
+        return []
+
+
+def delete_outbox_message(message_id: int) -> None:
+    """Borra un mensaje ya aceptado por Graph."""
+    try:
+        db = SessionLocal()
+        try:
+            db.execute(delete(OutboxMessage).where(OutboxMessage.id == message_id))
+            db.commit()
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to delete outbound message #%s: %s", message_id, e)
+
+
+def reschedule_outbox_message(message_id: int, attempts: int, next_attempt_at, error: str) -> None:
+    """Reprograma un mensaje después de un error transitorio."""
+    try:
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message_id)
+                .values(attempts=attempts, next_attempt_at=next_attempt_at, last_error=error)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to reschedule outbound message #%s: %s", message_id, e)
+
+
+def dead_letter_outbox_message(message_id: int, attempts: int, error: str, failed_at) -> None:
+    """Mueve un mensaje de la cola a dead_letters (una sola transacción)."""
+    try:
+        db = SessionLocal()
+        try:
+            row = db.get(OutboxMessage, message_id)
+            if row is not None:
+                db.add(DeadLetter(
+                    to_phone=row.to_phone,
+                    text=row.text,
+                    comercio_id=row.comercio_id,
+                    attempts=attempts,
+                    created_at=row.created_at,
+                    failed_at=failed_at,
+                    last_error=error,
+                ))
+                db.delete(row)
+                db.commit()
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to dead-letter outbound message #%s: %s", message_id, e)
+
+
+def get_dead_letters(limit: int = 100) -> list:
+    """Dead letters más recientes primero ([] on error)."""
+    try:
+        db = SessionLocal()
+        try:
+            rows = db.query(DeadLetter).order_by(DeadLetter.id.desc()).limit(limit).all()
+        finally:
+            db.close()
+        return [
+            {
+                "id": row.id,
+                "to_phone": row.to_phone,
+                "text": row.text,
+                "attempts": row.attempts,
+                "failed_at": row.failed_at,
+                "last_error": row.last_error,
+            }
+            for row in rows
+        ]
+
+    except Exception as e:
+        log.error("Failed to load dead letters: %s", e)
+        return []
+
+
+def replay_dead_letters(ids=None, now=None) -> int:
+    """
+    Vuelve a encolar dead letters (todas, o solo ids) con los intentos en cero.
+
+    Returns:
+        Cantidad de mensajes reencolados (-1 on error)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            query = db.query(DeadLetter).order_by(DeadLetter.id)
+            if ids is not None:
+                query = query.filter(DeadLetter.id.in_(list(ids)))
+            rows = query.all()
+            for row in rows:
+                db.add(OutboxMessage(
+                    to_phone=row.to_phone,
+                    text=row.text,
+                    comercio_id=row.comercio_id,
+                    attempts=0,
+                    created_at=row.created_at,
+                    next_attempt_at=now,
+                ))
+                db.delete(row)
+            db.commit()
+        finally:
+            db.close()
+        return len(rows)
+
+    except Exception as e:
+        log.error("Failed to replay dead letters: %s", e)
+        return -1
+
+
+def outbox_summary() -> dict:
+    """
+    Tamaño de la cola saliente y de dead_letters.
+
+    Returns:
+        dict con pending, oldest_created_at (None si está vacía) y dead_letters
+    """
+    try:
+        db = SessionLocal()
+        try:
+            pending, oldest = db.query(func.count(OutboxMessage.id), func.min(OutboxMessage.created_at)).one()
+            dead = db.query(func.count(DeadLetter.id)).scalar()
+        finally:
+            db.close()
+        return {"pending": pending, "oldest_created_at": oldest, "dead_letters": dead}
+
+    except Exception as e:
+        log.error("Failed to load outbox summary: %s", e)
+        return {"pending": 0, "oldest_created_at": None, "dead_letters": 0}
+
+
+def load_pending_drafts(after_id: int, limit: int) -> list:
+    """
+    Siguiente página de drafts pendientes con teléfono (keyset: id > after_id).
+
+    Returns:
+        (id, customer_phone, generated_message) ordenados por id ([] on error)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(MessageDraft.id, MessageDraft.customer_phone, MessageDraft.generated_message)
+                .filter(MessageDraft.status == "pending")
+                .filter(MessageDraft.customer_phone.isnot(None))
+                .filter(MessageDraft.id > after_id)
+                .order_by(MessageDraft.id)
+                .limit(limit)
+                .all()
+            )
+        finally:
+            db.close()
+        return [tuple(row) for row in rows]
+
+    except Exception as e:
+        log.error("Failed to load pending drafts after #%s: %s", after_id, e)
+        return []
+
+
+def count_pending_drafts(after_id: int = 0) -> int:
+    """Drafts pendientes con teléfono después de after_id (0 on error)."""
+    try:
+        db = SessionLocal()
+        try:
+            return (
+                db.query(func.count(MessageDraft.id))
+                .filter(MessageDraft.status == "pending")
+                .filter(MessageDraft.customer_phone.isnot(None))
+                .filter(MessageDraft.id > after_id)
+                .scalar()
+            )
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to count pending drafts: %s", e)
+        return 0
+
+
+def _checkpoint_row(row) -> dict:
+    return {
+        "name": row.name,
+        "last_id": row.last_id,
+        "status": row.status,
+        "sent": row.sent,
+        "failed": row.failed,
+        "started_at": row.started_at,
+        "updated_at": row.updated_at,
+    }
+
+
+def get_campaign_checkpoint(name: str) -> dict:
+    """Checkpoint de la campaña, None si nunca corrió (o on error)."""
+    try:
+        db = SessionLocal()
+        try:
+            row = db.get(CampaignCheckpoint, name)
+            return _checkpoint_row(row) if row is not None else None
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to load campaign checkpoint %s: %s", name, e)
+        return None
+
+
+def set_campaign_status(name: str, status: str, now) -> dict:
+    """
+    Cambia el estado de una campaña (running, paused, done), creándola si no existe.
+
+    Returns:
+        Checkpoint actualizado (None on error)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            row = db.get(CampaignCheckpoint, name)
+            if row is None:
+                row = CampaignCheckpoint(name=name, last_id=0, sent=0, failed=0, started_at=now)
+                db.add(row)
+            row.status = status
+            row.updated_at = now
+            db.commit()
+            return _checkpoint_row(row)
+        finally:
+            db.close()
+
+    except Exception as e:
+        log.error("Failed to set campaign %s to %s: %s", name, status, e)
+        return None
+
+
+def save_campaign_batch(name: str, results: list, last_id: int, now) -> bool:
+    """
+    Escribe el resultado de un lote y avanza el checkpoint en una sola transacción.
+
+    Args:
+        name: Campaña
+        results: dicts con id, status (sent/failed), sent_at y last_error
+        last_id: Último id del lote (cursor del keyset)
+        now: Timestamp del checkpoint
+
+    Returns:
+        False on error (el lote se vuelve a enviar al retomar)
+    """
+    try:
+        db = SessionLocal()
+        try:
+            if results:
+                statement = (
+                    update(MessageDraft)
+                    .where(MessageDraft.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        sent_at=bindparam("b_sent_at"),
+                        last_error=bindparam("b_last_error"),
+                    )
+                )
+                db.connection().execute(statement, [{f"b_{k}": v for k, v in r.items()} for r in results])
+            sent = sum(1 for r in results if r["status"] == "sent")
+            db.execute(
+                update(CampaignCheckpoint)
+                .where(CampaignCheckpoint.name == name)
+                .values(
+                    last_id=last_id,
+                    sent=CampaignCheckpoint.sent + sent,
+                    failed=CampaignCheckpoint.failed + len(results) - sent,
+                    updated_at=now,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    except Exception as e:
+        log.error("Failed to save campaign %s batch up to #%s: %s", name, last_id, e)
+        return False
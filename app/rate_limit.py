@@ -0,0 +1,152 @@
+"""
+Token-bucket rate limiting in front of the engine.
+
+Two kinds of buckets:
+- per sender: RATE_LIMIT_SENDER_BURST messages at once, refilled at
+  RATE_LIMIT_SENDER_PER_SECOND; stops one client (or two bots answering
+  each other) from flooding the engine and the Graph API
+- global: RATE_LIMIT_GLOBAL_BURST, refilled at RATE_LIMIT_GLOBAL_PER_SECOND;
+  while it is empty the app is overloaded and CUSTOMER plane messages are
+  shed, ADMIN plane messages still go through
+
+Buckets are refilled lazily on use: a bucket is (tokens, last update) and
+admit() is O(1). Sender buckets live in an LRUCache bounded by
+RATE_LIMIT_MAX_SENDERS whose idle TTL is the time a bucket takes to refill:
+an expired bucket would be full anyway, so dropping it loses nothing.
+
+Pacer spaces outbound sends evenly under a messages-per-second cap (the
+outbox and draft campaigns share it).
+
+Defensive behavior:
+- A rate of 0 disables that bucket
+- Refused messages get no reply and change no state; they are counted
+"""
+
+import threading
+import time
+from app.cache import LRUCache
+from app.config import (
+    RATE_LIMIT_SENDER_PER_SECOND,
+    RATE_LIMIT_SENDER_BURST,
+    RATE_LIMIT_GLOBAL_PER_SECOND,
+    RATE_LIMIT_GLOBAL_BURST,
+    RATE_LIMIT_MAX_SENDERS,
+)
+from app.log import get_logger
+
+log = get_logger("rate_limit")
+
+# sender -> (tokens, updated_at); missing or expired = full bucket
+_senders = LRUCache(
+    max_entries=RATE_LIMIT_MAX_SENDERS,
+    ttl_seconds=RATE_LIMIT_SENDER_BURST / RATE_LIMIT_SENDER_PER_SECOND if RATE_LIMIT_SENDER_PER_SECOND > 0 else 0,
+)
+_global = [float(RATE_LIMIT_GLOBAL_BURST), time.monotonic()]
+_lock = threading.Lock()
+
+counters = {"admitted": 0, "limited": 0, "shed": 0}
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> float:
+    return min(float(burst), tokens + (now - updated_at) * rate)
+
+
+def overloaded() -> bool:
+    """True while the global bucket is empty (CUSTOMER work is being shed)."""
+    if RATE_LIMIT_GLOBAL_PER_SECOND <= 0:
+        return False
+    with _lock:
+        tokens, updated_at = _global
+        return _refill(tokens, updated_at, time.monotonic(), RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_GLOBAL_BURST) < 1
+
+
+def admit(sender: str, plane: str = "CUSTOMER") -> bool:
+    """
+    Take one token for a message of sender.
+
+    Args:
+        sender: Phone number of sender
+        plane: "ADMIN" or "CUSTOMER" (from dispatch_signal)
+
+    Returns:
+        False if the message must be dropped: the sender is over its rate,
+        or the app is overloaded and the message is CUSTOMER plane
+    """
+    now = time.monotonic()
+    refused = None
+    with _lock:
+        sender_tokens = None
+        if RATE_LIMIT_SENDER_PER_SECOND > 0:
+            tokens, updated_at = _senders.get(sender) or (RATE_LIMIT_SENDER_BURST, now)
+            sender_tokens = _refill(tokens, updated_at, now, RATE_LIMIT_SENDER_PER_SECOND, RATE_LIMIT_SENDER_BURST)
+            if sender_tokens < 1:
+                _senders[sender] = (sender_tokens, now)
+                refused = "limited"
+
+        if refused is None and RATE_LIMIT_GLOBAL_PER_SECOND > 0:
+            global_tokens = _refill(_global[0], _global[1], now, RATE_LIMIT_GLOBAL_PER_SECOND, RATE_LIMIT_GLOBAL_BURST)
+            if global_tokens < 1 and plane != "ADMIN":
+                _global[:] = [global_tokens, now]
+                refused = "shed"
+            else:
+                # ADMIN work is never shed, but it still drains the bucket
+                _global[:] = [max(0.0, global_tokens - 1), now]
+
+        if refused is None:
+            if sender_tokens is not None:
+                _senders[sender] = (sender_tokens - 1, now)
+            counters["admitted"] += 1
+            return True
+        counters[refused] += 1
+
+    if refused == "limited":
+        log.info("Sender over its rate, message dropped", extra={"sender": sender})
+    else:
+        log.info("Overloaded, CUSTOMER message shed", extra={"sender": sender})
+    return False
+
+
+def stats() -> dict:
+    """Counters for the healthcheck."""
+    return {
+        **counters,
+        "senders": len(_senders),
+        "overloaded": overloaded(),
+    }
+
+
+class Pacer:
+    """
+    Spaces calls 1/rate seconds apart across threads (rate 0 = no wait).
+
+    Each wait() books the next free slot under the lock and sleeps outside
+    it, so concurrent senders queue up instead of bursting.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._next_slot = 0.0
+
+
+def clear() -> None:
+    """Full buckets for everyone, counters reset."""
+    with _lock:
+        _senders.clear()
+        _global[:] = [float(RATE_LIMIT_GLOBAL_BURST), time.monotonic()]
+        for key in counters:
+            counters[key] = 0
@@ -0,0 +1,248 @@
+"""
+Weekly opening hours compiled from the free-text horarios of a commerce.
+
+"Lun-Vie 9-18hs, Sab 9-13" becomes an int bitmap with one bit per
+TURNO_SLOT_MINUTES slot of the week (bit = weekday * SLOTS_PER_DAY + slot),
+compiled once at setup time and cached per commerce. "Open at X?" is then
+a single bit test instead of reparsing text on every message.
+
+Parsing is best effort: text without any time range compiles to None and
+the commerce simply has no structured schedule.
+"""
+
+import re
+import threading
+from datetime import date, datetime, timedelta
+from app.availability import SLOTS_PER_DAY, business_today, fecha_key
+from app.config import TURNO_SLOT_MINUTES
+from app.log import get_logger
+from app.models import SessionLocal, Comercio
+
+DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+ALL_DAYS = range(7)
+
+# Whole day names and their usual abbreviations (normalized, no accents).
+# Only exact words: "marzo" or "domicilio" are not days
+DAY_NAMES = {
+    "lunes": 0, "lun": 0,
+    "martes": 1, "mar": 1,
+    "miercoles": 2, "mie": 2, "mier": 2,
+    "jueves": 3, "jue": 3, "juev": 3,
+    "viernes": 4, "vie": 4, "vier": 4,
+    "sabado": 5, "sab": 5,
+    "domingo": 6, "dom": 6,
+}
+
+_TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*(?:hrs|hs|h)?"
+_TOKEN_RE = re.compile(
+    rf"(?P<range>{_TIME}\s*(?:-|a|al|hasta)\s*{_TIME})"
+    r"|(?P<word>[a-z]+)"
+    r"|(?P<dash>-)"
+)
+_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_LONG_DATE_RE = re.compile(r"\b(\d{1,2}) de ([a-z]+)(?: de (\d{4}))?\b")
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+# comercio_id -> compiled bitmap (None if horarios didn't compile)
+_schedules = {}
+_lock = threading.Lock()
+
+log = get_logger("schedule")
+
+
+def _day_of(word: str):
+    return DAY_NAMES.get(word)
+
+
+def _range_bits(day: int, start: int, end: int) -> int:
+    """Bits of [start, end) minutes on day, rounded out to whole slots."""
+    first = start // TURNO_SLOT_MINUTES
+    last = -(-end // TURNO_SLOT_MINUTES)
+    return ((1 << (last - first)) - 1) << (day * SLOTS_PER_DAY + first)
+
+
+def compile_horarios(text: str):
+    """
+    Compile free-text opening hours into a weekly bitmap.
+
+    Day lists ("lun, mie y vie") and spans ("lunes a viernes", "lun-vie")
+    apply to the time ranges that follow them; ranges without any day
+    apply to every day.
+
+    Args:
+        text: Horarios as written during setup
+
+    Returns:
+        Weekly bitmap, or None if no time range was found
+
+    Examples:
+        >>> week = compile_horarios("Lun-Vie 9-18hs, Sab 9-13")
+        >>> is_open(week, 0, 17 * 60), is_open(week, 5, 14 * 60)
+        (True, False)
+    """
+    week = 0
+    found = False
+    days = set()
+    last_day = None
+    span = False
+    group_has_range = False
+
+    for match in _TOKEN_RE.finditer(fecha_key(text)):
+        if match.group("range"):
+            h1, m1, h2, m2 = (int(g or 0) for g in match.group(2, 3, 4, 5))
+            start, end = h1 * 60 + m1, h2 * 60 + m2
+            if h1 > 24 or h2 > 24 or m1 > 59 or m2 > 59 or min(end, 1440) <= start:
+                continue
+            for day in days or ALL_DAYS:
+                week |= _range_bits(day, start, min(end, 1440))
+            found = True
+            group_has_range = True
+            span = False
+        elif match.group("word"):
+            word = match.group("word")
+            day = _day_of(word)
+            if day is not None:
+                # A day after some ranges starts a new group
+                if group_has_range:
+                    days = set()
+                    group_has_range = False
+                if span and last_day is not None:
+                    days.update((last_day + i) % 7 for i in range((day - last_day) % 7 + 1))
+                else:
+                    days.add(day)
+                last_day = day
+                span = False
+            elif word in ("a", "al", "hasta") and last_day is not None:
+                span = True
+        elif last_day is not None:
+            span = True
+
+    return week if found else None
+
+
+def is_open(week, weekday: int, minutes: int) -> bool:
+    """True if the slot containing minutes on weekday (0 = Monday) is open."""
+    if week is None:
+        return False
+    return bool(week >> (weekday * SLOTS_PER_DAY + minutes // TURNO_SLOT_MINUTES) & 1)
+
+
+def day_mask(week, weekday: int) -> int:
+    """Open slots of one weekday as a day bitmap (all slots if no schedule)."""
+    if week is None:
+        return DAY_MASK
+    return week >> (weekday * SLOTS_PER_DAY) & DAY_MASK
+
+
+def _date_or_none(year: int, month: int, day: int):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def resolve_fecha(fecha: str, today: date = None):
+    """
+    Calendar day named by a free-text fecha, or None if it can't be resolved.
+
+    Understands "hoy", "mañana", "pasado mañana", day names ("el lunes":
+    the next one, a week ahead if today is that day), dd/mm[/yyyy] and
+    "15 de marzo [de 2027]". Dates without a year that already passed this
+    year are taken as next year's.
+
+    Examples:
+        >>> resolve_fecha("el lunes", today=date(2026, 1, 1))
+        datetime.date(2026, 1, 5)
+        >>> resolve_fecha("a la tarde") is None
+        True
+    """
+    today = today or business_today()
+    normalized = fecha_key(fecha)
+
+    match = _DATE_RE.search(normalized)
+    if match:
+        day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+    else:
+        match = _LONG_DATE_RE.search(normalized)
+        if match and match.group(2) in MONTHS:
+            day, month, year = int(match.group(1)), MONTHS[match.group(2)], match.group(3)
+        else:
+            match = None
+    if match:
+        if year:
+            year = int(year)
+            return _date_or_none(year + 2000 if year < 100 else year, month, day)
+        dia = _date_or_none(today.year, month, day)
+        if dia is not None and dia < today:
+            dia = _date_or_none(today.year + 1, month, day)
+        return dia
+
+    words = re.findall(r"[a-z]+", normalized)
+    if "pasado" in words and "manana" in words:
+        return today + timedelta(days=2)
+    if "manana" in words:
+        return today + timedelta(days=1)
+    if "hoy" in words:
+        return today
+    for word in words:
+        day = _day_of(word)
+        if day is not None:
+            return today + timedelta(days=(day - today.weekday()) % 7 or 7)
+    return None
+
+
+def weekday_for_fecha(fecha: str, today: date = None):
+    """Weekday (0 = Monday) of the day named by a free-text fecha, or None if unknown."""
+    dia = resolve_fecha(fecha, today)
+    return dia.weekday() if dia is not None else None
+
+
+def set_schedule(comercio_id: int, horarios: str):
+    """Compile and cache the schedule of a commerce (call at setup time)."""
+    week = compile_horarios(horarios or "")
+    with _lock:
+        _schedules[comercio_id] = week
+    return week
+
+
+def get_schedule(comercio_id: int):
+    """
+    Cached weekly bitmap of a commerce, compiled from the comercios table on first use.
+
+    Defensive behavior:
+    - Logs errors but doesn't crash
+    - Returns None (no schedule) on error
+    """
+    with _lock:
+        if comercio_id in _schedules:
+            return _schedules[comercio_id]
+
+    try:
+        db = SessionLocal()
+        try:
+            horarios = db.query(Comercio.horarios).filter(Comercio.id == comercio_id).scalar()
+        finally:
+            db.close()
+    except Exception as e:
+        log.error("Failed to load horarios for comercio %s: %s", comercio_id, e)
+        return None
+
+    return set_schedule(comercio_id, horarios)
+
+
+def is_open_now(comercio_id: int, now: datetime):
+    """True/False if the commerce has a schedule, None otherwise."""
+    week = get_schedule(comercio_id)
+    if week is None:
+        return None
+    return is_open(week, now.weekday(), now.hour * 60 + now.minute)
+
+
+def clear() -> None:
+    """Drop every cached schedule."""
+    with _lock:
+        _schedules.clear()
@@ -2,18 +2,231 @@
 Global conversation state management with disk persistence.
 
 This module provides a global conversations dictionary that:
-- Persists to disk automatically
-- Loads from disk at startup
+- Persists to disk automatically (one log record or row per mutation)
+- Loads from disk at startup (json backend: snapshot + log tail), in
+  load(): called from the app lifespan, else by the first access. Importing
+  this module does no I/O
 - Survives FastAPI restarts
+
+Backends (config.STATE_BACKEND):
+- json: every conversation is loaded into conversaciones by load()
+- json + STATE_LAZY_LOAD: only the snapshot index is loaded by load();
+  conversations are read from disk on first access
+- sqlite: conversations are rows read on demand
+
+With a cold store (sqlite or lazy json), conversaciones is a bounded LRU
+cache (STATE_CACHE_*); evicted conversations are re-read on miss.
+
+Durability (config.STATE_DURABILITY):
+- per_write: every mutation is written before returning
+- grouped: mutated phones are tracked in a dirty set and written together
+  by flush(), at most STATE_FLUSH_INTERVAL_MS later or once
+  STATE_FLUSH_MAX_PENDING phones are pending. Call flush() on shutdown.
+  The engine mutates conversation dicts in place, so each one is copied
+  when marked dirty: flush() serializes the copy, never a dict that is
+  being changed. A failed flush keeps its batch for the next one.
 """
 
-from app.persistence import load_state, save_state
+import copy
+import threading
+from app.cache import LRUCache
+from app.log import get_logger
+from app.config import (
+    STATE_BACKEND,
+    STATE_CACHE_MAX_ENTRIES,
+    STATE_CACHE_MAX_BYTES,
+    STATE_CACHE_TTL_SECONDS,
+    STATE_DURABILITY,
+    STATE_FLUSH_INTERVAL_MS,
+    STATE_FLUSH_MAX_PENDING,
+    STATE_LAZY_LOAD,
+)
+from app.persistence import (
+    load_state,
+    import_json_state,
+    append_state,
+    load_state_index,
+    read_indexed_conversation,
+    load_conversation,
+    upsert_conversations,
+)
+
+log = get_logger("state")
+
+if STATE_BACKEND not in ("json", "sqlite"):
+    log.warning("Unknown STATE_BACKEND=%r, using json", STATE_BACKEND)
+    STATE_BACKEND = "json"
+
+if STATE_DURABILITY not in ("per_write", "grouped"):
+    log.warning("Unknown STATE_DURABILITY=%r, using per_write", STATE_DURABILITY)
+    STATE_DURABILITY = "per_write"
 
 # Global conversations state
-# Will be loaded from disk at startup
-conversaciones = load_state()
+# Cold store (sqlite rows or lazy json index): filled on first access, bounded
+# Eager json: filled by load(), unbounded (nothing to fall back on)
+if STATE_BACKEND == "sqlite" or STATE_LAZY_LOAD:
+    conversaciones = LRUCache(
+        max_entries=STATE_CACHE_MAX_ENTRIES,
+        max_bytes=STATE_CACHE_MAX_BYTES,
+        ttl_seconds=STATE_CACHE_TTL_SECONDS
+    )
+else:
+    conversaciones = LRUCache()
+
+# Cold store: phones known to have no conversation, so repeated messages
+# from unknown senders (spam floods) don't hit the disk on every message
+_absent = LRUCache(max_entries=STATE_CACHE_MAX_ENTRIES, ttl_seconds=STATE_CACHE_TTL_SECONDS)
+
+_load_lock = threading.Lock()
+_loaded = False
+
+# Grouped durability: phone -> latest data (None if deleted) not yet written
+_dirty = {}
+# Batch currently being written by flush()
+_flushing = {}
+_dirty_lock = threading.Lock()
+# Serializes writers so an older batch never lands after a newer one
+_flush_lock = threading.Lock()
+_flush_timer = None
+
+
+def load() -> None:
+    """
+    Load persisted state once per process: every conversation (eager json)
+    or the snapshot index (lazy json); sqlite rows are read on demand, after
+    importing the json files left by a json deployment (import_json_state).
+
+    The app lifespan calls it on startup; otherwise the first
+    get/update/delete does.
+    """
+    global _loaded
+    with _load_lock:
+        if _loaded:
+            return
+        if STATE_BACKEND == "json" and STATE_LAZY_LOAD:
+            load_state_index()
+        elif STATE_BACKEND == "json":
+            for phone, conv in load_state().items():
+                conversaciones[phone] = conv
+        elif import_json_state():
+            # Imported phones may have been looked up (and missed) already
+            _absent.clear()
+        _loaded = True
+
+    log.info(
+        "Initialized with %d conversation(s)", len(conversaciones),
+        extra={"backend": STATE_BACKEND, "lazy": STATE_LAZY_LOAD, "durability": STATE_DURABILITY},
+    )
+
+
+def _has_cold_store() -> bool:
+    return STATE_BACKEND == "sqlite" or STATE_LAZY_LOAD
+
+
+def _load_cold(phone: str):
+    """Read one conversation from the cold store, or None."""
+    if STATE_BACKEND == "sqlite":
+        return load_conversation(phone)
+    return read_indexed_conversation(phone)
+
+
+def _write(changes: dict) -> bool:
+    """Write mutated conversations (phone -> dict, or None if deleted); False if not written."""
+    if STATE_BACKEND == "sqlite":
+        return upsert_conversations(changes)
+    return append_state(changes)
+
+
+def _persist(changes: dict) -> None:
+    """Write now (per_write) or mark dirty for the next group commit (grouped)."""
+    if STATE_DURABILITY != "grouped":
+        _write(changes)
+        return
+
+    # Copy as of this call: the live dict may change while the flusher writes it
+    snapshot = {phone: copy.deepcopy(data) for phone, data in changes.items()}
+    with _dirty_lock:
+        _dirty.update(snapshot)
+        flush_now = len(_dirty) >= STATE_FLUSH_MAX_PENDING
+        if not flush_now:
+            _schedule_flush()
+
+    if flush_now:
+        flush()
 
-print(f"[STATE] Initialized with {len(conversaciones)} conversation(s)")
+
+def _schedule_flush() -> None:
+    """Start the flush timer if it isn't running (caller holds _dirty_lock)."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(STATE_FLUSH_INTERVAL_MS / 1000, flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def flush() -> int:
+    """
+    Write every pending mutation in a single batch.
+
+    Safe to call in any durability mode; a no-op when nothing is pending.
+
+    Defensive behavior:
+    - If the write fails the batch goes back to the dirty set (unless newer
+      data arrived meanwhile) and is retried after the next window
+
+    Returns:
+        Number of conversations written (0 if the write failed)
+    """
+    global _flush_timer, _flushing
+
+    with _flush_lock:
+        with _dirty_lock:
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+            changes = dict(_dirty)
+            _dirty.clear()
+            _flushing = changes
+
+        written = False
+        try:
+            written = not changes or _write(changes)
+        except Exception as e:
+            log.exception("State flush raised: %s", e)
+        finally:
+            with _dirty_lock:
+                _flushing = {}
+                if not written:
+                    for phone, data in changes.items():
+                        _dirty.setdefault(phone, data)
+                    _schedule_flush()
+
+        if not written:
+            log.error("State flush failed, %d conversation(s) kept for retry", len(changes))
+            return 0
+
+    return len(changes)
+
+
+def _pending(phone: str):
+    """
+    Unwritten data for phone as (found, data); data is None if deleted.
+    """
+    with _dirty_lock:
+        for batch in (_dirty, _flushing):
+            if phone in batch:
+                return True, batch[phone]
+    return False, None
+
+
+def pending_writes() -> int:
+    """Number of conversations waiting for the next group commit."""
+    return len(_dirty)
+
+
+def cache_stats() -> dict:
+    """Hit/miss/eviction counters of the conversation cache."""
+    return {**conversaciones.stats(), "known_absent": len(_absent)}
 
 
 def update_conversation(phone: str, data: dict) -> None:
@@ -30,8 +243,11 @@ def update_conversation(phone: str, data: dict) -> None:
             "nombre": "Barbería X"
         })
     """
+    if not _loaded:
+        load()
     conversaciones[phone] = data
-    save_state(conversaciones)
+    _absent.pop(phone)
+    _persist({phone: data})
 
 
 def get_conversation(phone: str) -> dict:
@@ -44,7 +260,21 @@ def get_conversation(phone: str) -> dict:
     Returns:
         Conversation dict or empty dict if not found
     """
-    return conversaciones.get(phone, {})
+    if not _loaded:
+        load()
+    conv = conversaciones.get(phone)
+
+    if conv is None and _has_cold_store() and phone not in _absent:
+        # Evicted before the group commit: pending data is the latest
+        found, conv = _pending(phone)
+        if not found:
+            conv = _load_cold(phone)
+        if conv is not None:
+            conversaciones[phone] = conv
+        else:
+            _absent[phone] = True
+
+    return conv if conv is not None else {}
 
 
 def delete_conversation(phone: str) -> None:
@@ -54,6 +284,14 @@ def delete_conversation(phone: str) -> None:
     Args:
         phone: Phone number (sender)
     """
+    if not _loaded:
+        load()
     if phone in conversaciones:
         del conversaciones[phone]
-        save_state(conversaciones)
+        _persist({phone: None})
+    elif _has_cold_store() and phone not in _absent:
+        # Not cached, but the cold store may still have it
+        _persist({phone: None})
+
+    if _has_cold_store():
+        _absent[phone] = True
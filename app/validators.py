@@ -5,6 +5,7 @@ Provides minimal validation for:
 - Business name (nombre)
 - Business hours (horarios)
 - Services offered (servicios)
+- Customer WhatsApp number (telefono, activation flow)
 
 Each validator returns tuple[bool, str]:
 - (True, "") if valid
@@ -116,3 +117,50 @@ def validate_servicios(text: str) -> tuple[bool, str]:
         return False, "Los servicios deben incluir nombres (ej: corte, barba)."
 
     return True, ""
+
+
+PHONE_SEPARATORS = " +-()."
+
+
+def normalize_telefono(text: str) -> str:
+    """
+    Digits of a phone number, as WhatsApp expects them (no +, spaces or dashes).
+
+    Examples:
+        >>> normalize_telefono("+54 9 379 412-3456")
+        '5493794123456'
+    """
+    return "".join(c for c in text if c.isdigit())
+
+
+def validate_telefono(text: str) -> tuple[bool, str]:
+    """
+    Validate a customer's WhatsApp number (activation flow).
+
+    Rules:
+    - Only digits and separators (spaces, +, -, parentheses, dots)
+    - 10 to 15 digits (international format, country code included)
+
+    Args:
+        text: User input for the phone number
+
+    Returns:
+        (is_valid, error_message)
+
+    Examples:
+        >>> validate_telefono("+54 9 379 412-3456")
+        (True, "")
+        >>> validate_telefono("412-3456")
+        (False, "El número debe incluir código de país y de área (ej: 5493794123456).")
+    """
+    if not text or any(not c.isdigit() and c not in PHONE_SEPARATORS for c in text):
+        return False, "El número solo puede tener dígitos (ej: 5493794123456)."
+
+    digits = normalize_telefono(text)
+    if len(digits) < 10:
+        return False, "El número debe incluir código de país y de área (ej: 5493794123456)."
+
+    if len(digits) > 15:
+        return False, "El número tiene demasiados dígitos (máximo 15)."
+
+    return True, ""
@@ -1,32 +1,19 @@
-import requests
-from app.config import WHATSAPP_TOKEN, WHATSAPP_PHONE_NUMBER_ID, WHATSAPP_API_VERSION
+from app import graph_client
+from app.log import get_logger
+
+log = get_logger("whatsapp")
 
 def send_message(phone: str, text: str):
-    if not WHATSAPP_TOKEN:
-        print(f"[WhatsApp STUB] To {phone}: {text}")
+    # Token in use (reloaded by the probes), not the one read at import
+    if not graph_client.token():
+        log.info("STUB send to %s", phone, extra={"text": text})
         return
 
-    url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": phone,
-        "type": "text",
-        "text": {
-            "body": text
-        }
-    }
-
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = graph_client.send_text(phone, text)
         response.raise_for_status()
-        print(f"[WhatsApp] Sent to {phone}: {text}")
+        log.debug("Sent to %s", phone, extra={"text": text})
         return response.json()
     except Exception as e:
-        print(f"[WhatsApp ERROR] Failed to send to {phone}: {e}")
+        log.error("Failed to send to %s: %s", phone, e)
         return None
@@ -0,0 +1,202 @@
+"""
+In-process work queue for webhook messages.
+
+The webhook validates and enqueues, then returns 200 right away; worker
+threads run the state machine, persistence and the outbound send.
+
+Scheduling is per key (the sender), actor style: every key has a FIFO
+mailbox and at most one worker runs it at a time, so messages of one sender
+are processed in arrival order while different senders run in parallel on
+any free worker. A worker takes one item per turn and puts a still
+non-empty mailbox back at the end of the ready queue, so a busy sender
+can't starve the others. Empty mailboxes are dropped right away.
+
+Defensive programming:
+- Bounded: submit() refuses work when maxsize items are queued
+- A failing job is logged and counted; the worker keeps running
+- Metrics (depth, wait time, processing time) for the healthcheck
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from app.log import get_logger
+
+log = get_logger("queue")
+
+_STOP = object()
+
+
+def percentile(samples, fraction: float) -> float:
+    """Value at fraction (0-1) of the sorted samples, 0 if empty."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class WorkQueue:
+    """
+    Per-key FIFO mailboxes drained by worker threads.
+
+    Usage:
+        inbox = WorkQueue(process, workers=4, maxsize=10000)
+        inbox.submit(sender, message)   # False if full
+        inbox.join(timeout=5)           # wait until everything was processed
+    """
+
+    def __init__(self, handler, workers: int = 4, maxsize: int = 10000, name: str = "work", samples: int = 1024):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.name = name
+
+        # key -> deque of (enqueued_at, item); present only while non-empty or running
+        self._mailboxes = {}
+        # Keys with a non-empty mailbox and no worker on them
+        self._ready = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._depth = 0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Recent samples in seconds (bounded, for percentiles)
+        self._wait = deque(maxlen=samples)
+        self._processing = deque(maxlen=samples)
+
+    def start(self) -> None:
+        """Start the workers (no-op if already running)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        log.info("%s: started %d worker(s)", self.name, self.workers)
+
+    def submit(self, key: str, item) -> bool:
+        """
+        Append item to the mailbox of key.
+
+        Returns:
+            False if maxsize items are already queued (item not enqueued)
+        """
+        if not self._threads:
+            self.start()
+
+        with self._lock:
+            if self.maxsize > 0 and self._depth >= self.maxsize:
+                self.rejected += 1
+                full = True
+            else:
+                full = False
+                mailbox = self._mailboxes.get(key)
+                if mailbox is None:
+                    # New or idle key: schedule it
+                    mailbox = self._mailboxes[key] = deque()
+                    self._ready.put(key)
+                mailbox.append((time.monotonic(), item))
+                self._depth += 1
+                self._pending += 1
+                self.enqueued += 1
+
+        if full:
+            log.warning("%s: full, rejected work for %s", self.name, key)
+            return False
+        return True
+
+    def _run(self) -> None:
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+
+            with self._lock:
+                enqueued_at, item = self._mailboxes[key].popleft()
+                self._depth -= 1
+
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handler(item)
+            except Exception as e:
+                failed = True
+                log.exception("%s: %s", self.name, e)
+            finished = time.monotonic()
+
+            with self._lock:
+                self._wait.append(started - enqueued_at)
+                self._processing.append(finished - started)
+                self.processed += 1
+                self.failed += failed
+                self._pending -= 1
+
+                # Next turn for this key, or reclaim its idle mailbox
+                if self._mailboxes[key]:
+                    self._ready.put(key)
+                else:
+                    del self._mailboxes[key]
+
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    def depth(self) -> int:
+        """Items enqueued and not yet picked up by a worker."""
+        return self._depth
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Wait until every submitted item was processed.
+
+        Returns:
+            False if timeout expired first
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self, timeout: float = None) -> bool:
+        """Process what is queued, then stop the workers (start() restarts them)."""
+        drained = self.join(timeout)
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._ready.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+        log.info("%s: stopped (drained: %s)", self.name, drained)
+        return drained
+
+    def stats(self) -> dict:
+        """Counters and latency percentiles (ms) for the healthcheck."""
+        with self._lock:
+            wait, processing = list(self._wait), list(self._processing)
+            counters = {
+                "workers": len(self._threads),
+                "depth": self._depth,
+                "pending": self._pending,
+                "mailboxes": len(self._mailboxes),
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+        return {
+            **counters,
+            "wait_ms": {
+                "p50": round(percentile(wait, 0.50) * 1000, 2),
+                "p99": round(percentile(wait, 0.99) * 1000, 2),
+                "max": round(max(wait, default=0) * 1000, 2),
+            },
+            "processing_ms": {
+                "p50": round(percentile(processing, 0.50) * 1000, 2),
+                "p99": round(percentile(processing, 0.99) * 1000, 2),
+                "max": round(max(processing, default=0) * 1000, 2),
+            },
+        }
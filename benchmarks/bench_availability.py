@@ -0,0 +1,69 @@
+"""
+Benchmark: slot conflict checks with 100k bookings for one commerce.
+
+Compares the per-day bitmaps of app.availability against scanning every
+stored booking (what checking conflicts against a list of turnos costs).
+
+Usage:
+    python -m benchmarks.bench_availability [bookings] [lookups]
+"""
+
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import quiet_logs
+
+quiet_logs()
+
+from app import availability
+
+COMERCIO = -1
+
+
+def synthetic_bookings(n: int) -> list:
+    """n distinct (dia, hora) pairs from today on, 30-minute slots from 08:00 to 20:00."""
+    hours = [f"{h:02d}:{m:02d}" for h in range(8, 20) for m in (0, 30)]
+    today = date.today()
+    return [(today + timedelta(days=i // len(hours)), hours[i % len(hours)]) for i in range(n)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    bookings = synthetic_bookings(n)
+    queries = [random.choice(bookings) for _ in range(lookups)]
+
+    start = time.perf_counter()
+    availability.business_today = date.today
+    availability.clear()
+    availability._today = date.today()  # Seeded directly, not from the table
+    availability._days[COMERCIO] = availability.build_days(bookings)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for dia, hora in queries:
+        availability.is_taken(COMERCIO, dia, hora)
+    bitmap_check = (time.perf_counter() - start) / lookups
+
+    start = time.perf_counter()
+    for dia, hora in queries:
+        availability.suggest_free_slots(COMERCIO, dia, hora)
+    bitmap_suggest = (time.perf_counter() - start) / lookups
+
+    scan_lookups = min(lookups, 200)
+    start = time.perf_counter()
+    for dia, hora in queries[:scan_lookups]:
+        any(d == dia and h == hora for d, h in bookings)
+    scan_check = (time.perf_counter() - start) / scan_lookups
+
+    print(f"{n:,} bookings, {len(availability._days.get(COMERCIO)):,} days")
+    print(f"build bitmaps:        {build * 1000:10.1f} ms (once per commerce)")
+    print(f"conflict (bitmap):    {bitmap_check * 1e6:10.2f} µs")
+    print(f"next free (bitmap):   {bitmap_suggest * 1e6:10.2f} µs")
+    print(f"conflict (scan):      {scan_check * 1e6:10.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: sending 100k stored drafts, load-all vs app.campaign.
+
+Runs in a throwaway working directory (fresh data/nordia.db) and sends to a
+no-op callback, so it measures the database side of a campaign:
+- load all: query every pending MessageDraft as ORM objects, send, set
+  their status and commit once at the end (a commit per row is far slower)
+- campaign: keyset pages, concurrent sends, one executemany per page
+Reports drafts/s and peak Python memory (tracemalloc) of each.
+
+Usage:
+    python -m benchmarks.bench_campaign [drafts] [batch_size]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import quiet_logs, use_temp_workdir
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    drafts = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    workdir = use_temp_workdir()
+    quiet_logs()
+
+    from sqlalchemy import insert, update
+    from app import campaign
+    from app.models import SessionLocal, MessageDraft, engine, init_db
+
+    init_db()
+    with engine.begin() as connection:
+        connection.execute(insert(MessageDraft), [
+            {
+                "customer_name": f"Cliente {i}",
+                "commercial_intent": "ofrecer lentes nuevos con descuento",
+                "generated_message": f"Hola Cliente {i}, tenemos lentes nuevos con descuento para vos.",
+                "customer_phone": f"549110{i:07d}",
+            }
+            for i in range(drafts)
+        ])
+
+    def send(to, text):
+        pass
+
+    def load_all():
+        db = SessionLocal()
+        for draft in db.query(MessageDraft).filter(MessageDraft.status == "pending").all():
+            send(draft.customer_phone, draft.generated_message)
+            draft.status = "sent"
+        db.commit()
+        db.close()
+
+    results = {"load all": measure(load_all)}
+
+    with engine.begin() as connection:
+        connection.execute(update(MessageDraft).values(status="pending"))
+
+    results["campaign"] = measure(lambda: campaign.run(send, "bench", batch_size=batch_size, rate=0))
+
+    os.chdir("/")
+    workdir.cleanup()
+
+    print(f"{drafts} drafts, campaign pages of {batch_size}")
+    print(f"{'runner':<10} {'drafts/s':>10} {'seconds':>9} {'peak MB':>9}")
+    for name, (elapsed, peak) in results.items():
+        print(f"{name:<10} {drafts / elapsed:>10.0f} {elapsed:>9.2f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
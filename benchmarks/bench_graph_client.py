@@ -0,0 +1,120 @@
+"""
+Benchmark: outbound sends, bare requests.post vs the pooled graph_client.
+
+A local fake Graph API (HTTP/1.1, keep-alive, optional per-request delay)
+receives text messages from N sender threads, like the queue workers do:
+- bare post: the former code path, a new connection and freshly built URL,
+  headers and payload per message
+- pooled client: app.graph_client, keep-alive connections reused
+Reports sends/s and per-send p50/p99.
+
+The fake server is plain HTTP on localhost, so the numbers only include
+the TCP connect saved per message; against Graph every new connection
+also pays a TLS handshake and a real network round trip.
+
+Usage:
+    python -m benchmarks.bench_graph_client [messages] [threads] [graph_delay_ms]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import quiet_logs
+
+GRAPH_DELAY = 0.0
+
+
+class KeepAliveGraphAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body in one write: no Nagle/delayed-ACK stalls on reused connections
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._reply({"id": "fake"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if GRAPH_DELAY:
+            time.sleep(GRAPH_DELAY)
+        self._reply({"messages": [{"id": "wamid.fake"}]})
+
+    def _reply(self, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(send, messages: int, threads: int):
+    """Total seconds and per-send latencies."""
+    def timed(i):
+        start = time.perf_counter()
+        response = send(f"549110{i:07d}", "Hola 👋 Soy Nordia. Escribí 'setup' para comenzar.")
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(messages)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    global GRAPH_DELAY
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    GRAPH_DELAY = (int(sys.argv[3]) if len(sys.argv) > 3 else 0) / 1000
+
+    ThreadingHTTPServer.request_queue_size = 256
+    ThreadingHTTPServer.daemon_threads = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveGraphAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["WHATSAPP_TOKEN"] = "fake-token-for-load-test"
+    os.environ["WHATSAPP_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["WHATSAPP_POOL_SIZE"] = str(threads)
+
+    quiet_logs()
+    import requests
+    from app import config, graph_client
+    from app.work_queue import percentile
+
+    def bare_post(to, text):
+        # Former send path: new connection, URL and headers on every message
+        url = f"{config.WHATSAPP_API_BASE_URL}/{config.WHATSAPP_API_VERSION}/{config.WHATSAPP_PHONE_NUMBER_ID}/messages"
+        headers = {"Authorization": f"Bearer {config.WHATSAPP_TOKEN}", "Content-Type": "application/json"}
+        payload = {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": text}}
+        return requests.post(
+            url, json=payload, headers=headers,
+            timeout=(config.WHATSAPP_CONNECT_TIMEOUT_SECONDS, config.WHATSAPP_READ_TIMEOUT_SECONDS)
+        )
+
+    results = {
+        "bare post": run(bare_post, messages, threads),
+        "pooled client": run(graph_client.send_text, messages, threads),
+    }
+    graph_client.close()
+    server.shutdown()
+
+    print(f"{messages} sends from {threads} threads, Graph API delay {GRAPH_DELAY * 1000:.0f} ms")
+    print(f"{'client':<14} {'sends/s':>9} {'p50':>9} {'p99':>9}")
+    for name, (total, latencies) in results.items():
+        print(
+            f"{name:<14} {messages / total:>9.0f} {percentile(latencies, 0.5) * 1000:>7.2f}ms "
+            f"{percentile(latencies, 0.99) * 1000:>7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
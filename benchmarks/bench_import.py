@@ -0,0 +1,73 @@
+"""
+Benchmark: import time of app.main (python -X importtime).
+
+Imports app.main in fresh processes from a throwaway working directory
+(no .env, no data/) and reports the median cumulative import time, the
+app modules and the slowest third-party packages. Importing must not do
+I/O: the token is validated in the background after startup and the
+schema is created by the lifespan, so a slow Graph API or a big database
+don't show up here.
+
+Exits with status 1 if the median is over the budget (default 1500 ms).
+
+Usage:
+    python -m benchmarks.bench_import [budget_ms] [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def importtime(cwd: str) -> dict:
+    """{module: (self_us, cumulative_us)} for one fresh `import app.main`."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "LOG_LEVEL": "WARNING"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as cwd:
+        samples = [importtime(cwd) for _ in range(runs)]
+        created = sorted(p.name for p in Path(cwd).iterdir())
+
+    # Median per module across runs
+    names = set.intersection(*(set(s) for s in samples))
+    median = {name: statistics.median(s[name][1] for s in samples) / 1000 for name in names}
+    total = median["app.main"]
+
+    print(f"import app.main: {total:.0f} ms (median of {runs}), budget {budget_ms:.0f} ms")
+    print(f"\n{'app module':<28} {'cumulative ms':>14}")
+    for name in sorted((n for n in names if n.startswith("app.")), key=median.get, reverse=True):
+        print(f"{name:<28} {median[name]:>14.1f}")
+    top_level = [n for n in names if "." not in n and n != "app"]
+    print(f"\n{'slowest packages':<28} {'cumulative ms':>14}")
+    for name in sorted(top_level, key=median.get, reverse=True)[:8]:
+        print(f"{name:<28} {median[name]:>14.1f}")
+    if created:
+        print(f"\nimport created files: {', '.join(created)}")
+
+    if total > budget_ms:
+        print(f"\nOVER BUDGET by {total - budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
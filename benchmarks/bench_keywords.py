@@ -0,0 +1,77 @@
+"""
+Benchmark: intent detection with 10, 100 and 1,000 keywords.
+
+Compares KeywordMatcher (one compiled pass per message) against the
+previous approach of one `keyword in text` scan per keyword. Keywords are
+synthetic Spanish-like words spread over 5 intents; messages are normalized
+customer texts, most of which match nothing (the common case).
+
+Usage:
+    python -m benchmarks.bench_keywords [messages]
+"""
+
+import random
+import sys
+import time
+
+from benchmarks.common import quiet_logs
+
+quiet_logs()
+
+from app.keywords import KeywordMatcher
+
+SYLLABLES = ["ca", "ma", "te", "lo", "ri", "pe", "su", "no", "des", "tra", "cion", "mien", "ble", "gar"]
+
+MESSAGES = [
+    "hola buen dia",
+    "cuanto sale el corte de pelo con lavado",
+    "buenas tardes atienden el sabado a la manana",
+    "queria saber si tienen turno para manana despues de las 18",
+    "gracias",
+]
+
+
+def synthetic_vocabulary(n: int, rng: random.Random) -> dict:
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    return {f"intent{i}": words[i::5] for i in range(5)}
+
+
+def naive_match(vocabulary: dict, text: str) -> set:
+    return {intent for intent, words in vocabulary.items() if any(word in text for word in words)}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rng = random.Random(42)
+    messages = [MESSAGES[i % len(MESSAGES)] for i in range(n)]
+
+    print(f"{n:,} messages")
+    print(f"{'keywords':>9} {'compile':>10} {'compiled':>12} {'per-keyword':>12} {'speedup':>8}")
+    for size in (10, 100, 1_000):
+        vocabulary = synthetic_vocabulary(size, rng)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(vocabulary)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for text in messages:
+            matcher.match(text)
+        compiled = (time.perf_counter() - start) / n
+
+        start = time.perf_counter()
+        for text in messages:
+            naive_match(vocabulary, text)
+        naive = (time.perf_counter() - start) / n
+
+        print(
+            f"{size:>9,} {compile_time * 1000:>8.1f}ms "
+            f"{compiled * 1e6:>10.2f}µs {naive * 1e6:>10.2f}µs {naive / compiled:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
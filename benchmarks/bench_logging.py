@@ -0,0 +1,121 @@
+"""
+Benchmark: webhook latency with logging off, synchronous and asynchronous.
+
+Each configuration runs in a fresh process (LOG_* settings are read at
+import), posting webhooks one after another through the ASGI app in inline
+mode, so the engine, state updates and every log call happen inside the
+request. The outbound send is a no-op. Log lines go to a real file, as
+stdout does under a process manager.
+
+Configurations:
+- off: LOG_LEVEL=ERROR (nothing on the happy path is written)
+- info async / debug async: records formatted and written by the writer thread
+- debug sync: every record (including the full payload) formatted and
+  written inside the request, like the former print() calls
+- debug async sampled: LOG_SAMPLING=webhook=0.01,engine=0.01,whatsapp=0.01
+
+Conversation state goes to a temp directory.
+
+Usage:
+    python -m benchmarks.bench_logging [webhooks]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+CONFIGS = {
+    "off": {"LOG_LEVEL": "ERROR"},
+    "info async": {"LOG_LEVEL": "INFO"},
+    "debug sync": {"LOG_LEVEL": "DEBUG", "LOG_ASYNC": "false"},
+    "debug async": {"LOG_LEVEL": "DEBUG"},
+    "debug async sampled": {"LOG_LEVEL": "DEBUG", "LOG_SAMPLING": "webhook=0.01,engine=0.01,whatsapp=0.01"},
+}
+
+
+def payload(i: int) -> dict:
+    return {"entry": [{"changes": [{"value": {"messages": [{
+        "from": f"549110{i % 500:07d}", "type": "text", "text": {"body": "hola, ¿cuánto sale un corte?"}
+    }]}}]}]}
+
+
+async def post_all(app, n: int) -> list:
+    """Per-request latencies of n sequential webhooks."""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        latencies = []
+        for i in range(n):
+            start = time.perf_counter()
+            await http.post("/webhook", json=payload(i))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+
+def child(n: int, workdir: str) -> None:
+    """Run in a fresh process with the LOG_* environment of one configuration."""
+    # State files and nordia.db under the parent's temp dir, not the repo's data/
+    os.chdir(workdir)
+    os.makedirs("data")
+
+    import app.main as main_module
+    from app import log
+    main_module.init_db()  # As the lifespan does on startup
+    from app.work_queue import percentile
+
+    async def no_send(to, text):
+        return None
+
+    main_module.WEBHOOK_MODE = "inline"
+    main_module.send_whatsapp_message_async = no_send
+
+    latencies = asyncio.run(post_all(main_module.app, n))
+    log.shutdown()
+
+    sys.stderr.write(json.dumps({
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "total": sum(latencies),
+        "dropped": log.stats()["dropped"],
+    }) + "\n")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(int(sys.argv[2]), sys.argv[3])
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{n} sequential webhooks (inline mode, no-op send)")
+    print(f"{'logging':<22} {'msg/s':>8} {'p50':>9} {'p99':>9} {'lines':>7} {'dropped':>8}")
+
+    for name, env in CONFIGS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp) / "stdout.log"
+            with open(out, "w") as stdout:
+                proc = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_logging", "--child", str(n), tmp],
+                    env={**os.environ, "WEBHOOK_MODE": "inline", "STATELESS_INICIAL": "false", **env},
+                    stdout=stdout,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    check=True,
+                )
+            result = json.loads(proc.stderr.strip().splitlines()[-1])
+            with open(out) as f:
+                lines = sum(1 for _ in f)
+
+        print(
+            f"{name:<22} {n / result['total']:>8.0f} {result['p50'] * 1000:>7.2f}ms "
+            f"{result['p99'] * 1000:>7.2f}ms {lines:>7} {result['dropped']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: per-message text analysis CPU, plain strings vs MessageContext.
+
+Runs the analysis a "completado" message goes through in the engine
+(dispatcher command check, then appointment, hours and service keyword
+checks) without touching conversation state. With plain strings every
+check strips/lowercases/normalizes the text again; with a MessageContext
+each form is computed once and shared.
+
+Usage:
+    python -m benchmarks.bench_message_context [messages]
+"""
+
+import sys
+import time
+
+from benchmarks.common import quiet_logs
+
+quiet_logs()
+
+from app.dispatcher import dispatch_signal
+from app.engine import (
+    contains_appointment_keyword,
+    contains_hours_query_keyword,
+    contains_service_query_keyword,
+)
+from app.message_context import MessageContext
+
+SENDER = "123456789"  # Test number: reaches the dispatcher command check
+
+SAMPLES = [
+    "hola",
+    "¿Cuánto sale el corte de pelo con lavado?",
+    "Buenas tardes, ¿atienden el sábado a la mañana?",
+    "Quería saber si tienen turno para mañana después de las 18",
+    "gracias!! 🙌",
+]
+
+
+def analyze(text) -> None:
+    dispatch_signal(SENDER, text, "completado")
+    contains_appointment_keyword(text)
+    contains_hours_query_keyword(text)
+    contains_service_query_keyword(text)
+
+
+def run(messages: list, wrap: bool) -> float:
+    start = time.perf_counter()
+    for text in messages:
+        analyze(MessageContext(text) if wrap else text)
+    return (time.perf_counter() - start) / len(messages)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    messages = [SAMPLES[i % len(SAMPLES)] for i in range(n)]
+
+    # Warm up imports and caches
+    run(messages[:1000], True)
+    run(messages[:1000], False)
+
+    plain = run(messages, False)
+    shared = run(messages, True)
+
+    print(f"{n:,} messages")
+    print(f"plain str (re-analyzed per check): {plain * 1e6:8.2f} µs/message")
+    print(f"MessageContext (once per message): {shared * 1e6:8.2f} µs/message")
+    print(f"speedup: {plain / shared:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
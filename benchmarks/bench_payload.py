@@ -0,0 +1,128 @@
+"""
+Benchmark: webhook body parsing, `payload: dict` vs raw body + lean extractor.
+
+Two minimal FastAPI apps receive the same realistic Cloud API payloads
+(metadata, contacts, messages) and only extract the messages, so the
+numbers isolate body handling from the engine:
+- dict: FastAPI decodes and validates the body as `payload: dict`, then the
+  former iter_messages walk over nested dicts
+- raw: read_body + decode + extract into slotted InboundMessage records
+
+Payloads: one message, and 100 messages batched under one change.
+Also reports the extraction step alone (body bytes -> messages).
+
+Usage:
+    python -m benchmarks.bench_payload [requests]
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.common import quiet_logs
+
+quiet_logs()
+
+from fastapi import FastAPI, Request
+from app.main import read_body
+from app.payload import decode, extract
+from app.work_queue import percentile
+
+
+def realistic_payload(messages: int) -> bytes:
+    return json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "102290129340398",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550783881", "phone_number_id": "976165072250440"},
+                    "contacts": [{"profile": {"name": f"Cliente {i}"}, "wa_id": f"549110{i:07d}"} for i in range(messages)],
+                    "messages": [{
+                        "from": f"549110{i:07d}",
+                        "id": f"wamid.HBgNNTQ5MTEwMDAwMDAwMBUCABIYFjNFQjA{i:08d}",
+                        "timestamp": "1700000000",
+                        "type": "text",
+                        "text": {"body": "Hola, ¿cuánto sale un corte de pelo y barba para el sábado?"},
+                    } for i in range(messages)],
+                },
+            }],
+        }],
+    }).encode()
+
+
+def iter_messages(payload: dict):
+    """The webhook's former extraction walk."""
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            yield from (change.get("value") or {}).get("messages") or []
+
+
+dict_app = FastAPI()
+raw_app = FastAPI()
+extracted = []
+
+
+@dict_app.post("/webhook")
+async def dict_webhook(payload: dict):
+    extracted.append(len([m.get("from") for m in iter_messages(payload)]))
+    return {"status": "ok"}
+
+
+@raw_app.post("/webhook")
+async def raw_webhook(request: Request):
+    extracted.append(len(extract(decode(await read_body(request, 1048576))).messages))
+    return {"status": "ok"}
+
+
+async def post_all(app, body: bytes, n: int) -> list:
+    """Latencies of n sequential posts of body."""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Content-Type": "application/json"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            await http.post("/webhook", content=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+
+def extraction_us(parse, body: bytes, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        parse(body)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    from pydantic import TypeAdapter
+    as_dict = TypeAdapter(dict)
+
+    parsers = {
+        "dict": lambda body: [m.get("from") for m in iter_messages(as_dict.validate_python(json.loads(body)))],
+        "raw": lambda body: extract(decode(body)).messages,
+    }
+
+    print(f"{n} sequential webhooks per row")
+    print(f"{'payload':<14} {'path':<6} {'bytes':>8} {'p50':>9} {'p99':>9} {'extract':>11}")
+    for messages in (1, 100):
+        body = realistic_payload(messages)
+        for name, app in (("dict", dict_app), ("raw", raw_app)):
+            extracted.clear()
+            latencies = asyncio.run(post_all(app, body, n))
+            assert extracted and all(count == messages for count in extracted)
+            print(
+                f"{messages:>3} message(s) {name:<6} {len(body):>8} {percentile(latencies, 0.5) * 1e6:>7.0f}us "
+                f"{percentile(latencies, 0.99) * 1e6:>7.0f}us {extraction_us(parsers[name], body, n):>9.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
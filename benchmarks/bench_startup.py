@@ -0,0 +1,68 @@
+"""
+Benchmark: startup time with eager load_state() vs lazy load_state_index().
+
+Writes a synthetic snapshot with N conversations (plus a short log tail)
+to a temp directory, then measures how long each startup mode takes
+before the first request could be served, and the first lazy read.
+
+Usage:
+    python -m benchmarks.bench_startup [N ...]      # default: 100000 1000000
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import quiet_logs
+
+quiet_logs()
+
+from app import persistence
+
+
+def synthetic_state(n: int) -> dict:
+    return {
+        f"549379{i:07d}": {
+            "estado": "completado",
+            "nombre": f"Comercio {i}",
+            "horarios": "Lun-Vie 9-18hs, Sab 9-13",
+            "servicios": "Corte $5000, barba $3000, color $8000"
+        }
+        for i in range(n)
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run(n: int, tmp: Path) -> None:
+    persistence.STATE_FILE = tmp / f"state_{n}.json"
+    persistence.STATE_COMPACT_THRESHOLD = 10 ** 9
+
+    persistence.save_state(synthetic_state(n))
+    for i in range(0, 1000):
+        persistence.append_state({f"549379{i:07d}": {"estado": "esperando_fecha_turno"}})
+
+    size_mb = persistence.STATE_FILE.stat().st_size / 1e6
+    _, eager = timed(persistence.load_state)
+    _, lazy = timed(persistence.load_state_index)
+    _, first_read = timed(lambda: persistence.read_indexed_conversation(f"549379{n // 2:07d}"))
+
+    print(f"{n:>10,} {size_mb:>9.1f} {eager:>10.3f} {lazy:>10.3f} {first_read * 1000:>12.3f}")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+
+    print(f"{'convs':>10} {'file MB':>9} {'eager s':>10} {'lazy s':>10} {'1st read ms':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            run(n, Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: messages/s for per_write vs grouped state durability.
+
+Each simulated inbound message mutates one conversation through
+app.state.update_conversation, as the engine does on every transition.
+Runs in a throwaway working directory: the json files and the sqlite
+backend's data/nordia.db are created there, never in the repo's data/.
+
+Usage:
+    python -m benchmarks.bench_state_durability [messages] [senders]
+"""
+
+import sys
+import time
+
+from benchmarks.common import quiet_logs, use_temp_workdir
+
+quiet_logs()
+_workdir = use_temp_workdir()
+
+from app import persistence, state
+from app.models import init_db
+init_db()
+
+
+def run(backend: str, durability: str, messages: int, senders: int) -> float:
+    state.STATE_BACKEND = backend
+    state.STATE_DURABILITY = durability
+    state.conversaciones.clear()
+
+    phones = [f"bench-{i}" for i in range(senders)]
+    start = time.perf_counter()
+    for i in range(messages):
+        phone = phones[i % senders]
+        state.update_conversation(phone, {
+            "estado": "completado",
+            "nombre": "Barbería Bench",
+            "servicios": "Corte $5000, barba $3000",
+            "mensajes": i
+        })
+    state.flush()
+    elapsed = time.perf_counter() - start
+
+    for phone in phones:
+        state.delete_conversation(phone)
+    state.flush()
+    return messages / elapsed
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    senders = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    # Keep compaction out of the measurement
+    persistence.STATE_COMPACT_THRESHOLD = messages * 10
+
+    print(f"{messages} messages across {senders} senders")
+    print(f"{'backend':<8} {'durability':<10} {'msg/s':>12}")
+    for backend in ("json", "sqlite"):
+        for durability in ("per_write", "grouped"):
+            rate = run(backend, durability, messages, senders)
+            print(f"{backend:<8} {durability:<10} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
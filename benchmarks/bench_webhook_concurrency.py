@@ -0,0 +1,135 @@
+"""
+Load test: concurrent webhooks against a deliberately slow fake Graph API.
+
+Starts a local HTTP server that answers /me immediately and delays every
+/messages call, points the app at it (WHATSAPP_API_BASE_URL), and posts
+concurrent webhooks through the ASGI app. Compares:
+- inline, blocking: requests.post on the event loop (original behavior)
+- inline, send pool: the send runs in the bounded thread pool
+- queued: the webhook only enqueues; workers process and send
+Reports total time and per-webhook latency (p50/p99). For queued mode,
+"drained" is when the last reply was sent.
+
+Senders are non-admin numbers in "inicial", so the engine replies without
+touching conversation state and the numbers measure the webhook path only.
+Runs in a throwaway working directory (fresh data/nordia.db).
+
+Usage:
+    python -m benchmarks.bench_webhook_concurrency [webhooks] [graph_delay_ms]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import quiet_logs, use_temp_workdir
+
+GRAPH_DELAY = 0.2
+
+
+class FakeGraphAPI(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._reply({"id": "fake"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(GRAPH_DELAY)
+        self._reply({"messages": [{"id": "wamid.fake"}]})
+
+    def _reply(self, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def payload(i: int) -> dict:
+    return {"entry": [{"changes": [{"value": {"messages": [{
+        "from": f"549110{i:07d}", "type": "text", "text": {"body": "hola"}
+    }]}}]}]}
+
+
+async def post_all(app, n: int):
+    """Total seconds and per-request latencies of n concurrent webhooks."""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def timed(i):
+            start = time.perf_counter()
+            await http.post("/webhook", json=payload(i))
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(i) for i in range(n)))
+        return time.perf_counter() - start, latencies
+
+
+def main():
+    global GRAPH_DELAY
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    GRAPH_DELAY = (int(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1000
+
+    ThreadingHTTPServer.request_queue_size = 256  # Default backlog (5) stalls concurrent connects
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGraphAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = use_temp_workdir()
+    os.environ["WHATSAPP_TOKEN"] = "fake-token-for-load-test"
+    os.environ["WHATSAPP_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    quiet_logs()
+    import app.main as main_module
+    main_module.init_db()  # As the lifespan does on startup
+    # Measures the send path itself, not the outbox
+    main_module.OUTBOUND_MODE = "direct"
+
+    from app.work_queue import percentile
+
+    async def blocking_send(to, text):
+        # Original behavior: the HTTP call runs on the event loop
+        return main_module.send_whatsapp_message(to, text)
+
+    pooled_send = main_module.send_whatsapp_message_async
+    results = {}
+
+    main_module.WEBHOOK_MODE = "inline"
+    main_module.send_whatsapp_message_async = blocking_send
+    results["inline, blocking send"] = asyncio.run(post_all(main_module.app, n))
+    main_module.send_whatsapp_message_async = pooled_send
+    results["inline, send pool"] = asyncio.run(post_all(main_module.app, n))
+
+    main_module.WEBHOOK_MODE = "queued"
+    main_module.inbox.start()  # As the lifespan does on startup
+    start = time.perf_counter()
+    results["queued"] = asyncio.run(post_all(main_module.app, n))
+    main_module.inbox.join()
+    drained = time.perf_counter() - start
+    main_module.inbox.stop()
+
+    server.shutdown()
+
+    print(
+        f"{n} concurrent webhooks, Graph API delay {GRAPH_DELAY * 1000:.0f} ms, "
+        f"{main_module.WHATSAPP_SEND_WORKERS} send workers, {main_module.WEBHOOK_WORKERS} queue workers"
+    )
+    print(f"{'mode':<24} {'total':>8} {'p50':>10} {'p99':>10}")
+    for mode, (total, latencies) in results.items():
+        print(
+            f"{mode:<24} {total:>7.2f}s {percentile(latencies, 0.5) * 1000:>8.1f}ms "
+            f"{percentile(latencies, 0.99) * 1000:>8.1f}ms"
+        )
+    print(f"queued: all replies sent after {drained:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
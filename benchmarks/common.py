@@ -0,0 +1,29 @@
+"""
+Shared setup for the benchmarks. Call these before importing app modules.
+"""
+
+import os
+import tempfile
+
+
+def use_temp_workdir() -> tempfile.TemporaryDirectory:
+    """
+    Move to a throwaway working directory with an empty data/.
+
+    DB_PATH and STATE_FILE are relative to data/, so a benchmark started
+    from the repo root would otherwise write into the live nordia.db (as
+    tests/conftest.py avoids for the suite). Keep the returned object alive:
+    the directory is removed when it is garbage collected.
+    """
+    workdir = tempfile.TemporaryDirectory(prefix="nordia-bench-")
+    os.chdir(workdir.name)
+    os.makedirs("data")
+    return workdir
+
+
+def quiet_logs(level: str = "WARNING") -> None:
+    """
+    Keep app logs out of the benchmark output (LOG_LEVEL is read when
+    app.config is imported). An explicit LOG_LEVEL in the environment wins.
+    """
+    os.environ.setdefault("LOG_LEVEL", level)
@@ -0,0 +1,47 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# DB_PATH and the state files are relative to data/: run the suite from a
+# temp dir so it never writes into the repo's data/ (set before app imports)
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+WORKDIR = tempfile.mkdtemp(prefix="nordia-tests-")
+os.makedirs(os.path.join(WORKDIR, "data"))
+os.chdir(WORKDIR)
+
+from app import rate_limit  # noqa: E402
+from app.models import init_db  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """A fresh data/nordia.db in the temp dir, as the app lifespan creates it on startup."""
+    init_db()
+    yield
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def full_rate_limit_buckets():
+    """Tests reuse the same phone numbers: start every test with full buckets."""
+    rate_limit.clear()
+    yield
+
+
+@pytest.fixture
+def whatsapp_token(monkeypatch):
+    """A configured token and a fresh, closed token breaker."""
+    from app import graph_client
+    from app.breaker import CircuitBreaker
+
+    graph_client.close()
+    monkeypatch.setattr(graph_client, "_token", "test-token")
+    monkeypatch.setattr(graph_client, "breaker", CircuitBreaker("whatsapp", reset_timeout=30))
+    yield graph_client.breaker
+    graph_client.close()
@@ -16,7 +16,7 @@ from unittest.mock import patch, MagicMock
 # Import functions to test
 from app.engine import handle_message
 from app.state import conversaciones, update_conversation, get_conversation
-from app.persistence import save_state, save_message_draft
+from app.persistence import save_message_draft
 from app.models import SessionLocal, MessageDraft
 
 
@@ -31,7 +31,6 @@ def clean_test_state(tmp_path, monkeypatch):
     # Use temp directory for STATE_FILE
     test_state_file = tmp_path / "test_conversations.json"
     monkeypatch.setattr("app.persistence.STATE_FILE", test_state_file)
-    monkeypatch.setattr("app.state.save_state", lambda data: save_state(data))
 
     yield
 
@@ -54,11 +53,17 @@ def test_activation_happy_path(mock_save_draft):
 
     # Step 2: Usuario escribe nombre del cliente
     response2 = handle_message(sender, "Juan")
-    assert "¿que mensaje queres enviarle a juan?" in response2.lower()
-    assert "escribi la idea en una frase corta" in response2.lower()
-    assert get_conversation(sender)["estado"] == "activation_awaiting_intent"
+    assert "¿cual es el whatsapp de juan?" in response2.lower()
+    assert get_conversation(sender)["estado"] == "activation_awaiting_phone"
     assert get_conversation(sender)["activation_context"]["customer_name"] == "Juan"
 
+    # Step 2b: Usuario escribe el WhatsApp del cliente
+    response2b = handle_message(sender, "+54 9 379 412-3456")
+    assert "¿que mensaje queres enviarle a juan?" in response2b.lower()
+    assert "escribi la idea en una frase corta" in response2b.lower()
+    assert get_conversation(sender)["estado"] == "activation_awaiting_intent"
+    assert get_conversation(sender)["activation_context"]["customer_phone"] == "5493794123456"
+
     # Step 3: Usuario escribe intención comercial
     response3 = handle_message(sender, "ofrecer lentes nuevos")
     assert "borrador listo" in response3.lower()
@@ -71,6 +76,7 @@ def test_activation_happy_path(mock_save_draft):
     response4 = handle_message(sender, "enviar")
     assert "listo" in response4.lower()
     assert "mensaje preparado para juan" in response4.lower()
+    assert "próxima campaña" in response4.lower()
     assert get_conversation(sender)["estado"] == "inicial"
 
     # Verify save_message_draft was called
@@ -79,6 +85,7 @@ def test_activation_happy_path(mock_save_draft):
     assert call_args[0] == "Juan"  # customer_name
     assert call_args[1] == "ofrecer lentes nuevos"  # intent
     assert "Hola Juan" in call_args[2]  # generated_message
+    assert mock_save_draft.call_args.kwargs["customer_phone"] == "5493794123456"
 
 
 def test_activation_cancel_at_name():
@@ -97,6 +104,40 @@ def test_activation_cancel_at_name():
     assert get_conversation(sender)["estado"] == "inicial"
 
 
+def test_activation_cancel_at_phone():
+    """
+    Cancelar activación al pedir el teléfono
+    """
+    sender = "123456789"
+
+    handle_message(sender, "activar cliente")
+    handle_message(sender, "Juan")
+    assert get_conversation(sender)["estado"] == "activation_awaiting_phone"
+
+    response = handle_message(sender, "cancelar")
+    assert "activación cancelada" in response.lower()
+    assert get_conversation(sender)["estado"] == "inicial"
+
+
+def test_activation_invalid_phone_is_asked_again():
+    """
+    Teléfono inválido (sin código de país o con letras) se vuelve a pedir
+    """
+    sender = "123456789"
+
+    handle_message(sender, "activar cliente")
+    handle_message(sender, "Juan")
+
+    response = handle_message(sender, "412-3456")
+    assert "código de país" in response.lower()
+    assert "¿cual es el whatsapp de juan?" in response.lower()
+    assert get_conversation(sender)["estado"] == "activation_awaiting_phone"
+
+    response = handle_message(sender, "no tengo el numero")
+    assert "activación cancelada" not in response.lower()
+    assert get_conversation(sender)["estado"] == "activation_awaiting_phone"
+
+
 def test_activation_cancel_at_intent():
     """
     Cancelar activación en segundo paso (intent)
@@ -106,8 +147,9 @@ def test_activation_cancel_at_intent():
     # Step 1: Activar flujo
     handle_message(sender, "activar cliente")
 
-    # Step 2: Proveer nombre
+    # Step 2: Proveer nombre y teléfono
     handle_message(sender, "Juan")
+    handle_message(sender, "5493794123456")
     assert get_conversation(sender)["estado"] == "activation_awaiting_intent"
 
     # Step 3: Cancelar
@@ -125,8 +167,9 @@ def test_activation_cancel_at_draft():
     # Step 1: Activar flujo
     handle_message(sender, "activar cliente")
 
-    # Step 2: Proveer nombre
+    # Step 2: Proveer nombre y teléfono
     handle_message(sender, "Juan")
+    handle_message(sender, "5493794123456")
 
     # Step 3: Proveer intent
     handle_message(sender, "ofrecer lentes nuevos")
@@ -147,8 +190,9 @@ def test_activation_intent_too_short():
     # Step 1: Activar flujo
     handle_message(sender, "activar cliente")
 
-    # Step 2: Proveer nombre
+    # Step 2: Proveer nombre y teléfono
     handle_message(sender, "Juan")
+    handle_message(sender, "5493794123456")
 
     # Step 3: Proveer intent muy corto
     response = handle_message(sender, "hola")
@@ -166,8 +210,9 @@ def test_activation_unknown_command_at_draft():
     # Step 1: Activar flujo
     handle_message(sender, "activar cliente")
 
-    # Step 2: Proveer nombre
+    # Step 2: Proveer nombre y teléfono
     handle_message(sender, "Juan")
+    handle_message(sender, "5493794123456")
 
     # Step 3: Proveer intent
     handle_message(sender, "ofrecer lentes nuevos")
@@ -6,6 +6,7 @@ Tests complete activation flow with real handle_message function.
 """
 
 from app.engine import handle_message
+from app.models import SessionLocal, MessageDraft
 from app.state import delete_conversation
 
 
@@ -17,11 +18,13 @@ def test_admin_activation_complete_happy_path():
     1. Admin: "activar cliente"
     2. System: asks for customer name
     3. Admin: provides name
-    4. System: asks for intent
-    5. Admin: provides intent
-    6. System: shows draft
-    7. Admin: "enviar"
-    8. System: confirms
+    4. System: asks for the customer's WhatsApp
+    5. Admin: provides phone
+    6. System: asks for intent
+    7. Admin: provides intent
+    8. System: shows draft
+    9. Admin: "enviar"
+    10. System: confirms
     """
     # Use fresh test phone number (in TEST_PHONE_PATTERNS)
     admin_sender = "888111222"
@@ -37,7 +40,12 @@ def test_admin_activation_complete_happy_path():
     # Step 2: Provide customer name
     reply2 = handle_message(admin_sender, "Carlos Martinez")
     assert "carlos" in reply2.lower()
-    assert "mensaje" in reply2.lower()
+    assert "whatsapp" in reply2.lower()
+
+    # Step 2b: Provide customer phone
+    reply2b = handle_message(admin_sender, "5493794000111")
+    assert "carlos" in reply2b.lower()
+    assert "mensaje" in reply2b.lower()
 
     # Step 3: Provide commercial intent
     reply3 = handle_message(admin_sender, "recordar turno de mañana")
@@ -51,5 +59,9 @@ def test_admin_activation_complete_happy_path():
     assert "carlos" in reply4.lower()
     assert "preparado" in reply4.lower() or "guardado" in reply4.lower()
 
-    # Cleanup after test
+    # Cleanup after test: the draft is queued for the campaign
     delete_conversation(admin_sender)
+    db = SessionLocal()
+    db.query(MessageDraft).filter(MessageDraft.customer_phone == "5493794000111").delete()
+    db.commit()
+    db.close()
@@ -0,0 +1,133 @@
+"""
+Tests for appointment slot bitmaps in app/availability.py
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import availability
+from app.availability import (
+    parse_hora,
+    fecha_key,
+    business_today,
+    build_days,
+    is_taken,
+    reserve_slot,
+    release_slot,
+    suggest_free_slots,
+)
+
+COMERCIO = -42  # Never a real row: bitmaps are seeded directly
+LUNES = date(2026, 1, 5)
+MARTES = LUNES + timedelta(days=1)
+VIERNES = LUNES + timedelta(days=4)
+DOMINGO = LUNES + timedelta(days=6)
+
+
+@pytest.fixture(autouse=True)
+def seeded_comercio(monkeypatch):
+    monkeypatch.setattr(availability, "business_today", lambda: LUNES)
+    availability.clear()
+    availability._comercio_days(COMERCIO)  # Start the day before seeding
+    availability._days[COMERCIO] = build_days([(LUNES, "10:00"), (LUNES, "10:30")])
+    yield
+    availability.clear()
+
+
+@pytest.mark.parametrize("text,minutes", [
+    ("15:00", 900),
+    ("15", 900),
+    ("15hs", 900),
+    ("9.30", 570),
+    (" 09:30 hs ", 570),
+    ("23:59", 1439),
+])
+def test_parse_hora_valid(text, minutes):
+    assert parse_hora(text) == minutes
+
+
+@pytest.mark.parametrize("text", ["a la tarde", "25:00", "10:75", ""])
+def test_parse_hora_invalid(text):
+    assert parse_hora(text) is None
+
+
+def test_fecha_key_normalizes_case_accents_spaces():
+    assert fecha_key("  Sábado   12 ") == "sabado 12"
+
+
+def test_is_taken_uses_calendar_day_and_slot():
+    assert is_taken(COMERCIO, LUNES, "10:00")
+    assert is_taken(COMERCIO, LUNES, "10:15")  # Same 30-minute slot
+    assert not is_taken(COMERCIO, LUNES, "11:00")
+    assert not is_taken(COMERCIO, MARTES, "10:00")
+    # Same weekday, next week: a different day
+    assert not is_taken(COMERCIO, LUNES + timedelta(days=7), "10:00")
+
+
+def test_reserve_slot_rejects_conflicts():
+    assert reserve_slot(COMERCIO, MARTES, "10:00")
+    assert not reserve_slot(COMERCIO, MARTES, "10:00")
+
+
+def test_unparseable_hora_never_conflicts():
+    assert reserve_slot(COMERCIO, LUNES, "a la tarde")
+    assert reserve_slot(COMERCIO, LUNES, "a la tarde")
+
+
+def test_unresolved_day_never_conflicts():
+    assert reserve_slot(COMERCIO, None, "10:00")
+    assert reserve_slot(COMERCIO, None, "10:00")
+    assert not is_taken(COMERCIO, None, "10:00")
+
+
+def test_release_slot_frees_it():
+    release_slot(COMERCIO, LUNES, "10:00")
+    assert reserve_slot(COMERCIO, LUNES, "10:00")
+
+
+def test_suggest_next_free_slots_after_requested():
+    assert suggest_free_slots(COMERCIO, LUNES, "10:00") == ["11:00", "11:30", "12:00"]
+
+
+def test_suggest_wraps_to_earlier_slots():
+    for slot in range(availability.SLOTS_PER_DAY):
+        if availability.format_slot(slot) not in ("08:00", "08:30"):
+            reserve_slot(COMERCIO, VIERNES, availability.format_slot(slot))
+
+    assert suggest_free_slots(COMERCIO, VIERNES, "20:00") == ["08:00", "08:30"]
+
+
+def test_suggest_full_day_returns_empty():
+    for slot in range(availability.SLOTS_PER_DAY):
+        reserve_slot(COMERCIO, DOMINGO, availability.format_slot(slot))
+
+    assert suggest_free_slots(COMERCIO, DOMINGO, "10:00") == []
+
+
+def test_new_day_drops_cached_past_days(monkeypatch):
+    monkeypatch.setattr(availability, "business_today", lambda: MARTES)
+
+    # Rebuilt from the table (today and later): the seeded lunes is gone
+    assert not is_taken(COMERCIO, LUNES, "10:00")
+    assert LUNES not in availability._days.get(COMERCIO)
+
+
+def test_loads_only_turnos_from_today_on():
+    from app.models import SessionLocal, Turno
+    from app.persistence import save_turno
+
+    today = business_today()
+    phone = "availability-test-111"
+    save_turno(COMERCIO, phone, "ayer", "10:00", dia=today - timedelta(days=1))
+    save_turno(COMERCIO, phone, "mañana", "10:00", dia=today + timedelta(days=1))
+    save_turno(COMERCIO, phone, "a la tarde", "10:00")
+    try:
+        rows = availability.load_turno_days(COMERCIO, today)
+    finally:
+        db = SessionLocal()
+        db.query(Turno).filter(Turno.cliente_telefono == phone).delete()
+        db.commit()
+        db.close()
+
+    assert rows == {today + timedelta(days=1): 1 << availability._slot("10:00")}
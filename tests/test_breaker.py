@@ -0,0 +1,106 @@
+"""
+Tests for app/breaker.py: closed / open / half-open transitions.
+"""
+
+from types import SimpleNamespace
+from app.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def make_breaker(**kwargs):
+    clock = SimpleNamespace(value=100.0)
+    breaker = CircuitBreaker("test", reset_timeout=30, clock=lambda: clock.value, **kwargs)
+    return breaker, clock
+
+
+def test_closed_allows_calls():
+    breaker, _ = make_breaker()
+
+    assert breaker.state == CLOSED
+    assert all(breaker.allow() for _ in range(5))
+
+
+def test_failure_opens_and_refuses():
+    breaker, _ = make_breaker()
+
+    breaker.record_failure("token expired")
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.refused == 1
+    assert breaker.trips == 1
+    assert breaker.reason == "token expired"
+    assert breaker.open_since is not None
+
+
+def test_half_open_after_timeout_lets_one_trial_through():
+    breaker, clock = make_breaker()
+    breaker.record_failure("token expired")
+
+    clock.value += 30
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_trial_success_closes_and_notifies():
+    breaker, clock = make_breaker()
+    closed = []
+    breaker.on_close(lambda: closed.append(True))
+    breaker.record_failure("token expired")
+    clock.value += 30
+    breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.reason is None
+    assert closed == [True]
+    # Already closed: listeners don't run again
+    breaker.record_success()
+    assert closed == [True]
+
+
+def test_trial_failure_reopens_for_another_timeout():
+    breaker, clock = make_breaker()
+    breaker.record_failure("token expired")
+    clock.value += 30
+    breaker.allow()
+
+    breaker.record_failure("still expired")
+
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+    clock.value += 29
+    assert not breaker.allow()
+    clock.value += 1
+    assert breaker.allow()
+
+
+def test_lost_trial_frees_its_slot_after_timeout():
+    breaker, clock = make_breaker()
+    breaker.record_failure("token expired")
+    clock.value += 30
+    assert breaker.allow()
+
+    clock.value += 30
+
+    assert breaker.allow()
+
+
+def test_can_start_open():
+    breaker, _ = make_breaker(open_reason="no token configured")
+
+    assert breaker.state == OPEN
+    assert breaker.stats()["reason"] == "no token configured"
+    assert breaker.trips == 0
+
+
+def test_failing_listener_does_not_break_close():
+    breaker, _ = make_breaker()
+    breaker.on_close(lambda: 1 / 0)
+    breaker.record_failure("x")
+
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
@@ -0,0 +1,88 @@
+"""
+Tests for the LRU conversation cache in app/cache.py
+"""
+
+from unittest.mock import patch
+
+from app.cache import LRUCache, estimate_size
+
+
+def test_get_and_set():
+    cache = LRUCache()
+    cache["111"] = {"estado": "completado"}
+
+    assert cache.get("111") == {"estado": "completado"}
+    assert cache.get("222") is None
+    assert cache.get("222", {}) == {}
+    assert "111" in cache
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache.get("a")  # "b" is now least recently used
+    cache["c"] = 3
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_by_bytes():
+    value = {"estado": "completado"}
+    cache = LRUCache(max_bytes=estimate_size(value) * 2)
+    cache["a"] = value
+    cache["b"] = value
+    cache["c"] = value
+
+    assert len(cache) == 2
+    assert "a" not in cache
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_idle_entries_expire():
+    cache = LRUCache(ttl_seconds=60)
+    with patch("app.cache.time.monotonic", return_value=1000):
+        cache["a"] = 1
+
+    with patch("app.cache.time.monotonic", return_value=1030):
+        assert cache.get("a") == 1  # Access refreshes idle time
+
+    with patch("app.cache.time.monotonic", return_value=1080):
+        assert cache.get("a") == 1
+
+    with patch("app.cache.time.monotonic", return_value=1161):
+        assert cache.get("a") is None
+
+    assert cache.stats()["expirations"] == 1
+
+
+def test_stats_count_hits_and_misses():
+    cache = LRUCache()
+    cache["a"] = 1
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_delete_pop_and_clear():
+    cache = LRUCache(max_bytes=10_000)
+    cache["a"] = 1
+    cache["b"] = 2
+
+    del cache["a"]
+    assert cache.pop("b") == 2
+    assert cache.pop("b") is None
+
+    cache["c"] = 3
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
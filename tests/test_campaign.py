@@ -0,0 +1,198 @@
+"""
+Tests for the draft campaign runner in app/campaign.py
+"""
+
+import uuid
+
+import pytest
+
+from app import campaign
+from app.graph_client import CircuitOpen, SendError
+from app.models import SessionLocal, MessageDraft, CampaignCheckpoint
+from app.persistence import save_message_draft
+
+
+class FakeGraph:
+    """Send callback: records (to, text); fails phones listed in errors."""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    def __call__(self, to, text):
+        if to in self.errors:
+            raise self.errors[to]
+        self.sent.append((to, text))
+        return {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+
+@pytest.fixture
+def name(monkeypatch):
+    """A campaign no other test uses; its drafts and checkpoint are removed afterwards."""
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(campaign, "backoff", lambda attempts: 0)
+    yield name
+    db = SessionLocal()
+    db.query(MessageDraft).filter(MessageDraft.customer_phone.like("54998%")).delete(synchronize_session=False)
+    db.query(CampaignCheckpoint).filter(CampaignCheckpoint.name == name).delete()
+    db.commit()
+    db.close()
+
+
+def add_drafts(count: int) -> list:
+    prefix = f"54998{uuid.uuid4().int % 10**4:04d}"
+    return [
+        save_message_draft(f"Cliente {i}", "ofrecer lentes nuevos", f"Hola Cliente {i}", f"{prefix}{i:04d}")
+        for i in range(count)
+    ]
+
+
+def statuses(ids: list) -> dict:
+    db = SessionLocal()
+    try:
+        return {d.id: d.status for d in db.query(MessageDraft).filter(MessageDraft.id.in_(ids))}
+    finally:
+        db.close()
+
+
+def test_sends_every_pending_draft_in_pages(name):
+    ids = add_drafts(7)
+    graph = FakeGraph()
+
+    summary = campaign.run(graph, name, batch_size=3, rate=0)
+
+    assert summary["status"] == "done"
+    assert summary["sent"] == 7
+    assert len(graph.sent) == 7
+    assert set(statuses(ids).values()) == {"sent"}
+    assert campaign.status(name)["last_id"] == ids[-1]
+
+
+def test_drafts_without_phone_are_skipped(name):
+    no_phone = save_message_draft("Sin teléfono", "recordar turno pronto", "Hola")
+    ids = add_drafts(1)
+
+    campaign.run(FakeGraph(), name, rate=0)
+
+    assert statuses([no_phone])[no_phone] == "pending"
+    assert statuses(ids)[ids[0]] == "sent"
+    db = SessionLocal()
+    db.query(MessageDraft).filter(MessageDraft.id == no_phone).delete()
+    db.commit()
+    db.close()
+
+
+def test_permanent_error_marks_failed_and_continues(name):
+    ids = add_drafts(3)
+    db = SessionLocal()
+    bad_phone = db.get(MessageDraft, ids[1]).customer_phone
+    db.close()
+    graph = FakeGraph({bad_phone: SendError("HTTP 400 code 131026")})
+
+    summary = campaign.run(graph, name, rate=0)
+
+    assert summary["sent"] == 2
+    assert summary["failed"] == 1
+    assert statuses(ids) == {ids[0]: "sent", ids[1]: "failed", ids[2]: "sent"}
+
+
+def test_page_of_transient_failures_pauses_and_keeps_drafts_pending(name):
+    ids = add_drafts(2)
+
+    class Down:
+        calls = 0
+
+        def __call__(self, to, text):
+            self.calls += 1
+            raise SendError("HTTP 503", retryable=True)
+
+    down = Down()
+    summary = campaign.run(down, name, rate=0)
+
+    assert summary["status"] == "paused"
+    # The first draft to exhaust its retries halts the page
+    assert campaign.CAMPAIGN_MAX_ATTEMPTS <= down.calls <= 2 * campaign.CAMPAIGN_MAX_ATTEMPTS
+    assert set(statuses(ids).values()) == {"pending"}
+
+    # Graph is back: resuming sends them
+    assert campaign.run(FakeGraph(), name, rate=0)["sent"] == 2
+
+
+def test_circuit_open_halts_the_page_and_checkpoints_the_settled_prefix(name, monkeypatch):
+    monkeypatch.setattr(campaign, "CAMPAIGN_WORKERS", 1)
+    ids = add_drafts(4)
+    db = SessionLocal()
+    expired_phone = db.get(MessageDraft, ids[1]).customer_phone
+    db.close()
+    graph = FakeGraph({expired_phone: CircuitOpen("token expired")})
+
+    summary = campaign.run(graph, name, rate=0)
+
+    assert summary["status"] == "paused"
+    assert summary["sent"] == 1
+    assert len(graph.sent) == 1
+    assert statuses(ids) == {ids[0]: "sent", ids[1]: "pending", ids[2]: "pending", ids[3]: "pending"}
+    assert campaign.status(name)["last_id"] == ids[0]
+
+    # Token renewed: resuming sends the rest of the page
+    graph.errors.clear()
+    summary = campaign.run(graph, name, rate=0)
+
+    assert summary["status"] == "done"
+    assert summary["sent"] == 3
+    assert set(statuses(ids).values()) == {"sent"}
+
+
+def test_pause_stops_after_current_page_and_resume_continues(name):
+    ids = add_drafts(6)
+    graph = FakeGraph()
+
+    def send_then_pause(to, text):
+        graph(to, text)
+        campaign.pause(name)
+
+    summary = campaign.run(send_then_pause, name, batch_size=2, rate=0)
+
+    assert summary["status"] == "paused"
+    assert summary["sent"] == 2
+    assert list(statuses(ids).values()).count("sent") == 2
+
+    summary = campaign.run(graph, name, batch_size=2, rate=0)
+
+    assert summary["status"] == "done"
+    assert summary["sent"] == 4
+    assert summary["total_sent"] == 6
+    assert len(graph.sent) == 6
+
+
+def test_memory_is_bounded_by_page_size(name, monkeypatch):
+    add_drafts(10)
+    pages = []
+    load = campaign.load_pending_drafts
+    monkeypatch.setattr(campaign, "load_pending_drafts", lambda after, limit: pages.append(limit) or load(after, limit))
+
+    campaign.run(FakeGraph(), name, batch_size=4, rate=0)
+
+    # 4 + 4 + 2, then an empty page
+    assert pages == [4, 4, 4, 4]
+
+
+def test_draft_created_through_the_chat_is_sent_by_the_campaign(name):
+    from app.engine import handle_message
+    from app.state import delete_conversation
+
+    admin = "888111223"
+    delete_conversation(admin)
+    handle_message(admin, "activar cliente")
+    handle_message(admin, "Juan Pérez")
+    handle_message(admin, "+54 998 1234-5678")
+    handle_message(admin, "ofrecer lentes nuevos con descuento")
+    handle_message(admin, "enviar")
+    delete_conversation(admin)
+
+    graph = FakeGraph()
+    summary = campaign.run(graph, name, rate=0)
+
+    assert summary["sent"] == 1
+    assert graph.sent[0][0] == "5499812345678"
+    assert "Juan Pérez" in graph.sent[0][1]
@@ -4,7 +4,6 @@ import pytest
 
 from app.customer_handlers import handle_customer_message
 from app.state import conversaciones, get_conversation, update_conversation
-from app.persistence import save_state
 
 
 @pytest.fixture(autouse=True)
@@ -16,7 +15,6 @@ def clean_test_state(tmp_path, monkeypatch):
 
     test_state_file = tmp_path / "test_conversations.json"
     monkeypatch.setattr("app.persistence.STATE_FILE", test_state_file)
-    monkeypatch.setattr("app.state.save_state", lambda data: save_state(data))
 
     yield
 
@@ -0,0 +1,121 @@
+"""
+Tests for webhook deduplication in app/dedup.py
+"""
+
+import threading
+import uuid
+
+import pytest
+
+from app import dedup
+
+
+@pytest.fixture(autouse=True)
+def clean_dedup():
+    dedup.clear()
+    yield
+    dedup.flush()
+    dedup.clear()
+
+
+def new_id() -> str:
+    return f"wamid.test-{uuid.uuid4().hex}"
+
+
+def test_first_claim_wins_then_duplicates():
+    message_id = new_id()
+    before = dedup.stats()["duplicates"]
+
+    assert dedup.claim(message_id)
+    assert not dedup.claim(message_id)
+    assert not dedup.claim(message_id)
+    assert dedup.stats()["duplicates"] == before + 2
+
+
+def test_messages_without_id_are_never_duplicates():
+    assert dedup.claim(None)
+    assert dedup.claim(None)
+    assert dedup.claim("")
+
+
+def test_release_accepts_redelivery():
+    message_id = new_id()
+    dedup.claim(message_id)
+
+    dedup.release(message_id)
+
+    assert dedup.claim(message_id)
+
+
+def test_dedup_survives_restart():
+    message_id = new_id()
+    dedup.claim(message_id)
+    assert dedup.flush() == 1
+
+    # Restart: memory is gone, the table warms it again
+    dedup.clear()
+
+    assert not dedup.claim(message_id)
+
+
+def test_unflushed_release_is_not_persisted():
+    message_id = new_id()
+    dedup.claim(message_id)
+    dedup.release(message_id)
+    dedup.flush()
+
+    dedup.clear()
+
+    assert dedup.claim(message_id)
+
+
+def test_load_warms_the_window_before_the_first_claim(monkeypatch):
+    message_id = new_id()
+    dedup.claim(message_id)
+    dedup.flush()
+    dedup.clear()
+
+    dedup.load()
+    # Already warm: claim() must not query the table again
+    monkeypatch.setattr(dedup, "load_processed_message_ids", lambda since: pytest.fail("queried on claim"))
+
+    assert not dedup.claim(message_id)
+
+
+def test_flush_writes_batches_over_the_parameter_limit():
+    ids = [new_id() for _ in range(1200)]
+    for message_id in ids:
+        dedup.claim(message_id)
+
+    assert dedup.flush() == 1200
+
+    dedup.clear()
+    assert not any(dedup.claim(message_id) for message_id in ids)
+
+
+def test_failed_flush_is_retried_by_the_timer(monkeypatch):
+    message_id = new_id()
+    dedup.claim(message_id)
+    monkeypatch.setattr(dedup, "DEDUP_FLUSH_INTERVAL_MS", 10)
+    save = dedup.save_processed_message_ids
+    retried = threading.Event()
+    calls = []
+
+    def fail_once(ids):
+        calls.append(dict(ids))
+        if len(calls) == 1:
+            return -1
+        written = save(ids)
+        retried.set()
+        return written
+
+    monkeypatch.setattr(dedup, "save_processed_message_ids", fail_once)
+
+    assert dedup.flush() == 0
+
+    # No further claim(): the restarted timer writes the batch
+    assert retried.wait(1)
+    assert message_id in calls[1]
+    assert dedup.stats()["unwritten"] == 0
+    dedup.clear()
+    assert not dedup.claim(message_id)
@@ -0,0 +1,149 @@
+"""
+Tests for the delivery status pipeline in app/delivery.py
+"""
+
+import random
+import threading
+import time
+import uuid
+
+import pytest
+
+from app import delivery
+from app.models import SessionLocal, OutboundMessage
+
+
+@pytest.fixture
+def comercio_id():
+    """A commerce id no other test uses; its rows are removed afterwards."""
+    comercio_id = random.randint(10**8, 10**9)
+    delivery.clear()
+    yield comercio_id
+    delivery.flush()
+    db = SessionLocal()
+    db.query(OutboundMessage).filter(OutboundMessage.comercio_id == comercio_id).delete()
+    db.commit()
+    db.close()
+    delivery.clear()
+
+
+def new_wamid() -> str:
+    return f"wamid.test-{uuid.uuid4().hex}"
+
+
+def status(wamid: str, name: str, at: int, **extra) -> dict:
+    return {"id": wamid, "status": name, "timestamp": str(at), "recipient_id": "5491100000001", **extra}
+
+
+def test_sent_delivered_read_counters(comercio_id):
+    wamid = new_wamid()
+    delivery.record_sent(wamid, "5491100000001", comercio_id)
+    now = int(time.time())
+
+    delivery.ingest([status(wamid, "delivered", now + 2), status(wamid, "read", now + 10)])
+    assert delivery.flush() == 1
+
+    counters = delivery.counters(comercio_id)
+    assert (counters["sent"], counters["delivered"], counters["read"], counters["failed"]) == (1, 1, 1, 0)
+    assert 0 < counters["avg_delivery_seconds"] <= counters["avg_read_seconds"]
+
+    db = SessionLocal()
+    row = db.get(OutboundMessage, wamid)
+    db.close()
+    assert row.status == "read"
+    assert row.delivered_at is not None and row.read_at is not None
+
+
+def test_repeated_and_out_of_order_statuses_count_once(comercio_id):
+    wamid = new_wamid()
+    delivery.record_sent(wamid, "5491100000001", comercio_id)
+    now = int(time.time())
+
+    # Read before delivered, then both again
+    delivery.ingest([status(wamid, "read", now + 5)])
+    delivery.flush()
+    delivery.ingest([status(wamid, "delivered", now + 3), status(wamid, "read", now + 5)])
+    assert delivery.flush() == 0
+
+    counters = delivery.counters(comercio_id)
+    assert (counters["delivered"], counters["read"]) == (1, 1)
+
+
+def test_failed_status_keeps_error_code(comercio_id):
+    wamid = new_wamid()
+    delivery.record_sent(wamid, "5491100000001", comercio_id)
+
+    delivery.ingest([status(wamid, "failed", int(time.time()), errors=[{"code": 131026}])])
+    delivery.flush()
+
+    assert delivery.counters(comercio_id)["failed"] == 1
+    db = SessionLocal()
+    row = db.get(OutboundMessage, wamid)
+    db.close()
+    assert (row.status, row.error_code) == ("failed", 131026)
+
+
+def test_unknown_wamid_is_unmatched(comercio_id):
+    before = delivery.stats()["unmatched"]
+
+    delivery.ingest([status(new_wamid(), "delivered", int(time.time()))])
+    delivery.flush()
+
+    assert delivery.stats()["unmatched"] == before + 1
+
+
+def test_invalid_statuses_are_ignored(comercio_id):
+    assert delivery.ingest([{"status": "delivered"}, {"id": "x", "status": "deleted"}]) == 0
+
+
+def test_counters_and_correlation_survive_restart(comercio_id):
+    wamid = new_wamid()
+    delivery.record_sent(wamid, "5491100000001", comercio_id)
+    delivery.ingest([status(wamid, "delivered", int(time.time()) + 1)])
+    delivery.flush()
+
+    # Restart: memory is gone, counters are seeded from the table
+    delivery.clear()
+    assert delivery.counters(comercio_id)["delivered"] == 1
+
+    # A late status is correlated through the table
+    delivery.ingest([status(wamid, "read", int(time.time()) + 4)])
+    assert delivery.flush() == 1
+    counters = delivery.counters(comercio_id)
+    assert (counters["sent"], counters["delivered"], counters["read"]) == (1, 1, 1)
+
+
+def test_full_batch_is_flushed_off_the_calling_thread(comercio_id, monkeypatch):
+    wamid = new_wamid()
+    delivery.record_sent(wamid, "5491100000001", comercio_id)
+    delivery.flush()
+    monkeypatch.setattr(delivery, "DELIVERY_FLUSH_MAX_PENDING", 1)
+    caller = threading.get_ident()
+    flushed_by = []
+    real_update = delivery.update_delivery_states
+
+    def update(rows):
+        flushed_by.append(threading.get_ident())
+        return real_update(rows)
+
+    monkeypatch.setattr(delivery, "update_delivery_states", update)
+
+    delivery.ingest([status(wamid, "delivered", int(time.time()) + 1)])
+
+    for _ in range(100):
+        if flushed_by:
+            break
+        time.sleep(0.01)
+    assert flushed_by and caller not in flushed_by
+    assert delivery.counters(comercio_id)["delivered"] == 1
+
+
+def test_load_seeds_counters_before_the_first_webhook(comercio_id, monkeypatch):
+    delivery.record_sent(new_wamid(), "5491100000001", comercio_id)
+    delivery.flush()
+    delivery.clear()
+
+    delivery.load()
+    monkeypatch.setattr(delivery, "load_delivery_counters", lambda: pytest.fail("seeded on the request path"))
+
+    assert delivery.counters(comercio_id)["sent"] == 1
@@ -10,13 +10,25 @@ Tests conversational flow:
 
 import pytest
 import tempfile
+from datetime import date
 from pathlib import Path
 from unittest.mock import patch
 
 # Import functions to test
 from app.engine import handle_message
 from app.state import conversaciones, update_conversation, get_conversation, delete_conversation
-from app.persistence import save_state, load_state
+from app.persistence import load_state, get_turnos_by_cliente
+from app.models import SessionLocal, Turno
+from app.dispatcher import TEST_PHONE_PATTERNS
+from app import availability
+
+
+def delete_turnos(sender):
+    """Remove turnos left by previous runs (they live in nordia.db)."""
+    db = SessionLocal()
+    db.query(Turno).filter(Turno.cliente_telefono == sender).delete()
+    db.commit()
+    db.close()
 
 
 @pytest.fixture(autouse=True)
@@ -30,7 +42,13 @@ def clean_test_state(tmp_path, monkeypatch):
     # Use temp directory for STATE_FILE
     test_state_file = tmp_path / "test_conversations.json"
     monkeypatch.setattr("app.persistence.STATE_FILE", test_state_file)
-    monkeypatch.setattr("app.state.save_state", lambda data: save_state(data))
+
+    # Turnos live in nordia.db: drop bookings of test numbers from previous runs
+    db = SessionLocal()
+    db.query(Turno).filter(Turno.cliente_telefono.in_(TEST_PHONE_PATTERNS)).delete()
+    db.commit()
+    db.close()
+    availability.clear()
 
     yield
 
@@ -427,7 +445,7 @@ def test_validation_flow_with_corrections():
 
 def test_normalize_text_removes_accents():
     """normalize_text should remove accents and convert to lowercase."""
-    from app.engine import normalize_text
+    from app.message_context import normalize_text
 
     assert normalize_text("CUÁNTO") == "cuanto"
     assert normalize_text("Precio") == "precio"
@@ -437,7 +455,7 @@ def test_normalize_text_removes_accents():
 
 def test_normalize_text_handles_special_chars():
     """normalize_text should preserve special characters except accents."""
-    from app.engine import normalize_text
+    from app.message_context import normalize_text
 
     assert normalize_text("Café $500") == "cafe $500"
     assert normalize_text("¿PRECIOS?") == "¿precios?"
@@ -636,11 +654,14 @@ def test_contains_appointment_keyword_returns_false():
     assert not contains_appointment_keyword("precio")
 
 
-def test_appointment_flow_complete():
+def test_appointment_flow_complete(monkeypatch):
     """
     Flujo completo: completado → turno → fecha → hora → completado.
     """
+    # "mañana" is a Tuesday: open per horarios
+    monkeypatch.setattr("app.schedule.business_today", lambda: date(2026, 1, 5))
     sender = "888111222"
+    delete_turnos(sender)
 
     update_conversation(sender, {
         "estado": "completado",
@@ -669,11 +690,15 @@ def test_appointment_flow_complete():
     conv = get_conversation(sender)
     assert conv.get("estado") == "completado"
 
-    # Verificar turno guardado
-    assert "turnos" in conv
-    assert len(conv["turnos"]) == 1
-    assert conv["turnos"][0]["fecha"] == "mañana"
-    assert conv["turnos"][0]["hora"] == "15:00"
+    # Verificar turno guardado en la tabla turnos, no en la conversación
+    assert "turnos" not in conv
+    turnos = get_turnos_by_cliente(sender)
+    assert len(turnos) == 1
+    assert turnos[0]["fecha"] == "mañana"
+    assert turnos[0]["dia"] == date(2026, 1, 6)
+    assert turnos[0]["hora"] == "15:00"
+    assert conv["ultimo_turno_id"] == turnos[0]["id"]
+    assert turnos[0]["comercio_id"] == conv["comercio_id"]
 
 
 def test_appointment_multiple_appointments():
@@ -681,6 +706,7 @@ def test_appointment_multiple_appointments():
     Usuario puede agendar múltiples turnos.
     """
     sender = "888111223"
+    delete_turnos(sender)
 
     update_conversation(sender, {
         "estado": "completado",
@@ -699,12 +725,15 @@ def test_appointment_multiple_appointments():
     handle_message(sender, "14:00")
 
     # Verificar 2 turnos guardados
-    conv = get_conversation(sender)
-    assert len(conv["turnos"]) == 2
-    assert conv["turnos"][0]["fecha"] == "lunes"
-    assert conv["turnos"][0]["hora"] == "10:00"
-    assert conv["turnos"][1]["fecha"] == "martes"
-    assert conv["turnos"][1]["hora"] == "14:00"
+    turnos = get_turnos_by_cliente(sender)
+    assert len(turnos) == 2
+    assert turnos[0]["fecha"] == "lunes"
+    assert turnos[0]["hora"] == "10:00"
+    assert turnos[1]["fecha"] == "martes"
+    assert turnos[1]["hora"] == "14:00"
+
+    # La conversación solo guarda el puntero al último turno
+    assert get_conversation(sender)["ultimo_turno_id"] == turnos[1]["id"]
 
 
 def test_appointment_and_services_coexist():
@@ -830,3 +859,274 @@ def test_completado_fallback_mentions_appointments():
 
     assert "servicios" in response.lower() or "precios" in response.lower()
     assert "turno" in response.lower()
+
+
+# ==================== STATELESS INICIAL ====================
+
+def test_unknown_sender_served_without_state():
+    """
+    Remitente desconocido en inicial recibe la bienvenida sin crear estado.
+    """
+    import app.engine as engine
+
+    sender = "5491100000001"
+    hits_before = engine.stateless_hits
+
+    with patch("app.engine.update_conversation") as mock_update:
+        response = handle_message(sender, "turno para mañana")
+
+    assert response == engine.INICIAL_REPLY
+    mock_update.assert_not_called()
+    assert sender not in conversaciones
+    assert engine.stateless_hits == hits_before + 1
+
+
+def test_admin_sender_in_inicial_still_transitions():
+    """
+    Remitentes admin en inicial siguen pasando por la máquina de estados.
+    """
+    import app.engine as engine
+
+    sender = "123456789"
+    hits_before = engine.stateless_hits
+
+    handle_message(sender, "setup")
+
+    assert get_conversation(sender).get("estado") == "esperando_nombre"
+    assert engine.stateless_hits == hits_before
+
+
+def test_stateless_mode_disabled_uses_state_machine(monkeypatch):
+    """
+    Con STATELESS_INICIAL desactivado la respuesta es la misma, sin contar hits.
+    """
+    import app.engine as engine
+
+    monkeypatch.setattr(engine, "STATELESS_INICIAL", False)
+    hits_before = engine.stateless_hits
+
+    response = handle_message("5491100000002", "hola")
+
+    assert response == engine.INICIAL_REPLY
+    assert engine.stateless_hits == hits_before
+
+
+def test_appointment_migrates_legacy_inline_turnos():
+    """
+    Turnos guardados en la conversación (formato viejo) pasan a la tabla.
+    """
+    sender = "888111226"
+    delete_turnos(sender)
+
+    update_conversation(sender, {
+        "estado": "esperando_hora_turno",
+        "nombre": "Test",
+        "turno_temp": {"fecha": "jueves"},
+        "turnos": [{"fecha": "lunes", "hora": "10:00"}]
+    })
+
+    handle_message(sender, "12:00")
+
+    assert "turnos" not in get_conversation(sender)
+    turnos = get_turnos_by_cliente(sender)
+    assert [(t["fecha"], t["hora"]) for t in turnos] == [("jueves", "12:00"), ("lunes", "10:00")]
+
+
+def test_appointment_save_failure_stays_in_state():
+    """
+    Si no se puede guardar el turno, el usuario puede reintentar la hora.
+    """
+    sender = "888111227"
+
+    update_conversation(sender, {
+        "estado": "esperando_hora_turno",
+        "comercio_id": 1,
+        "turno_temp": {"fecha": "jueves"}
+    })
+
+    with patch("app.engine.save_turno", return_value=-1):
+        response = handle_message(sender, "12:00")
+
+    assert "no pude guardar" in response.lower()
+    assert get_conversation(sender)["estado"] == "esperando_hora_turno"
+
+
+def test_setup_completion_creates_comercio():
+    """
+    Completar el setup registra el comercio y guarda su id en la conversación.
+    """
+    from app.models import Comercio
+
+    sender = "777111226"
+    handle_message(sender, "setup")
+    handle_message(sender, "Barbería Comercio")
+    handle_message(sender, "Lun-Vie 9-18hs")
+    handle_message(sender, "Corte $5000")
+
+    conv = get_conversation(sender)
+    db = SessionLocal()
+    comercio = db.get(Comercio, conv["comercio_id"])
+    db.close()
+    assert comercio.telefono_dueno == sender
+    assert comercio.nombre == "Barbería Comercio"
+    assert comercio.horarios == "Lun-Vie 9-18hs"
+
+
+def test_appointment_taken_slot_offers_alternatives():
+    """
+    Horario ocupado: no se reserva y se ofrecen horarios libres.
+    """
+    first, second = "888111228", "888111229"
+    update_conversation(first, {"estado": "completado", "comercio_id": 999001})
+    update_conversation(second, {"estado": "completado", "comercio_id": 999001})
+
+    handle_message(first, "turno")
+    handle_message(first, "Lunes")
+    handle_message(first, "15:00")
+
+    handle_message(second, "turno")
+    handle_message(second, "lunes")
+    response = handle_message(second, "15hs")
+
+    assert "ocupado" in response.lower()
+    assert "15:30" in response
+    assert get_conversation(second)["estado"] == "esperando_hora_turno"
+    assert get_turnos_by_cliente(second) == []
+
+    # Elegir un horario libre completa la reserva
+    response = handle_message(second, "15:30")
+    assert "reservado" in response.lower()
+    assert get_conversation(second)["estado"] == "completado"
+
+
+def test_appointment_conflicts_by_calendar_day_not_wording():
+    """
+    "lunes" y "el lunes" son el mismo día; el lunes siguiente no choca.
+    """
+    from datetime import timedelta
+    from app.schedule import resolve_fecha
+
+    first, second = "888111240", "888111241"
+    update_conversation(first, {"estado": "completado", "comercio_id": 999003})
+    update_conversation(second, {"estado": "completado", "comercio_id": 999003})
+
+    handle_message(first, "turno")
+    handle_message(first, "lunes")
+    handle_message(first, "11:00")
+
+    handle_message(second, "turno")
+    handle_message(second, "el lunes")
+    assert "ocupado" in handle_message(second, "11:00").lower()
+
+    next_week = resolve_fecha("lunes") + timedelta(days=7)
+    update_conversation(second, {"estado": "esperando_fecha_turno", "comercio_id": 999003})
+    handle_message(second, next_week.strftime("%d/%m/%Y"))
+    assert "reservado" in handle_message(second, "11:00").lower()
+
+
+def test_appointment_outside_opening_hours_offers_open_slots():
+    """
+    Hora fuera del horario del comercio: no se reserva y se ofrecen horarios abiertos.
+    """
+    from app import schedule
+
+    sender = "888111230"
+    schedule.set_schedule(999002, "Lun-Vie 9-18hs")
+    update_conversation(sender, {"estado": "completado", "comercio_id": 999002})
+
+    handle_message(sender, "turno")
+    handle_message(sender, "lunes")
+    response = handle_message(sender, "20:00")
+
+    assert "cerrados" in response.lower()
+    assert "09:00" in response
+    assert get_conversation(sender)["estado"] == "esperando_hora_turno"
+    assert get_turnos_by_cliente(sender) == []
+
+    schedule.clear()
+
+
+def test_appointment_closed_day_asks_for_another_day():
+    """
+    Día sin atención: vuelve a pedir el día.
+    """
+    from app import schedule
+
+    sender = "888111231"
+    schedule.set_schedule(999003, "Lun-Vie 9-18hs")
+    update_conversation(sender, {"estado": "completado", "comercio_id": 999003})
+
+    handle_message(sender, "turno")
+    handle_message(sender, "domingo")
+    response = handle_message(sender, "10:00")
+
+    assert "otro día" in response.lower()
+    assert get_conversation(sender)["estado"] == "esperando_fecha_turno"
+
+    schedule.clear()
+
+
+def test_completado_hours_query_reports_open_state():
+    """
+    Consulta de horarios con horario estructurado → abierto/cerrado + horarios.
+    """
+    from app import schedule
+
+    sender = "777111240"
+    schedule.set_schedule(999004, "Lun-Dom 0-24")
+    update_conversation(sender, {
+        "estado": "completado",
+        "comercio_id": 999004,
+        "horarios": "Lun-Dom 0-24"
+    })
+
+    response = handle_message(sender, "¿Están abiertos?")
+
+    assert "abiertos" in response.lower()
+    assert "Lun-Dom 0-24" in response
+
+    schedule.clear()
+
+
+def test_completado_uses_commerce_custom_keywords():
+    """
+    Vocabulario propio del comercio: sus palabras disparan la intención.
+    """
+    from app import keywords
+
+    sender = "777111241"
+    keywords.set_custom_vocabulary(999005, {"services": ["tratamientos"]})
+    update_conversation(sender, {
+        "estado": "completado",
+        "comercio_id": 999005,
+        "servicios": "Limpieza facial $8000"
+    })
+
+    response = handle_message(sender, "¿Qué tratamientos hacen?")
+
+    assert "Limpieza facial $8000" in response
+
+    keywords.clear()
+
+
+def test_custom_keywords_stored_for_commerce_reach_the_engine():
+    """
+    Vocabulario guardado en el comercio: se compila en su primer mensaje.
+    """
+    from app import keywords
+    from app.persistence import save_comercio, save_comercio_keywords
+
+    sender = "777111242"
+    comercio_id = save_comercio(sender, "Spa Test", "Lun-Vie 9-18hs", "Masajes $9000")
+    assert save_comercio_keywords(comercio_id, {"services": ["Masajes"], "appointment": ["agendame"]})
+    keywords.clear()
+    update_conversation(sender, {
+        "estado": "completado",
+        "comercio_id": comercio_id,
+        "servicios": "Masajes $9000"
+    })
+
+    assert "Masajes $9000" in handle_message(sender, "¿qué masajes tienen?")
+    assert "día" in handle_message(sender, "agendame").lower()
+
+    keywords.clear()
@@ -0,0 +1,137 @@
+"""
+Tests for app/graph_client.py: one pooled session, prebuilt request parts.
+"""
+
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from app import graph_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(whatsapp_token):
+    yield
+
+
+def test_session_is_shared_and_pooled():
+    session = graph_client.get_session()
+
+    assert graph_client.get_session() is session
+    adapter = session.get_adapter(graph_client.MESSAGES_URL)
+    assert adapter._pool_maxsize == graph_client.WHATSAPP_POOL_SIZE
+    assert session.headers["Content-Type"] == "application/json"
+    assert session.headers["Authorization"].startswith("Bearer ")
+
+
+def test_close_rebuilds_session_on_next_use():
+    session = graph_client.get_session()
+    graph_client.close()
+
+    assert graph_client.get_session() is not session
+
+
+def test_send_text_posts_prebuilt_url_with_timeouts():
+    with patch.object(graph_client.get_session(), "post") as mock_post:
+        graph_client.send_text("5491112345678", "¿Hola?")
+
+    url = mock_post.call_args.args[0]
+    assert url == graph_client.MESSAGES_URL and url.endswith("/messages")
+    assert mock_post.call_args.kwargs["timeout"] == (
+        graph_client.WHATSAPP_CONNECT_TIMEOUT_SECONDS,
+        graph_client.WHATSAPP_READ_TIMEOUT_SECONDS,
+    )
+    assert json.loads(mock_post.call_args.kwargs["data"]) == {
+        "messaging_product": "whatsapp",
+        "to": "5491112345678",
+        "type": "text",
+        "text": {"body": "¿Hola?"},
+    }
+
+
+def test_whatsapp_send_message_uses_shared_client(whatsapp_token):
+    from app import whatsapp
+
+    with patch('app.whatsapp.graph_client.send_text') as mock_send_text:
+        mock_send_text.return_value.json.return_value = {"messages": []}
+        assert whatsapp.send_message("5491112345678", "hola") == {"messages": []}
+
+    mock_send_text.assert_called_once_with("5491112345678", "hola")
+
+
+# ==================== TOKEN BREAKER ====================
+
+def test_send_refused_without_calling_graph_while_open(whatsapp_token):
+    whatsapp_token.record_failure("token invalid or expired")
+
+    with patch.object(graph_client.get_session(), "post") as mock_post:
+        with pytest.raises(graph_client.CircuitOpen):
+            graph_client.send_text("5491112345678", "hola")
+
+    mock_post.assert_not_called()
+
+
+def test_probe_reloads_token_from_file_and_closes(whatsapp_token, monkeypatch, tmp_path):
+    token_file = tmp_path / "token"
+    token_file.write_text("new-token\n")
+    monkeypatch.setattr(graph_client, "WHATSAPP_TOKEN_FILE", str(token_file))
+    whatsapp_token.reset_timeout = 0
+    whatsapp_token.record_failure("token invalid or expired")
+    session = graph_client.get_session()
+
+    with patch.object(session, "get", return_value=MagicMock(status_code=200)) as mock_get:
+        assert graph_client.probe()
+
+    assert whatsapp_token.state == "closed"
+    assert graph_client.token() == "new-token"
+    # Live session updated in place: pooled connections are kept
+    assert graph_client.get_session() is session
+    assert session.headers["Authorization"] == "Bearer new-token"
+    assert mock_get.call_args.args[0] == graph_client.ME_URL
+    assert graph_client.stats()["token_reloads"] >= 1
+
+
+def test_whatsapp_send_message_follows_the_reloaded_token(whatsapp_token, monkeypatch):
+    from app import whatsapp
+
+    monkeypatch.setattr(graph_client, "_token", None)
+    with patch('app.whatsapp.graph_client.send_text') as mock_send_text:
+        assert whatsapp.send_message("5491112345678", "hola") is None
+        mock_send_text.assert_not_called()
+
+        graph_client.set_token("renewed-token")
+        mock_send_text.return_value.json.return_value = {"messages": []}
+        assert whatsapp.send_message("5491112345678", "hola") == {"messages": []}
+
+
+def test_probe_reloads_token_before_the_trial_slot(whatsapp_token, monkeypatch, tmp_path):
+    token_file = tmp_path / "token"
+    token_file.write_text("new-token\n")
+    monkeypatch.setattr(graph_client, "WHATSAPP_TOKEN_FILE", str(token_file))
+    # Still cooling down: no trial slot, but the token is swapped anyway
+    whatsapp_token.record_failure("token invalid or expired")
+
+    with patch.object(graph_client.get_session(), "get") as mock_get:
+        assert not graph_client.probe()
+
+    mock_get.assert_not_called()
+    assert graph_client.token() == "new-token"
+    assert whatsapp_token.state == "open"
+
+
+def test_probe_keeps_breaker_open_on_invalid_token(whatsapp_token):
+    whatsapp_token.reset_timeout = 0
+    whatsapp_token.record_failure("token invalid or expired")
+
+    with patch.object(graph_client.get_session(), "get", return_value=MagicMock(status_code=401, text="")):
+        assert not graph_client.probe()
+
+    assert whatsapp_token.state != "closed"
+
+
+def test_unreachable_graph_leaves_breaker_as_is(whatsapp_token):
+    import requests
+
+    with patch.object(graph_client.get_session(), "get", side_effect=requests.exceptions.ConnectTimeout("down")):
+        assert graph_client.check_token()
+
+    assert whatsapp_token.state == "closed"
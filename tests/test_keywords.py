@@ -0,0 +1,105 @@
+"""
+Tests for the compiled keyword matcher in app/keywords.py
+"""
+
+import random
+
+import pytest
+
+from app import keywords
+from app.keywords import KeywordMatcher, DEFAULT_MATCHER, DEFAULT_VOCABULARY, set_custom_vocabulary, matcher_for
+from app.message_context import MessageContext
+
+
+@pytest.fixture(autouse=True)
+def clean_matchers():
+    keywords.clear()
+    yield
+    keywords.clear()
+
+
+def naive_match(vocabulary: dict, text: str) -> frozenset:
+    """Reference semantics: one substring scan per keyword."""
+    return frozenset(
+        intent for intent, words in vocabulary.items()
+        if any(word in text for word in words)
+    )
+
+
+def test_finds_every_intent_in_one_pass():
+    assert DEFAULT_MATCHER.match("quiero un turno, cuanto sale?") == {"appointment", "services"}
+    assert DEFAULT_MATCHER.match("hola") == frozenset()
+
+
+def test_overlapping_and_prefix_keywords_of_different_intents():
+    matcher = KeywordMatcher({"a": ["servicio"], "b": ["servicios"], "c": ["vicio"], "d": ["os"]})
+
+    assert matcher.match("servicios") == {"a", "b", "c", "d"}
+    assert matcher.match("servicio") == {"a", "c"}
+
+
+def test_special_characters_are_literal():
+    matcher = KeywordMatcher({"admin": ["/setup", "a.b"]})
+
+    assert matcher.match("/setup ya") == {"admin"}
+    assert matcher.match("axb") == frozenset()
+
+
+def test_empty_vocabulary():
+    assert KeywordMatcher({}).match("turno") == frozenset()
+    assert KeywordMatcher({"x": [""]}).match("turno") == frozenset()
+
+
+def test_matches_naive_semantics_on_random_vocabularies():
+    rng = random.Random(7)
+    alphabet = "abcs "
+
+    for _ in range(200):
+        vocabulary = {
+            f"intent{i}": ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(5)]
+            for i in range(4)
+        }
+        matcher = KeywordMatcher(vocabulary)
+        for _ in range(10):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+            assert matcher.match(text) == naive_match(vocabulary, text)
+
+
+def test_default_matcher_equals_keyword_lists():
+    text = "¿Están abiertos? Quiero reservar y saber precios"
+    ctx = MessageContext(text)
+
+    assert ctx.intents == naive_match(DEFAULT_VOCABULARY, ctx.normalized)
+
+
+def test_custom_vocabulary_per_commerce():
+    matcher = set_custom_vocabulary(501, {"services": ["Depilación"], "appointment": ["agendame"]})
+
+    assert matcher_for(501) is matcher
+    assert matcher_for(502) is DEFAULT_MATCHER
+
+    ctx = MessageContext("Hacen depilacion?")
+    assert ctx.intents_for(matcher) == {"services"}
+    assert ctx.intents == frozenset()
+    # Default keywords are kept
+    assert matcher.match("quiero un turno") == {"appointment"}
+
+
+def test_stored_vocabulary_compiled_on_first_use():
+    from app import keywords
+    from app.persistence import save_comercio, save_comercio_keywords
+
+    comercio_id = save_comercio("keywords-test-111", "Comercio Keywords")
+    save_comercio_keywords(comercio_id, {"services": ["Depilación"]})
+    keywords.clear()
+
+    matcher = matcher_for(comercio_id)
+
+    assert matcher is not DEFAULT_MATCHER
+    assert matcher.match("depilacion con cera") == {"services"}
+    assert matcher_for(comercio_id) is matcher  # Compiled once
+    keywords.clear()
+
+
+def test_commerce_without_stored_vocabulary_uses_default():
+    assert matcher_for(-501) is DEFAULT_MATCHER
@@ -0,0 +1,103 @@
+"""
+Tests for app/log.py: JSON lines, per-category sampling, non-blocking queue.
+"""
+
+import json
+import logging
+import queue
+from datetime import datetime
+from app.log import (
+    JsonFormatter,
+    TextFormatter,
+    SamplingFilter,
+    DroppingQueueHandler,
+    parse_sampling,
+    get_logger,
+)
+
+
+def make_record(category="webhook", level=logging.INFO, msg="hola %s", args=("mundo",), **extra):
+    record = logging.LogRecord(f"nordia.{category}", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_get_logger_is_namespaced():
+    assert get_logger("engine").name == "nordia.engine"
+
+
+def test_json_formatter_one_object_with_extra_fields():
+    line = JsonFormatter().format(make_record(sender="549111", status=200))
+
+    entry = json.loads(line)
+    assert entry["level"] == "INFO"
+    assert entry["category"] == "webhook"
+    assert entry["msg"] == "hola mundo"
+    assert entry["sender"] == "549111"
+    assert entry["status"] == 200
+    assert "\n" not in line
+
+
+def test_json_formatter_serializes_unknown_types():
+    entry = json.loads(JsonFormatter().format(make_record(at=datetime(2026, 1, 2, 3, 4))))
+    assert entry["at"] == "2026-01-02 03:04:00"
+
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        import sys
+        record = make_record(level=logging.ERROR)
+        record.exc_info = sys.exc_info()
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_text_formatter():
+    line = TextFormatter().format(make_record(category="engine", sender="549111"))
+    assert line == "[INFO engine] hola mundo sender=549111"
+
+
+def test_parse_sampling_ignores_invalid_entries_and_clamps():
+    assert parse_sampling("engine=0.1, webhook=2,bad,x=abc") == {"engine": 0.1, "webhook": 1.0}
+    assert parse_sampling("") == {}
+
+
+def test_sampling_drops_info_but_keeps_warnings():
+    sampler = SamplingFilter({"webhook": 0.0})
+
+    assert not sampler.filter(make_record(level=logging.INFO))
+    assert not sampler.filter(make_record(level=logging.DEBUG))
+    assert sampler.filter(make_record(level=logging.WARNING))
+    assert sampler.filter(make_record(level=logging.ERROR))
+    # Categories without a rate are kept
+    assert sampler.filter(make_record(category="engine"))
+
+
+def test_sampling_keeps_a_fraction():
+    sampler = SamplingFilter({"webhook": 0.5})
+    kept = sum(sampler.filter(make_record()) for _ in range(2000))
+    assert 800 < kept < 1200
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+
+    for _ in range(5):
+        handler.handle(make_record())
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_queue_handler_defers_formatting():
+    handler = DroppingQueueHandler(queue.Queue())
+    record = make_record()
+
+    handler.handle(record)
+
+    queued = handler.queue.get_nowait()
+    assert queued is record
+    assert queued.args == ("mundo",)
@@ -0,0 +1,50 @@
+"""
+Tests for the per-message analysis context in app/message_context.py
+"""
+
+from unittest.mock import patch
+
+from app.message_context import MessageContext, as_context
+from app.dispatcher import dispatch_signal
+from app.engine import contains_service_query_keyword, contains_appointment_keyword
+
+
+def test_derived_forms():
+    ctx = MessageContext("  ¿Cuánto SALE un Turno?  ")
+
+    assert ctx.raw == "  ¿Cuánto SALE un Turno?  "
+    assert ctx.stripped == "¿Cuánto SALE un Turno?"
+    assert ctx.lowered == "¿cuánto sale un turno?"
+    assert ctx.normalized == "  ¿cuanto sale un turno?  "
+    assert ctx.words == ["¿Cuánto", "SALE", "un", "Turno?"]
+    assert ctx.asks_services
+    assert ctx.asks_appointment
+    assert not ctx.asks_hours
+    assert not ctx.asks_activation
+
+
+def test_behaves_as_the_raw_text():
+    ctx = MessageContext("hola")
+
+    assert ctx == "hola"
+    assert isinstance(ctx.raw, str) and type(ctx.raw) is str
+    assert MessageContext(None) == ""
+
+
+def test_as_context_reuses_existing_context():
+    ctx = MessageContext("precio")
+
+    assert as_context(ctx) is ctx
+    assert as_context("precio") == ctx
+
+
+def test_normalization_runs_once_across_layers():
+    ctx = MessageContext("Quiero un turno, cuánto cuesta?")
+
+    with patch("app.message_context.normalize_text", wraps=lambda t: t.lower()) as mock_normalize:
+        assert contains_appointment_keyword(ctx)
+        assert contains_service_query_keyword(ctx)
+        assert contains_appointment_keyword(ctx)
+        dispatch_signal("123456789", ctx, "completado")
+
+    mock_normalize.assert_called_once()
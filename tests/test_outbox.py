@@ -0,0 +1,309 @@
+"""
+Tests for the durable outbound queue in app/outbox.py
+"""
+
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+import requests
+
+from app import graph_client, outbox
+from app.graph_client import SendError
+from app.models import SessionLocal, OutboxMessage, DeadLetter
+
+
+class FakeGraph:
+    """Send callback: records (to, text) and fails the first calls as told."""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    def __call__(self, to, text):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((to, text))
+        return {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+
+@pytest.fixture
+def phone(monkeypatch):
+    """A phone no other test uses; its rows are removed afterwards. Sends are immediate."""
+    phone = f"54999{uuid.uuid4().int % 10**8:08d}"
+    monkeypatch.setattr(outbox._pacer, "rate", 0)
+    outbox.clear()
+    yield phone
+    outbox.configure(None)
+    db = SessionLocal()
+    db.query(OutboxMessage).filter(OutboxMessage.to_phone.like(f"{phone}%")).delete(synchronize_session=False)
+    db.query(DeadLetter).filter(DeadLetter.to_phone.like(f"{phone}%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def rows(model, phone):
+    db = SessionLocal()
+    try:
+        return db.query(model).filter(model.to_phone.like(f"{phone}%")).order_by(model.id).all()
+    finally:
+        db.close()
+
+
+def make_due(phone):
+    """Pretend every retry of phone came due."""
+    db = SessionLocal()
+    for row in db.query(OutboxMessage).filter(OutboxMessage.to_phone.like(f"{phone}%")):
+        row.next_attempt_at = row.next_attempt_at - timedelta(days=1)
+    db.commit()
+    db.close()
+
+
+def test_enqueued_message_is_sent_and_removed(phone):
+    graph = FakeGraph()
+    sent_hook = []
+    outbox.configure(graph, on_sent=lambda to, result: sent_hook.append(to))
+
+    assert outbox.enqueue(phone, "hola")
+    assert len(rows(OutboxMessage, phone)) == 1
+
+    outbox.process_due()
+
+    assert (phone, "hola") in graph.sent
+    assert sent_hook.count(phone) == 1
+    assert rows(OutboxMessage, phone) == []
+    assert outbox.counters["sent"] >= 1
+
+
+def test_transient_error_is_retried_with_backoff(phone):
+    graph = FakeGraph([SendError("HTTP 429", retryable=True)])
+    outbox.configure(graph)
+    outbox.enqueue(phone, "hola")
+
+    outbox.process_due()
+
+    [row] = rows(OutboxMessage, phone)
+    assert row.attempts == 1
+    assert row.last_error == "HTTP 429"
+    assert row.next_attempt_at > row.created_at
+
+    # Not due yet: nothing is sent
+    outbox.process_due()
+    assert (phone, "hola") not in graph.sent
+
+    make_due(phone)
+    outbox.process_due()
+    assert (phone, "hola") in graph.sent
+    assert rows(OutboxMessage, phone) == []
+
+
+def test_unexpected_exception_is_retried(phone):
+    outbox.configure(FakeGraph([requests.exceptions.ConnectionError("reset")]))
+    outbox.enqueue(phone, "hola")
+
+    outbox.process_due()
+
+    assert rows(OutboxMessage, phone)[0].attempts == 1
+
+
+def test_permanent_error_goes_to_dead_letters(phone):
+    outbox.configure(FakeGraph([SendError("HTTP 400 code 131026", status=400, code=131026)]))
+    outbox.enqueue(phone, "hola")
+
+    outbox.process_due()
+
+    assert rows(OutboxMessage, phone) == []
+    [dead] = rows(DeadLetter, phone)
+    assert dead.attempts == 1
+    assert dead.text == "hola"
+    assert "131026" in dead.last_error
+
+
+def test_exhausted_retries_go_to_dead_letters(phone, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+    outbox.configure(FakeGraph([SendError("HTTP 503", retryable=True)] * 3))
+    outbox.enqueue(phone, "hola")
+
+    for _ in range(3):
+        make_due(phone)
+        outbox.process_due()
+
+    assert rows(OutboxMessage, phone) == []
+    assert rows(DeadLetter, phone)[0].attempts == 3
+
+
+def test_replay_requeues_dead_letters(phone):
+    graph = FakeGraph([SendError("HTTP 400")])
+    outbox.configure(graph)
+    outbox.enqueue(phone, "hola")
+    outbox.process_due()
+    [dead] = rows(DeadLetter, phone)
+
+    outbox.main(["replay", str(dead.id)])
+
+    assert rows(DeadLetter, phone) == []
+    [row] = rows(OutboxMessage, phone)
+    assert row.attempts == 0
+    outbox.process_due()
+    assert (phone, "hola") in graph.sent
+
+
+def test_messages_to_one_phone_keep_their_order(phone):
+    graph = FakeGraph([SendError("HTTP 429", retryable=True)])
+    outbox.configure(graph)
+    other = phone + "1"
+    for text in ("uno", "dos", "tres"):
+        outbox.enqueue(phone, text)
+    outbox.enqueue(other, "otro")
+
+    # "uno" fails: "dos" and "tres" wait behind it, the other phone doesn't
+    outbox.process_due()
+    assert (other, "otro") in graph.sent
+    assert [text for to, text in graph.sent if to == phone] == []
+
+    for _ in range(3):
+        make_due(phone)
+        outbox.process_due()
+
+    assert [text for to, text in graph.sent if to == phone] == ["uno", "dos", "tres"]
+
+
+def test_sends_are_paced_to_the_rate_cap(phone, monkeypatch):
+    monkeypatch.setattr(outbox._pacer, "rate", 50)
+    graph = FakeGraph()
+    outbox.configure(graph)
+    for i in range(6):
+        outbox.enqueue(f"{phone}{i}", "hola")
+
+    started = time.monotonic()
+    outbox.process_due()
+    elapsed = time.monotonic() - started
+
+    assert len([to for to, _ in graph.sent if to.startswith(phone)]) == 6
+    # 6 sends 20 ms apart: the last one waits at least 100 ms
+    assert elapsed >= 0.1
+
+
+def test_dispatcher_drains_in_background(phone, monkeypatch, whatsapp_token):
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_INTERVAL_MS", 50)
+    graph = FakeGraph()
+    outbox.configure(graph)
+    outbox.start()
+    try:
+        for i in range(5):
+            outbox.enqueue(f"{phone}{i}", "hola")
+        deadline = time.monotonic() + 5
+        while rows(OutboxMessage, phone) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert outbox.stats()["running"] is True
+    finally:
+        outbox.stop(timeout=5)
+
+    assert rows(OutboxMessage, phone) == []
+    assert len([to for to, _ in graph.sent if to.startswith(phone)]) == 5
+    assert outbox.stats()["running"] is False
+
+
+def test_refused_by_open_breaker_is_deferred_without_an_attempt(phone):
+    outbox.configure(FakeGraph([graph_client.CircuitOpen("token unusable", retryable=True)]))
+    outbox.enqueue(phone, "hola")
+
+    outbox.process_due()
+
+    [row] = rows(OutboxMessage, phone)
+    assert row.attempts == 0
+    assert row.next_attempt_at == row.created_at
+    assert outbox.counters["deferred"] == 1
+
+
+def test_queue_is_flushed_when_breaker_closes(phone, monkeypatch, whatsapp_token):
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_INTERVAL_MS", 60000)
+    whatsapp_token.on_close(outbox._wake.set)
+    whatsapp_token.record_failure("token invalid or expired")
+    graph = FakeGraph()
+    outbox.configure(graph)
+    outbox.start()
+    try:
+        outbox.enqueue(phone, "hola")
+        time.sleep(0.2)
+        # Open breaker: nothing dispatched
+        assert len(rows(OutboxMessage, phone)) == 1
+
+        whatsapp_token.record_success()
+        deadline = time.monotonic() + 5
+        while rows(OutboxMessage, phone) and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        outbox.stop(timeout=5)
+
+    assert (phone, "hola") in graph.sent
+
+
+def test_backoff_is_exponential_capped_and_jittered(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_BASE_SECONDS", 1)
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_MAX_SECONDS", 10)
+
+    assert 0.5 <= outbox.backoff(1) <= 1
+    assert 2 <= outbox.backoff(3) <= 4
+    assert 5 <= outbox.backoff(10) <= 10
+    assert len({outbox.backoff(3) for _ in range(20)}) > 1
+
+
+def test_stats_reports_pending_and_lag(phone):
+    outbox.enqueue(phone, "hola")
+
+    stats = outbox.stats()
+
+    assert stats["pending"] >= 1
+    assert stats["lag_seconds"] >= 0
+    assert stats["enqueued"] == 1
+
+
+# ==================== GRAPH ERRORS ====================
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+@pytest.mark.parametrize("status, code, retryable", [
+    (429, 130429, True),
+    (400, 131056, True),
+    (400, 4, True),
+    (500, None, True),
+    (503, 131016, True),
+    (400, 131026, False),
+    (400, 100, False),
+    (401, 190, False),
+])
+def test_graph_error_classification(status, code, retryable):
+    body = {"error": {"code": code, "message": "x"}} if code else {}
+
+    error = graph_client.error_for(FakeResponse(status, body))
+
+    assert error.retryable is retryable
+    assert error.status == status
+    assert error.code == code
+
+
+# ==================== WEBHOOK ====================
+
+def test_webhook_reply_goes_through_outbox(phone, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.state import conversaciones
+
+    monkeypatch.setattr("app.main.WEBHOOK_MODE", "inline")
+    monkeypatch.setattr("app.main.OUTBOUND_MODE", "outbox")
+    conversaciones.clear()
+    payload = {"entry": [{"changes": [{"value": {"messages": [{"from": phone, "type": "image"}]}}]}]}
+
+    assert TestClient(app).post("/webhook", json=payload).status_code == 200
+
+    [row] = rows(OutboxMessage, phone)
+    assert "texto" in row.text
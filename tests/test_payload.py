@@ -0,0 +1,86 @@
+"""
+Tests for app/payload.py: raw body decoding and lean field extraction.
+"""
+
+import json
+import pytest
+from app.payload import InboundMessage, PayloadError, PayloadTooLarge, decode, extract
+
+
+def payload(*values):
+    return {"object": "whatsapp_business_account", "entry": [{"id": "1", "changes": [{"field": "messages", "value": v} for v in values]}]}
+
+
+def test_decode_object():
+    assert decode(b'{"entry": []}') == {"entry": []}
+
+
+def test_decode_refuses_oversize_body():
+    with pytest.raises(PayloadTooLarge):
+        decode(b'{"entry": []}', max_bytes=5)
+
+
+@pytest.mark.parametrize("body", [b"{broken", b"[]", b'"text"', b"\xff\xfe"])
+def test_decode_refuses_invalid_bodies(body):
+    with pytest.raises(PayloadError):
+        decode(body)
+
+
+def test_extract_keeps_only_used_fields():
+    batch = extract(payload({
+        "messaging_product": "whatsapp",
+        "metadata": {"display_phone_number": "15550000000", "phone_number_id": "976165072250440"},
+        "contacts": [{"profile": {"name": "Ana"}, "wa_id": "5491112345678"}],
+        "messages": [{
+            "from": "5491112345678", "id": "wamid.1", "timestamp": "1700000000",
+            "type": "text", "text": {"body": "hola"},
+        }],
+    }))
+
+    assert batch.messages == [InboundMessage(
+        id="wamid.1", sender="5491112345678", type="text", text="hola",
+        timestamp="1700000000", phone_number_id="976165072250440",
+    )]
+    assert batch.statuses == []
+
+
+def test_extract_is_slotted():
+    message = extract(payload({"messages": [{"from": "1", "type": "text"}]})).messages[0]
+    assert not hasattr(message, "__dict__")
+
+
+def test_extract_non_text_message_has_empty_text():
+    batch = extract(payload({"messages": [{"from": "1", "id": "wamid.2", "type": "image", "image": {"id": "img"}}]}))
+    assert batch.messages[0].type == "image"
+    assert batch.messages[0].text == ""
+
+
+def test_extract_every_change_of_every_entry_in_order():
+    body = payload({"messages": [{"from": "1", "type": "text", "text": {"body": "a"}}]},
+                   {"messages": [{"from": "2", "type": "text", "text": {"body": "b"}}],
+                    "statuses": [{"id": "wamid.s", "status": "read"}]})
+    body["entry"].append(payload({"messages": [{"from": "1", "type": "text", "text": {"body": "c"}}]})["entry"][0])
+
+    batch = extract(body)
+
+    assert [(m.sender, m.text) for m in batch.messages] == [("1", "a"), ("2", "b"), ("1", "c")]
+    assert batch.statuses == [{"id": "wamid.s", "status": "read"}]
+
+
+def test_extract_skips_malformed_items():
+    batch = extract({"entry": [
+        "bad",
+        {"changes": None},
+        {"changes": [{"value": {"messages": ["bad", {"from": "1", "type": "text", "text": "not a dict"}], "statuses": [3]}}]},
+    ]})
+
+    assert [(m.sender, m.text) for m in batch.messages] == [("1", "")]
+    assert batch.statuses == []
+
+
+def test_extract_100_message_batch():
+    messages = [{"from": f"549110{i:07d}", "id": f"wamid.{i}", "type": "text", "text": {"body": f"m{i}"}} for i in range(100)]
+    batch = extract(decode(json.dumps(payload({"messages": messages})).encode()))
+
+    assert len(batch.messages) == 100
+    assert batch.messages[99].id == "wamid.99"
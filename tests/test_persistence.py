@@ -6,20 +6,37 @@ Following TDD approach: tests written before implementation.
 
 import json
 import pytest
+from datetime import date
 from pathlib import Path
-from app.persistence import save_state, load_state, STATE_FILE
+from app.persistence import (
+    save_state,
+    load_state,
+    append_state,
+    compact_state,
+    state_log_path,
+    state_index_path,
+    load_state_index,
+    read_indexed_conversation,
+    load_conversation,
+    upsert_conversations,
+    STATE_FILE,
+)
+
+
+def _remove_state_files():
+    for path in (STATE_FILE, state_log_path(), STATE_FILE.with_suffix(".log.1"), state_index_path()):
+        if path.exists():
+            path.unlink()
 
 
 @pytest.fixture
 def clean_state():
     """Fixture to ensure clean state before each test."""
-    # Remove state file if exists
-    if STATE_FILE.exists():
-        STATE_FILE.unlink()
+    # Remove state file and mutation log if exist
+    _remove_state_files()
     yield
     # Cleanup after test
-    if STATE_FILE.exists():
-        STATE_FILE.unlink()
+    _remove_state_files()
 
 
 def test_save_and_load_state(clean_state):
@@ -163,3 +180,242 @@ def test_save_state_handles_datetime_serialization(clean_state):
     assert loaded["123"]["estado"] == "esperando_nombre"
     # Timestamp will be string after JSON serialization
     assert isinstance(loaded["123"]["timestamp"], str)
+
+
+def test_append_state_replayed_on_load(clean_state):
+    """Test 9: Log records are applied on top of the snapshot."""
+    save_state({"111": {"estado": "esperando_nombre"}})
+
+    append_state({"111": {"estado": "esperando_horarios", "nombre": "Barbería X"}})
+    append_state({"222": {"estado": "completado"}})
+
+    loaded = load_state()
+
+    assert loaded == {
+        "111": {"estado": "esperando_horarios", "nombre": "Barbería X"},
+        "222": {"estado": "completado"}
+    }
+
+
+def test_append_state_deletion(clean_state):
+    """Test 10: A None record deletes the conversation."""
+    append_state({"111": {"estado": "completado"}, "222": {"estado": "inicial"}})
+    append_state({"111": None})
+
+    assert load_state() == {"222": {"estado": "inicial"}}
+
+
+def test_append_state_only_writes_changed_phone(clean_state):
+    """Test 11: Appending does not rewrite the snapshot."""
+    save_state({str(i): {"estado": "completado"} for i in range(100)})
+    snapshot_before = STATE_FILE.read_text(encoding='utf-8')
+
+    append_state({"5": {"estado": "esperando_fecha_turno"}})
+
+    assert STATE_FILE.read_text(encoding='utf-8') == snapshot_before
+    assert len(state_log_path().read_text(encoding='utf-8').splitlines()) == 1
+    assert load_state()["5"]["estado"] == "esperando_fecha_turno"
+
+
+def test_load_state_skips_torn_log_record(clean_state):
+    """Test 12: A half-written last record (crash) is ignored."""
+    append_state({"111": {"estado": "completado"}})
+    with open(state_log_path(), 'a', encoding='utf-8') as f:
+        f.write('{"phone": "222", "data": {"esta')
+
+    assert load_state() == {"111": {"estado": "completado"}}
+
+
+def test_compact_state_folds_log_into_snapshot(clean_state):
+    """Test 13: Compaction produces a snapshot equal to snapshot + log."""
+    save_state({"111": {"estado": "esperando_nombre"}})
+    append_state({"111": {"estado": "completado"}, "222": {"estado": "inicial"}})
+    append_state({"222": None})
+
+    compact_state()
+
+    assert not state_log_path().exists()
+    with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {"111": {"estado": "completado"}}
+    assert load_state() == {"111": {"estado": "completado"}}
+
+
+def test_save_state_discards_log(clean_state):
+    """Test 14: A full save supersedes pending log records."""
+    append_state({"111": {"estado": "completado"}})
+
+    save_state({"222": {"estado": "inicial"}})
+
+    assert not state_log_path().exists()
+    assert load_state() == {"222": {"estado": "inicial"}}
+
+
+# ==================== LAZY INDEXED STARTUP ====================
+
+@pytest.fixture
+def lazy_index(clean_state, monkeypatch):
+    """Restore the module to eager mode after the test."""
+    monkeypatch.setattr("app.persistence._index_enabled", False)
+    yield
+
+
+def test_index_reads_snapshot_lines(lazy_index):
+    """Test 15: Conversations are read through the index, one line each."""
+    state = {
+        "111": {"estado": "completado", "nombre": "Barbería Ñandú 👋"},
+        "222": {"estado": "esperando_nombre"}
+    }
+    save_state(state)
+
+    assert load_state_index() == 2
+    assert read_indexed_conversation("111") == state["111"]
+    assert read_indexed_conversation("222") == state["222"]
+    assert read_indexed_conversation("333") is None
+
+
+def test_index_tracks_log_appends_and_deletes(lazy_index):
+    """Test 16: Appends after startup update the index."""
+    save_state({"111": {"estado": "esperando_nombre"}, "222": {"estado": "completado"}})
+    load_state_index()
+
+    append_state({"111": {"estado": "esperando_horarios"}, "333": {"estado": "inicial"}})
+    append_state({"222": None})
+
+    assert read_indexed_conversation("111") == {"estado": "esperando_horarios"}
+    assert read_indexed_conversation("222") is None
+    assert read_indexed_conversation("333") == {"estado": "inicial"}
+
+
+def test_index_includes_log_tail_at_startup(lazy_index):
+    """Test 17: Log records written before startup are indexed."""
+    save_state({"111": {"estado": "esperando_nombre"}})
+    append_state({"111": {"estado": "completado"}, "222": {"estado": "inicial"}})
+
+    assert load_state_index() == 2
+    assert read_indexed_conversation("111") == {"estado": "completado"}
+
+
+def test_index_survives_compaction(lazy_index):
+    """Test 18: Offsets are swapped to the new snapshot after compaction."""
+    save_state({"111": {"estado": "esperando_nombre"}, "222": {"estado": "completado"}})
+    load_state_index()
+    append_state({"111": {"estado": "completado", "nombre": "Nuevo nombre largo"}})
+    append_state({"222": None})
+
+    compact_state()
+    append_state({"333": {"estado": "inicial"}})
+
+    assert read_indexed_conversation("111") == {"estado": "completado", "nombre": "Nuevo nombre largo"}
+    assert read_indexed_conversation("222") is None
+    assert read_indexed_conversation("333") == {"estado": "inicial"}
+
+
+def test_stale_index_is_rebuilt(lazy_index):
+    """Test 19: An index that doesn't match the snapshot is regenerated."""
+    STATE_FILE.parent.mkdir(exist_ok=True)
+    # Snapshot written by an older version (indent=2, no index)
+    STATE_FILE.write_text(json.dumps({"111": {"estado": "completado"}}, indent=2), encoding='utf-8')
+
+    assert load_state_index() == 1
+    assert state_index_path().exists()
+    assert read_indexed_conversation("111") == {"estado": "completado"}
+
+
+# ==================== SQLITE CONVERSATION STORE ====================
+
+@pytest.fixture
+def clean_rows():
+    """Remove sqlite conversation rows used by these tests."""
+    phones = ["sqlite-111", "sqlite-222"]
+    upsert_conversations({phone: None for phone in phones})
+    yield phones
+    upsert_conversations({phone: None for phone in phones})
+
+
+def test_upsert_and_load_conversation(clean_rows):
+    """Test 20: A row is inserted and read back by phone."""
+    upsert_conversations({"sqlite-111": {"estado": "esperando_nombre", "nombre": "Peluquería Ñ 👋"}})
+
+    assert load_conversation("sqlite-111") == {"estado": "esperando_nombre", "nombre": "Peluquería Ñ 👋"}
+    assert load_conversation("sqlite-222") is None
+
+
+def test_upsert_overwrites_existing_row(clean_rows):
+    """Test 21: Upserting the same phone replaces its data."""
+    upsert_conversations({"sqlite-111": {"estado": "esperando_nombre"}})
+    upsert_conversations({"sqlite-111": {"estado": "completado"}, "sqlite-222": {"estado": "inicial"}})
+
+    assert load_conversation("sqlite-111") == {"estado": "completado"}
+    assert load_conversation("sqlite-222") == {"estado": "inicial"}
+
+
+def test_upsert_none_deletes_row(clean_rows):
+    """Test 22: A None value deletes the row."""
+    upsert_conversations({"sqlite-111": {"estado": "completado"}})
+    upsert_conversations({"sqlite-111": None})
+
+    assert load_conversation("sqlite-111") is None
+
+
+# ==================== COMERCIOS Y TURNOS ====================
+
+def test_save_comercio_is_unique_per_owner():
+    """Test 23: Saving the same owner twice updates the same row."""
+    from app.persistence import save_comercio
+
+    first = save_comercio("comercio-test-111", "Barbería A", "Lun 9-12", "Corte $1")
+    second = save_comercio("comercio-test-111", "Barbería B", "Mar 9-12", "Corte $2")
+
+    assert first != -1
+    assert first == second
+
+
+def test_save_turno_and_list_by_cliente():
+    """Test 24: Turnos are rows listed by client phone."""
+    from app.persistence import save_comercio, save_turno, get_turnos_by_cliente
+    from app.models import SessionLocal, Turno
+
+    db = SessionLocal()
+    db.query(Turno).filter(Turno.cliente_telefono == "turno-test-111").delete()
+    db.commit()
+    db.close()
+
+    comercio_id = save_comercio("comercio-test-111", "Barbería A")
+    turno_id = save_turno(comercio_id, "turno-test-111", "lunes", "10:00", servicio="Corte", dia=date(2026, 1, 5))
+
+    turnos = get_turnos_by_cliente("turno-test-111")
+    assert turnos == [{
+        "id": turno_id,
+        "comercio_id": comercio_id,
+        "fecha": "lunes",
+        "dia": date(2026, 1, 5),
+        "hora": "10:00",
+        "servicio": "Corte"
+    }]
+
+
+def test_added_columns_keep_the_model_nullability(tmp_path, monkeypatch):
+    from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, inspect, text
+    from app import models
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE drafts (id INTEGER PRIMARY KEY)"))
+        connection.execute(text("INSERT INTO drafts (id) VALUES (1)"))
+    table = Table(
+        "drafts", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("status", String, nullable=False, server_default="pending"),
+        Column("channel", String, nullable=True, server_default="whatsapp"),
+    )
+    monkeypatch.setattr(models, "engine", engine)
+
+    models._add_missing_columns(table)
+
+    columns = {column["name"]: column for column in inspect(engine).get_columns("drafts")}
+    assert columns["status"]["nullable"] is False
+    assert columns["channel"]["nullable"] is True
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT status, channel FROM drafts")).one() == ("pending", "whatsapp")
+        connection.execute(text("UPDATE drafts SET channel = NULL"))
+    engine.dispose()
@@ -0,0 +1,122 @@
+"""
+Tests for app/rate_limit.py: per-sender and global token buckets, shedding.
+"""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from app import rate_limit
+from app.cache import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable monotonic clock for the limiter."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: now.value))
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_SENDER_PER_SECOND", 1.0)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_SENDER_BURST", 3)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_GLOBAL_PER_SECOND", 0)
+    rate_limit.clear()
+    return now
+
+
+def test_sender_burst_then_limited(clock):
+    assert [rate_limit.admit("549111") for _ in range(5)] == [True, True, True, False, False]
+    assert rate_limit.counters["admitted"] == 3
+    assert rate_limit.counters["limited"] == 2
+
+
+def test_sender_bucket_refills_over_time(clock):
+    for _ in range(3):
+        rate_limit.admit("549111")
+    assert not rate_limit.admit("549111")
+
+    clock.value += 1.0
+    assert rate_limit.admit("549111")
+    assert not rate_limit.admit("549111")
+
+    # Never refills past the burst
+    clock.value += 60
+    assert [rate_limit.admit("549111") for _ in range(4)] == [True, True, True, False]
+
+
+def test_senders_have_independent_buckets(clock):
+    for _ in range(3):
+        rate_limit.admit("549111")
+
+    assert not rate_limit.admit("549111")
+    assert rate_limit.admit("549222")
+
+
+def test_sender_buckets_are_bounded(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "_senders", LRUCache(max_entries=2))
+
+    for i in range(10):
+        rate_limit.admit(f"54911{i}")
+
+    assert len(rate_limit._senders) == 2
+
+
+def test_overload_sheds_customer_keeps_admin(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_GLOBAL_PER_SECOND", 1.0)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_GLOBAL_BURST", 2)
+    rate_limit.clear()
+
+    assert rate_limit.admit("549111")
+    assert rate_limit.admit("549222")
+    assert rate_limit.overloaded()
+
+    assert not rate_limit.admit("549333", "CUSTOMER")
+    assert rate_limit.admit("549444", "ADMIN")
+    assert rate_limit.counters["shed"] == 1
+
+    clock.value += 1.0
+    assert rate_limit.admit("549333", "CUSTOMER")
+
+
+def test_zero_rates_disable_limiting(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_SENDER_PER_SECOND", 0)
+
+    assert all(rate_limit.admit("549111") for _ in range(100))
+
+
+def test_stats():
+    rate_limit.admit("549111")
+
+    stats = rate_limit.stats()
+    assert stats["admitted"] == 1
+    assert stats["senders"] == 1
+    assert stats["overloaded"] is False
+
+
+# ==================== ENGINE / WEBHOOK ====================
+
+def test_flooding_customer_gets_no_reply_and_no_state(clock, monkeypatch):
+    from app.engine import handle_message
+    from app.state import conversaciones
+
+    monkeypatch.setattr("app.engine.STATELESS_INICIAL", True)
+    conversaciones.clear()
+
+    replies = [handle_message("5491199999999", "hola") for _ in range(5)]
+
+    assert replies[:3] == [replies[0]] * 3 and replies[0]
+    assert replies[3:] == [None, None]
+    assert "5491199999999" not in conversaciones
+
+
+@patch('app.main.send_whatsapp_message')
+def test_webhook_does_not_send_to_limited_sender(mock_send, clock, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    monkeypatch.setattr("app.main.WEBHOOK_MODE", "inline")
+    monkeypatch.setattr("app.main.OUTBOUND_MODE", "direct")
+    payload = {"entry": [{"changes": [{"value": {"messages": [
+        {"from": "5491188888888", "type": "image"} for _ in range(5)
+    ]}}]}]}
+
+    assert TestClient(app).post("/webhook", json=payload).status_code == 200
+
+    assert mock_send.call_count == 3
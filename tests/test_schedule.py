@@ -0,0 +1,139 @@
+"""
+Tests for weekly opening hours in app/schedule.py
+"""
+
+from datetime import date, datetime
+
+import pytest
+
+from app import schedule
+from app.schedule import (
+    compile_horarios,
+    is_open,
+    day_mask,
+    weekday_for_fecha,
+    resolve_fecha,
+    set_schedule,
+    is_open_now,
+)
+from app.availability import FULL_DAY
+
+COMERCIO = -43  # Never a real row: schedules are set directly
+
+
+@pytest.fixture(autouse=True)
+def clean_schedules():
+    schedule.clear()
+    yield
+    schedule.clear()
+
+
+def test_compile_day_span_and_single_day():
+    week = compile_horarios("Lun-Vie 9-18hs, Sab 9-13")
+
+    assert is_open(week, 0, 9 * 60)
+    assert is_open(week, 4, 17 * 60 + 59)
+    assert not is_open(week, 4, 18 * 60)
+    assert is_open(week, 5, 12 * 60 + 30)
+    assert not is_open(week, 5, 13 * 60)
+    assert not is_open(week, 6, 10 * 60)
+
+
+def test_compile_split_shift_with_words():
+    week = compile_horarios("lunes a viernes de 9 a 13 y de 17 a 21")
+
+    assert is_open(week, 2, 10 * 60)
+    assert not is_open(week, 2, 15 * 60)
+    assert is_open(week, 2, 20 * 60 + 30)
+    assert not is_open(week, 5, 10 * 60)
+
+
+def test_compile_day_list():
+    week = compile_horarios("Lun, Mié y Vie 10:00-12:30")
+
+    assert is_open(week, 2, 12 * 60)
+    assert not is_open(week, 1, 11 * 60)
+    assert not is_open(week, 4, 12 * 60 + 30)
+
+
+def test_compile_without_days_applies_to_every_day():
+    week = compile_horarios("9-18hs")
+
+    assert all(is_open(week, day, 12 * 60) for day in range(7))
+
+
+def test_compile_wrapping_span():
+    week = compile_horarios("Vie a Lun 10-14")
+
+    assert is_open(week, 6, 11 * 60)
+    assert is_open(week, 0, 11 * 60)
+    assert not is_open(week, 2, 11 * 60)
+
+
+@pytest.mark.parametrize("text", ["", "a convenir", "Lun-Vie", "18-9"])
+def test_compile_unparseable_returns_none(text):
+    assert compile_horarios(text) is None
+
+
+def test_compile_ignores_words_that_only_start_like_a_day():
+    week = compile_horarios("Martes 9-12, marzo y domicilio 14-18")
+
+    assert is_open(week, 1, 10 * 60)
+    # "marzo" / "domicilio" aren't days: 14-18 stays with martes
+    assert is_open(week, 1, 15 * 60)
+    assert not is_open(week, 6, 15 * 60)
+
+
+def test_day_mask():
+    week = compile_horarios("Sab 9-10")
+
+    assert day_mask(week, 5).bit_count() == 2
+    assert day_mask(week, 0) == 0
+    assert day_mask(None, 0) == FULL_DAY
+
+
+@pytest.mark.parametrize("fecha,weekday", [
+    ("lunes", 0),
+    ("el Sábado", 5),
+    ("domingo 12", 6),
+    ("17/10/2026", 5),
+    ("17/10", 5),
+    ("mañana", 4),
+    ("31/02", None),
+    ("15 de marzo", 6),
+    ("a domicilio", None),
+    ("mie", 2),
+])
+def test_weekday_for_fecha(fecha, weekday):
+    assert weekday_for_fecha(fecha, today=date(2026, 1, 1)) == weekday
+
+
+@pytest.mark.parametrize("fecha,dia", [
+    ("hoy", date(2026, 1, 1)),
+    ("Mañana", date(2026, 1, 2)),
+    ("pasado mañana", date(2026, 1, 3)),
+    ("lunes", date(2026, 1, 5)),
+    ("el lunes", date(2026, 1, 5)),
+    ("jueves", date(2026, 1, 8)),  # Today is Thursday: next week's
+    ("17/10", date(2026, 10, 17)),
+    ("15 de marzo", date(2026, 3, 15)),
+    ("3 de mayo de 2027", date(2027, 5, 3)),
+    ("a la tarde", None),
+    ("31/02", None),
+])
+def test_resolve_fecha(fecha, dia):
+    assert resolve_fecha(fecha, today=date(2026, 1, 1)) == dia
+
+
+def test_resolve_fecha_past_date_without_year_is_next_year():
+    assert resolve_fecha("10/03", today=date(2026, 6, 1)) == date(2027, 3, 10)
+
+
+def test_is_open_now():
+    set_schedule(COMERCIO, "Lun-Vie 9-18hs")
+
+    assert is_open_now(COMERCIO, datetime(2026, 10, 16, 10, 0)) is True   # Friday
+    assert is_open_now(COMERCIO, datetime(2026, 10, 17, 10, 0)) is False  # Saturday
+
+    set_schedule(COMERCIO, "a convenir")
+    assert is_open_now(COMERCIO, datetime(2026, 10, 16, 10, 0)) is None
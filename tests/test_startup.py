@@ -0,0 +1,83 @@
+"""
+Tests for lazy startup: no I/O at import, token validated in the background
+"""
+
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import graph_client
+
+ROOT = Path(__file__).resolve().parent.parent
+
+NO_NETWORK = """
+import socket
+def refuse(*args):
+    raise AssertionError("network I/O at import")
+socket.socket.connect = refuse
+socket.create_connection = refuse
+import app.main
+"""
+
+
+def test_import_does_no_network_or_database_io(tmp_path):
+    (tmp_path / "data").mkdir()
+
+    result = subprocess.run(
+        [sys.executable, "-c", NO_NETWORK],
+        cwd=tmp_path, capture_output=True, text=True,
+        env={"PYTHONPATH": str(ROOT), "WHATSAPP_TOKEN": "test-token", "LOG_LEVEL": "WARNING"},
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert not (tmp_path / "data" / "nordia.db").exists()
+
+
+def test_conversation_state_is_loaded_by_the_lifespan_not_the_import(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "conversations_state.json").write_text('{"111": {"estado": "completado"}}')
+    script = (
+        "from app import state\n"
+        "assert len(state.conversaciones) == 0\n"
+        "state.load()\n"
+        "assert state.conversaciones.get('111') == {'estado': 'completado'}\n"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path, capture_output=True, text=True,
+        env={"PYTHONPATH": str(ROOT), "LOG_LEVEL": "WARNING", "STATE_BACKEND": "json"},
+    )
+
+    assert result.returncode == 0, result.stderr
+
+
+def test_startup_does_not_wait_for_token_validation(whatsapp_token, monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "inline")
+    monkeypatch.setattr(main, "OUTBOUND_MODE", "direct")
+    started = threading.Event()
+    answer = threading.Event()
+
+    def slow_validation():
+        started.set()
+        answer.wait(5)
+        return False
+
+    monkeypatch.setattr(graph_client, "validate_token", slow_validation)
+
+    with TestClient(main.app) as client:
+        assert started.wait(1)
+        # Serving while Graph hasn't answered; the breaker is still closed
+        assert client.get("/").status_code == 200
+        assert whatsapp_token.state == "closed"
+        answer.set()
+        for _ in range(100):
+            if whatsapp_token.state == "open":
+                break
+            time.sleep(0.01)
+        assert whatsapp_token.state == "open"
@@ -0,0 +1,294 @@
+"""
+Tests for conversation state backends in app/state.py
+
+Tests:
+- json backend appends to the mutation log
+- sqlite backend reads rows on demand and upserts per phone
+"""
+
+import pytest
+
+from app import state
+from app.state import conversaciones, update_conversation, get_conversation, delete_conversation
+from app import persistence
+from app.persistence import load_state, load_conversation, upsert_conversations
+
+
+@pytest.fixture(autouse=True)
+def clean_test_state(tmp_path, monkeypatch):
+    """
+    Clean state before each test and use temp directory for persistence.
+    """
+    conversaciones.clear()
+
+    test_state_file = tmp_path / "test_conversations.json"
+    monkeypatch.setattr("app.persistence.STATE_FILE", test_state_file)
+
+    yield
+
+    conversaciones.clear()
+
+
+@pytest.fixture
+def sqlite_backend(monkeypatch):
+    """Switch app.state to the sqlite backend and clean test rows."""
+    monkeypatch.setattr(state, "STATE_BACKEND", "sqlite")
+    phone = "state-sqlite-111"
+    delete_conversation(phone)
+    yield phone
+    delete_conversation(phone)
+
+
+def test_json_backend_update_survives_reload():
+    sender = "123456789"
+
+    update_conversation(sender, {"estado": "esperando_nombre"})
+    update_conversation(sender, {"estado": "esperando_horarios", "nombre": "Barbería X"})
+
+    assert load_state() == {sender: {"estado": "esperando_horarios", "nombre": "Barbería X"}}
+
+
+def test_json_backend_delete_survives_reload():
+    sender = "123456789"
+
+    update_conversation(sender, {"estado": "completado"})
+    delete_conversation(sender)
+
+    assert load_state() == {}
+
+
+def test_sqlite_backend_upserts_single_row(sqlite_backend):
+    sender = sqlite_backend
+
+    update_conversation(sender, {"estado": "esperando_nombre"})
+
+    assert load_conversation(sender) == {"estado": "esperando_nombre"}
+    assert load_state() == {}  # JSON files untouched
+
+
+def test_sqlite_backend_reads_uncached_row(sqlite_backend):
+    sender = sqlite_backend
+
+    update_conversation(sender, {"estado": "completado", "servicios": "Corte $5000"})
+    conversaciones.clear()  # Simulate restart: nothing in RAM
+
+    assert get_conversation(sender) == {"estado": "completado", "servicios": "Corte $5000"}
+    assert sender in conversaciones
+
+
+def test_sqlite_backend_delete_uncached_row(sqlite_backend):
+    sender = sqlite_backend
+
+    update_conversation(sender, {"estado": "completado"})
+    conversaciones.clear()
+
+    delete_conversation(sender)
+
+    assert load_conversation(sender) is None
+    assert get_conversation(sender) == {}
+
+
+def test_switching_to_sqlite_imports_json_state_once(sqlite_backend, monkeypatch):
+    sender = sqlite_backend
+    kept = "state-sqlite-222"
+    persistence.save_state({sender: {"estado": "esperando_nombre"}, kept: {"estado": "inicial"}})
+    persistence.append_state({sender: {"estado": "esperando_horarios"}})
+    # Already in sqlite: newer than the json copy
+    upsert_conversations({kept: {"estado": "completado"}})
+    monkeypatch.setattr(state, "_loaded", False)
+
+    assert get_conversation(sender) == {"estado": "esperando_horarios"}
+
+    assert load_conversation(sender) == {"estado": "esperando_horarios"}
+    assert load_conversation(kept) == {"estado": "completado"}
+    assert not persistence.STATE_FILE.exists()
+    assert persistence.STATE_FILE.with_name(persistence.STATE_FILE.name + ".migrated").exists()
+    assert persistence.import_json_state() == 0
+    delete_conversation(kept)
+
+
+# ==================== GROUPED DURABILITY ====================
+
+@pytest.fixture
+def grouped_durability(monkeypatch):
+    """Switch app.state to grouped durability with a long window."""
+    monkeypatch.setattr(state, "STATE_DURABILITY", "grouped")
+    monkeypatch.setattr(state, "STATE_FLUSH_INTERVAL_MS", 60_000)
+    monkeypatch.setattr(state, "STATE_FLUSH_MAX_PENDING", 3)
+    yield
+    state.flush()
+
+
+def test_grouped_mutations_wait_for_flush(grouped_durability):
+    update_conversation("111", {"estado": "esperando_nombre"})
+    update_conversation("111", {"estado": "esperando_horarios"})
+
+    assert get_conversation("111") == {"estado": "esperando_horarios"}
+    assert load_state() == {}  # Nothing written yet
+    assert state.pending_writes() == 1  # Coalesced into one dirty phone
+
+    assert state.flush() == 1
+    assert load_state() == {"111": {"estado": "esperando_horarios"}}
+    assert state.pending_writes() == 0
+
+
+def test_grouped_flushes_when_max_pending_reached(grouped_durability):
+    update_conversation("111", {"estado": "completado"})
+    update_conversation("222", {"estado": "completado"})
+    assert load_state() == {}
+
+    update_conversation("333", {"estado": "completado"})
+
+    assert len(load_state()) == 3
+    assert state.pending_writes() == 0
+
+
+def test_grouped_flushes_after_window(grouped_durability, monkeypatch):
+    import time
+
+    monkeypatch.setattr(state, "STATE_FLUSH_INTERVAL_MS", 10)
+    update_conversation("111", {"estado": "completado"})
+
+    deadline = time.time() + 2
+    while state.pending_writes() and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert load_state() == {"111": {"estado": "completado"}}
+
+
+def test_grouped_writes_state_as_of_update(grouped_durability):
+    conv = {"estado": "esperando_nombre"}
+    update_conversation("111", conv)
+    # The engine keeps mutating the live dict without calling update again
+    conv["nombre"] = "Barbería X"
+
+    state.flush()
+
+    assert load_state() == {"111": {"estado": "esperando_nombre"}}
+
+
+def test_grouped_failed_json_flush_keeps_batch_for_retry(grouped_durability, monkeypatch, tmp_path):
+    update_conversation("111", {"estado": "completado"})
+
+    # The log can't be opened: append_state logs and reports the failure
+    log_path = persistence.state_log_path
+    monkeypatch.setattr(persistence, "state_log_path", lambda: tmp_path / "missing" / "state.log")
+    assert state.flush() == 0
+    assert state._flushing == {}
+    assert state.pending_writes() == 1
+    assert load_state() == {}
+
+    monkeypatch.setattr(persistence, "state_log_path", log_path)
+    assert state.flush() == 1
+    assert load_state() == {"111": {"estado": "completado"}}
+
+
+def test_grouped_failed_sqlite_flush_keeps_batch_for_retry(grouped_durability, sqlite_backend, monkeypatch, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    sender = sqlite_backend
+    update_conversation(sender, {"estado": "completado"})
+
+    # The database can't be opened: upsert_conversations reports the failure
+    session = persistence.SessionLocal
+    unreachable = create_engine(f"sqlite:///{tmp_path / 'missing' / 'nordia.db'}")
+    monkeypatch.setattr(persistence, "SessionLocal", sessionmaker(bind=unreachable))
+    assert state.flush() == 0
+    assert state.pending_writes() == 1
+
+    monkeypatch.setattr(persistence, "SessionLocal", session)
+    assert state.flush() == 1
+    assert load_conversation(sender) == {"estado": "completado"}
+
+
+def test_grouped_pending_delete_hides_sqlite_row(grouped_durability, sqlite_backend):
+    sender = sqlite_backend
+
+    update_conversation(sender, {"estado": "completado"})
+    state.flush()
+
+    delete_conversation(sender)
+
+    assert get_conversation(sender) == {}
+    state.flush()
+    assert load_conversation(sender) is None
+
+
+# ==================== BOUNDED CACHE ====================
+
+def test_sqlite_backend_rereads_evicted_conversation(sqlite_backend, monkeypatch):
+    from app.cache import LRUCache
+
+    cache = LRUCache(max_entries=1)
+    monkeypatch.setattr(state, "conversaciones", cache)
+    sender = sqlite_backend
+    other = "state-sqlite-222"
+
+    update_conversation(sender, {"estado": "completado"})
+    update_conversation(other, {"estado": "inicial"})  # Evicts sender
+
+    assert sender not in cache
+    assert get_conversation(sender) == {"estado": "completado"}
+    assert cache.stats()["evictions"] >= 1
+
+    delete_conversation(other)
+
+
+def test_grouped_evicted_conversation_served_from_dirty_set(grouped_durability, sqlite_backend, monkeypatch):
+    from app.cache import LRUCache
+
+    monkeypatch.setattr(state, "conversaciones", LRUCache(max_entries=1))
+    sender = sqlite_backend
+    other = "state-sqlite-222"
+
+    update_conversation(sender, {"estado": "esperando_fecha_turno"})
+    update_conversation(other, {"estado": "inicial"})  # Evicts sender before flush
+
+    assert get_conversation(sender) == {"estado": "esperando_fecha_turno"}
+
+    delete_conversation(other)
+
+
+def test_sqlite_backend_remembers_absent_phone(sqlite_backend, monkeypatch):
+    from unittest.mock import MagicMock
+
+    sender = sqlite_backend
+    mock_load = MagicMock(return_value=None)
+    monkeypatch.setattr(state, "load_conversation", mock_load)
+
+    state._absent.pop(sender)
+    assert get_conversation(sender) == {}
+    assert get_conversation(sender) == {}
+    mock_load.assert_called_once()
+
+    # Creating the conversation clears the negative entry
+    update_conversation(sender, {"estado": "esperando_fecha_turno"})
+    conversaciones.clear()
+    monkeypatch.setattr(state, "load_conversation", load_conversation)
+    assert get_conversation(sender) == {"estado": "esperando_fecha_turno"}
+
+
+# ==================== LAZY JSON STARTUP ====================
+
+def test_lazy_json_reads_conversation_on_first_access(monkeypatch):
+    from app import persistence
+    from app.cache import LRUCache
+    from app.persistence import save_state
+
+    monkeypatch.setattr(persistence, "_index_enabled", False)
+    save_state({"111": {"estado": "completado", "servicios": "Corte $5000"}})
+    persistence.load_state_index()
+
+    monkeypatch.setattr(state, "STATE_LAZY_LOAD", True)
+    monkeypatch.setattr(state, "conversaciones", LRUCache(max_entries=1))
+    state._absent.clear()
+
+    assert get_conversation("111") == {"estado": "completado", "servicios": "Corte $5000"}
+
+    update_conversation("222", {"estado": "inicial"})  # Evicts "111"
+    update_conversation("111", {"estado": "esperando_fecha_turno"})  # Evicts "222"
+
+    assert get_conversation("222") == {"estado": "inicial"}
+    assert get_conversation("111") == {"estado": "esperando_fecha_turno"}
+    assert get_conversation("333") == {}
@@ -6,7 +6,7 @@ Validates business rules for nombre, horarios, and servicios inputs.
 """
 
 import pytest
-from app.validators import validate_nombre, validate_horarios, validate_servicios
+from app.validators import validate_nombre, validate_horarios, validate_servicios, validate_telefono, normalize_telefono
 
 
 # ==================== VALIDATE_NOMBRE TESTS ====================
@@ -184,3 +184,25 @@ def test_validate_servicios_no_letters():
         is_valid, error_msg = validate_servicios(servicio)
         assert not is_valid, f"'{servicio}' should be invalid (no letters)"
         assert "nombres" in error_msg.lower()
+
+
+# ==================== VALIDATE_TELEFONO TESTS ====================
+
+def test_validate_telefono_valid():
+    """International numbers with or without separators should pass."""
+    for phone in ["5493794123456", "+54 9 379 412-3456", "(549) 379.412.3456", "14155550123"]:
+        is_valid, error_msg = validate_telefono(phone)
+        assert is_valid, f"'{phone}' should be valid but got: {error_msg}"
+        assert error_msg == ""
+
+
+def test_validate_telefono_invalid():
+    """Letters, missing country code or too many digits should fail."""
+    for phone in ["", "no tengo", "379-412", "4123456", "5493794123456789012"]:
+        is_valid, error_msg = validate_telefono(phone)
+        assert not is_valid, f"'{phone}' should be invalid"
+        assert error_msg
+
+
+def test_normalize_telefono_keeps_only_digits():
+    assert normalize_telefono("+54 9 379 412-3456") == "5493794123456"
@@ -8,6 +8,7 @@ Tests non-text message handling:
 - Regression test for text messages
 """
 
+import logging
 import pytest
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
@@ -18,8 +19,16 @@ client = TestClient(app)
 
 
 @pytest.fixture(autouse=True)
-def clean_test_state():
-    """Clean conversation state before each test."""
+def clean_test_state(monkeypatch):
+    """
+    Clean conversation state before each test.
+
+    Webhooks are processed inline and replies sent directly (no outbox) so
+    tests can assert right after posting; queued tests switch the mode back
+    explicitly.
+    """
+    monkeypatch.setattr("app.main.WEBHOOK_MODE", "inline")
+    monkeypatch.setattr("app.main.OUTBOUND_MODE", "direct")
     conversaciones.clear()
     yield
     conversaciones.clear()
@@ -234,20 +243,21 @@ def test_webhook_text_message_still_works(mock_handle, mock_send):
 # ==================== LOGGING TESTS ====================
 
 @patch('app.main.send_whatsapp_message')
-def test_webhook_non_text_logs_media_type(mock_send, capsys):
+def test_webhook_non_text_logs_media_type(mock_send, caplog):
     """
     Non-text message should log the media type for analytics.
     """
     payload = create_whatsapp_payload("image")
 
-    response = client.post("/webhook", json=payload)
+    with caplog.at_level(logging.INFO, logger="nordia.webhook"):
+        response = client.post("/webhook", json=payload)
 
     assert response.status_code == 200
 
-    # Capture stdout and verify log
-    captured = capsys.readouterr()
-    assert "Non-text message" in captured.out or "[WEBHOOK]" in captured.out
-    assert "type=image" in captured.out or "image" in captured.out
+    # Structured record: the media type is a field, not parsed from text
+    records = [r for r in caplog.records if r.getMessage() == "Non-text message"]
+    assert records
+    assert records[0].type == "image"
 
 
 # ==================== EDGE CASES ====================
@@ -276,3 +286,341 @@ def test_webhook_handles_missing_type_field(mock_send):
     mock_send.assert_called_once()
     call_args = mock_send.call_args
     assert "texto" in call_args[0][1].lower()
+
+
+# ==================== OUTBOUND SENDS ====================
+
+def test_slow_send_does_not_block_other_webhooks():
+    """
+    Two webhooks in flight at once: each send waits for the other one,
+    which only works if sends run off the event loop.
+    """
+    import asyncio
+    import threading
+    import httpx
+
+    barrier = threading.Barrier(2, timeout=2)
+    met = []
+
+    def slow_send(to, text):
+        barrier.wait()
+        met.append(to)
+
+    async def post_both():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            await asyncio.gather(
+                http.post("/webhook", json=create_whatsapp_payload("image", "5491100000001")),
+                http.post("/webhook", json=create_whatsapp_payload("image", "5491100000002")),
+            )
+
+    with patch('app.main.send_whatsapp_message', side_effect=slow_send):
+        asyncio.run(post_both())
+
+    assert sorted(met) == ["5491100000001", "5491100000002"]
+
+
+def test_send_goes_through_pooled_client(whatsapp_token):
+    import app.main as main
+
+    with patch('app.main.graph_client.send_text') as mock_send_text:
+        mock_send_text.return_value.json.return_value = {"messages": [{"id": "wamid.x"}]}
+        assert main.send_whatsapp_message("5491112345678", "hola") == {"messages": [{"id": "wamid.x"}]}
+
+    mock_send_text.assert_called_once_with("5491112345678", "hola")
+
+
+def test_send_timeout_is_logged_not_raised(whatsapp_token, caplog):
+    import requests
+    import app.main as main
+
+    with patch('app.main.graph_client.send_text', side_effect=requests.exceptions.ReadTimeout("slow")):
+        assert main.send_whatsapp_message("5491112345678", "hola") is None
+
+    assert any(r.levelno == logging.ERROR and "Timeout" in r.getMessage() for r in caplog.records)
+
+
+def test_deliver_marks_transient_failures_retryable(whatsapp_token):
+    import requests
+    import app.main as main
+    from app.graph_client import SendError
+
+    with patch('app.main.graph_client.send_text', side_effect=requests.exceptions.ReadTimeout("slow")):
+        with pytest.raises(SendError) as timeout:
+            main.deliver("5491112345678", "hola")
+    assert timeout.value.retryable
+
+
+def test_deliver_refused_while_token_breaker_open(whatsapp_token, caplog):
+    import app.main as main
+    from app.graph_client import CircuitOpen
+
+    whatsapp_token.record_failure("token invalid or expired")
+
+    with patch.object(main.graph_client.get_session(), "post") as mock_post:
+        with pytest.raises(CircuitOpen):
+            main.deliver("5491112345678", "hola")
+        assert main.send_whatsapp_message("5491112345678", "hola") is None
+
+    mock_post.assert_not_called()
+    assert client.get("/").json()["mode"] == "degraded"
+
+
+def test_expired_token_response_opens_breaker(whatsapp_token):
+    import app.main as main
+    from app.graph_client import CircuitOpen
+
+    expired = MagicMock(status_code=401, ok=False, text="expired")
+    expired.json.return_value = {"error": {"code": 190, "message": "Session has expired"}}
+    with patch.object(main.graph_client.get_session(), "post", return_value=expired):
+        with pytest.raises(CircuitOpen) as refused:
+            main.deliver("5491112345678", "hola")
+
+    assert refused.value.retryable
+    assert whatsapp_token.state == "open"
+    health = client.get("/").json()
+    assert health["whatsapp"]["can_send"] is False
+    assert health["whatsapp"]["breaker"]["trips"] == 1
+    assert "invalid_since" in health["whatsapp"]
+
+
+# ==================== BATCHED PAYLOADS ====================
+
+def text_message(sender: str, body: str) -> dict:
+    return {"from": sender, "type": "text", "text": {"body": body}}
+
+
+def batched_payload() -> dict:
+    """Two entries, three changes, three senders interleaved."""
+    return {
+        "entry": [
+            {"changes": [
+                {"value": {"messages": [text_message("5491100000001", "a1"), text_message("5491100000002", "b1")]}},
+                {"value": {"statuses": [{"id": "wamid.x", "status": "read"}]}},
+                {"value": {"messages": [text_message("5491100000001", "a2")]}},
+            ]},
+            {"changes": [
+                {"value": {"messages": [
+                    text_message("5491100000003", "c1"),
+                    text_message("5491100000002", "b2"),
+                    {"from": "5491100000001", "type": "image", "image": {"id": "img"}},
+                ]}},
+            ]},
+        ]
+    }
+
+
+@patch('app.main.send_whatsapp_message')
+def test_batched_payload_processes_every_message(mock_send, monkeypatch):
+    import app.main as main
+
+    seen = []
+    monkeypatch.setattr(main, "handle_message", lambda sender, text: seen.append((sender, str(text))) or f"re:{text}")
+
+    response = client.post("/webhook", json=batched_payload())
+
+    assert response.status_code == 200
+    # Grouped by sender (first appearance order), each sender in arrival order
+    assert seen == [
+        ("5491100000001", "a1"), ("5491100000001", "a2"),
+        ("5491100000002", "b1"), ("5491100000002", "b2"),
+        ("5491100000003", "c1"),
+    ]
+    sent = [call.args for call in mock_send.call_args_list]
+    assert len(sent) == 6
+    assert sent[2][0] == "5491100000001" and "texto" in sent[2][1]
+
+
+@patch('app.main.send_whatsapp_message')
+def test_batched_payload_queued_keeps_per_sender_order(mock_send, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "queued")
+    monkeypatch.setattr(main, "handle_message", lambda sender, text: f"re:{text}")
+
+    response = client.post("/webhook", json=batched_payload())
+
+    assert response.status_code == 200
+    assert main.inbox.join(timeout=2)
+    by_sender = {}
+    for call in mock_send.call_args_list:
+        by_sender.setdefault(call.args[0], []).append(call.args[1])
+    assert by_sender["5491100000001"][:2] == ["re:a1", "re:a2"]
+    assert by_sender["5491100000002"] == ["re:b1", "re:b2"]
+    assert by_sender["5491100000003"] == ["re:c1"]
+
+
+@patch('app.main.send_whatsapp_message')
+def test_healthcheck_counts_batched_messages(mock_send, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "handle_message", lambda sender, text: "ok")
+    before = client.get("/").json()["webhook"]
+
+    client.post("/webhook", json=batched_payload())
+
+    after = client.get("/").json()["webhook"]
+    assert after["requests"] == before["requests"] + 1
+    assert after["messages"] == before["messages"] + 6
+
+
+# ==================== DEDUPLICATION ====================
+
+@patch('app.main.send_whatsapp_message')
+def test_redelivered_message_is_processed_once(mock_send, monkeypatch):
+    import uuid
+    import app.main as main
+
+    seen = []
+    monkeypatch.setattr(main, "handle_message", lambda sender, text: seen.append(str(text)) or "ok")
+    payload = create_whatsapp_payload("text")
+    payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"] = f"wamid.test-{uuid.uuid4().hex}"
+    before = client.get("/").json()["webhook"]["dedup"]["duplicates"]
+
+    assert client.post("/webhook", json=payload).status_code == 200
+    assert client.post("/webhook", json=payload).status_code == 200
+
+    assert seen == ["test message"]
+    mock_send.assert_called_once()
+    assert client.get("/").json()["webhook"]["dedup"]["duplicates"] == before + 1
+
+
+def test_rejected_message_is_accepted_on_redelivery(monkeypatch):
+    import uuid
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "queued")
+    monkeypatch.setattr(main.inbox, "submit", lambda key, item: False)
+    payload = create_whatsapp_payload("text")
+    message_id = f"wamid.test-{uuid.uuid4().hex}"
+    payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"] = message_id
+
+    assert client.post("/webhook", json=payload).status_code == 503
+
+    from app import dedup
+    assert dedup.claim(message_id)
+
+
+# ==================== DELIVERY STATUSES ====================
+
+@patch('app.main.delivery.ingest')
+def test_status_callbacks_are_ingested(mock_ingest):
+    payload = {"entry": [{"changes": [{"value": {"statuses": [
+        {"id": "wamid.a", "status": "delivered", "timestamp": "1700000000"},
+        {"id": "wamid.b", "status": "read", "timestamp": "1700000001"},
+    ]}}]}]}
+
+    response = client.post("/webhook", json=payload)
+
+    assert response.status_code == 200
+    mock_ingest.assert_called_once()
+    assert [s["id"] for s in mock_ingest.call_args[0][0]] == ["wamid.a", "wamid.b"]
+
+
+@patch('app.main.delivery.record_sent')
+@patch('app.main.send_whatsapp_message', return_value={"messages": [{"id": "wamid.sent"}]})
+def test_accepted_send_is_recorded(mock_send, mock_record):
+    client.post("/webhook", json=create_whatsapp_payload("image"))
+
+    mock_record.assert_called_once()
+    assert mock_record.call_args[0][:2] == ("wamid.sent", "5491112345678")
+
+
+# ==================== RAW BODY ====================
+
+@patch('app.main.send_whatsapp_message')
+def test_oversize_body_is_refused_before_processing(mock_send, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MAX_BODY_BYTES", 64)
+
+    response = client.post("/webhook", json=create_whatsapp_payload("text"))
+
+    assert response.status_code == 413
+    mock_send.assert_not_called()
+
+
+@patch('app.main.send_whatsapp_message')
+def test_invalid_json_body_is_refused(mock_send):
+    for body in (b"{not json", b"[1, 2]"):
+        response = client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+    mock_send.assert_not_called()
+
+
+# ==================== QUEUED PROCESSING ====================
+
+@patch('app.main.send_whatsapp_message')
+@patch('app.main.handle_message')
+def test_queued_webhook_acknowledges_before_processing(mock_handle, mock_send, monkeypatch):
+    """
+    Queued mode: the webhook returns 200 while the engine is still busy,
+    then a worker processes the message and sends the reply.
+    """
+    import threading
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "queued")
+    release = threading.Event()
+
+    def slow_engine(sender, text):
+        release.wait(2)
+        return "respuesta"
+
+    mock_handle.side_effect = slow_engine
+
+    response = client.post("/webhook", json=create_whatsapp_payload("text"))
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    mock_send.assert_not_called()
+
+    release.set()
+    assert main.inbox.join(timeout=2)
+    mock_send.assert_called_once_with("5491112345678", "respuesta")
+
+
+@patch('app.main.send_whatsapp_message')
+def test_queued_messages_of_one_sender_keep_order(mock_send, monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "queued")
+    seen = []
+    monkeypatch.setattr(main, "handle_message", lambda sender, text: seen.append(str(text)) or "ok")
+
+    for i in range(20):
+        payload = create_whatsapp_payload("text")
+        payload["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"] = f"m{i}"
+        client.post("/webhook", json=payload)
+
+    assert main.inbox.join(timeout=2)
+    assert seen == [f"m{i}" for i in range(20)]
+
+
+def test_queued_webhook_full_queue_returns_503(monkeypatch):
+    import app.main as main
+
+    monkeypatch.setattr(main, "WEBHOOK_MODE", "queued")
+    monkeypatch.setattr(main.inbox, "submit", lambda key, item: False)
+
+    response = client.post("/webhook", json=create_whatsapp_payload("text"))
+
+    assert response.status_code == 503
+
+
+def test_healthcheck_exposes_queue_metrics():
+    queue = client.get("/").json()["webhook"]["queue"]
+
+    for metric in ("depth", "enqueued", "processed", "wait_ms", "processing_ms"):
+        assert metric in queue
+
+
+# ==================== HEALTHCHECK ====================
+
+def test_healthcheck_exposes_cache_counters():
+    response = client.get("/")
+
+    assert response.status_code == 200
+    cache = response.json()["conversations"]["cache"]
+    for counter in ("hits", "misses", "evictions", "entries"):
+        assert counter in cache
@@ -0,0 +1,165 @@
+"""
+Tests for the in-process work queue in app/work_queue.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.work_queue import WorkQueue, percentile
+
+
+@pytest.fixture
+def processed():
+    return []
+
+
+def test_processes_every_item(processed):
+    work = WorkQueue(processed.append, workers=3, name="test")
+
+    for i in range(100):
+        assert work.submit(f"k{i % 7}", i)
+
+    assert work.join(timeout=2)
+    assert sorted(processed) == list(range(100))
+    assert work.stats()["processed"] == 100
+    work.stop(timeout=2)
+
+
+def test_same_key_keeps_order():
+    seen = {}
+
+    def handler(item):
+        key, i = item
+        seen.setdefault(key, []).append(i)
+
+    work = WorkQueue(handler, workers=4, name="test")
+    for i in range(200):
+        work.submit(f"k{i % 5}", (f"k{i % 5}", i))
+
+    assert work.join(timeout=2)
+    for key, items in seen.items():
+        assert items == sorted(items)
+    work.stop(timeout=2)
+
+
+def test_full_queue_rejects():
+    release = threading.Event()
+    work = WorkQueue(lambda item: release.wait(2), workers=1, maxsize=2, name="test")
+
+    results = [work.submit("k", i) for i in range(5)]
+
+    # One item in the worker, two waiting, the rest rejected
+    assert results.count(False) >= 2
+    assert work.stats()["rejected"] == results.count(False)
+
+    release.set()
+    assert work.join(timeout=2)
+    work.stop(timeout=2)
+
+
+def test_failing_job_is_counted_and_worker_survives(processed):
+    def handler(item):
+        if item == "boom":
+            raise ValueError("boom")
+        processed.append(item)
+
+    work = WorkQueue(handler, workers=1, name="test")
+    work.submit("k", "boom")
+    work.submit("k", "ok")
+
+    assert work.join(timeout=2)
+    assert processed == ["ok"]
+    assert work.stats()["failed"] == 1
+    work.stop(timeout=2)
+
+
+def test_stop_drains_then_restart(processed):
+    work = WorkQueue(processed.append, workers=2, name="test")
+    work.submit("a", 1)
+
+    assert work.stop(timeout=2)
+    assert processed == [1]
+    assert work.stats()["workers"] == 0
+
+    work.submit("a", 2)
+    assert work.join(timeout=2)
+    assert processed == [1, 2]
+    work.stop(timeout=2)
+
+
+def test_percentile():
+    assert percentile([], 0.99) == 0.0
+    assert percentile(list(range(1, 101)), 0.5) == 51
+    assert percentile(list(range(1, 101)), 0.99) == 100
+
+
+def test_other_senders_are_not_blocked_by_a_slow_one():
+    release = threading.Event()
+    done = []
+
+    def handler(item):
+        key, i = item
+        if key == "slow":
+            release.wait(2)
+        done.append(item)
+
+    work = WorkQueue(handler, workers=2, name="test")
+    work.submit("slow", ("slow", 0))
+    work.submit("slow", ("slow", 1))
+    for i in range(10):
+        work.submit("fast", ("fast", i))
+
+    # "fast" finishes on the other worker while "slow" is still stuck
+    deadline = time.monotonic() + 2
+    while len(done) < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert done == [("fast", i) for i in range(10)]
+
+    release.set()
+    assert work.join(timeout=2)
+    assert done[10:] == [("slow", 0), ("slow", 1)]
+    work.stop(timeout=2)
+
+
+def test_idle_mailboxes_are_reclaimed(processed):
+    work = WorkQueue(processed.append, workers=4, name="test")
+    for i in range(500):
+        work.submit(f"sender{i}", i)
+
+    assert work.join(timeout=2)
+    assert work.stats()["mailboxes"] == 0
+    work.stop(timeout=2)
+
+
+def test_thousand_senders_interleaved_keep_order_and_run_in_parallel():
+    """
+    1,000 senders x 3 messages, interleaved. Each message takes 2 ms, so
+    processing them one at a time would take 6 s; with 50 workers the
+    per-sender order must hold and the whole batch finish far sooner.
+    """
+    senders, per_sender, cost = 1000, 3, 0.002
+    seen = {}
+    seen_lock = threading.Lock()
+
+    def handler(item):
+        sender, i = item
+        time.sleep(cost)
+        with seen_lock:
+            seen.setdefault(sender, []).append(i)
+
+    work = WorkQueue(handler, workers=50, maxsize=0, name="test")
+    start = time.monotonic()
+    for i in range(per_sender):
+        for s in range(senders):
+            work.submit(f"549{s:07d}", (f"549{s:07d}", i))
+
+    assert work.join(timeout=30)
+    elapsed = time.monotonic() - start
+    work.stop(timeout=2)
+
+    assert len(seen) == senders
+    assert all(items == list(range(per_sender)) for items in seen.values())
+    serial = senders * per_sender * cost
+    assert elapsed < serial / 5, f"{elapsed:.2f}s vs {serial:.2f}s serial"